@@ -0,0 +1,605 @@
+"""
+loadtest.py — Load test / benchmark for the waste-classifier-eu API.
+
+Starts build_context/main.py locally on in-memory storage (serve.py),
+replays a mix of app traffic against it and writes one JSON report per run, so
+every performance change can be measured before it ships:
+
+  python loadtest.py run --weights ../build_context/weights/best.pt \\
+      --mix predict=70,feedback=15,community-feedback=5,pending-images=10 \\
+      --concurrency 8 --duration 60 --output before.json
+  python loadtest.py run ... --rate 20 --output after.json        # open loop, 20 req/s
+  python loadtest.py compare before.json after.json
+
+Traffic:
+  predict             POST /predict with a synthetic JPEG (--image-dir for real photos).
+                      Every request gets unique bytes (a JPEG comment segment) except a
+                      --repeat-ratio share that resends an earlier photo (cache hits).
+  feedback            POST /feedback for an image_id returned by an earlier /predict,
+                      location_verified with a seeded user, so points are awarded
+  community-feedback  POST /community-feedback for an image listed by /pending-images
+  pending-images      GET /pending-images
+  feedback falls back to a /predict until there are image_ids to send feedback for.
+
+Load:
+  --concurrency N     closed loop: N clients, each sending its next request as soon
+                      as the previous one returns (default)
+  --rate R            open loop: R requests/s on a fixed schedule regardless of how
+                      fast the server answers; latency is measured from the scheduled
+                      send time, so queueing in front of a saturated server is counted
+
+Report (JSON): p50/p95/p99/mean/max latency, throughput and error rate overall and
+per endpoint, status code counts, server startup time and peak RSS (sum over the
+gunicorn master and workers, sampled from /proc every 100 ms). The first
+--warmup seconds of traffic are sent but not counted.
+
+--url http://host:port targets an already running server instead (staging, or a
+server started by hand) — no RSS then, and nothing is seeded. Note that with
+GUNICORN_WORKERS > 1 each worker has its own in-memory storage, so feedback that
+lands on another worker than its /predict simply finds no pending image.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import signal
+import socket
+import platform
+import argparse
+import threading
+import subprocess
+import http.client
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from PIL import Image, ImageDraw
+
+HERE          = os.path.dirname(os.path.abspath(__file__))
+BUILD_CONTEXT = os.path.join(HERE, "..", "build_context")
+
+DEFAULT_MIX = "predict=70,feedback=15,community-feedback=5,pending-images=10"
+LABELS      = ["glass", "paper", "cardboard", "plastic", "metal", "trash"]
+ENDPOINTS   = {
+    "predict":            "/predict",
+    "feedback":           "/feedback",
+    "community-feedback": "/community-feedback",
+    "pending-images":     "/pending-images",
+}
+
+
+# ── Request bodies ────────────────────────────────────────────────────────────
+def synthetic_photos(count: int, seed: int) -> List[bytes]:
+    """Camera-sized JPEGs with a few coloured shapes on a noisy background."""
+    rng = random.Random(seed)
+    photos = []
+    for _ in range(count):
+        width, height = rng.choice([(1280, 960), (1024, 768), (960, 1280), (800, 600)])
+        img = Image.effect_noise((width, height), rng.uniform(20, 60)).convert("RGB")
+        draw = ImageDraw.Draw(img)
+        for _ in range(rng.randint(1, 4)):
+            x, y = rng.randint(0, width - 200), rng.randint(0, height - 200)
+            colour = tuple(rng.randint(0, 255) for _ in range(3))
+            draw.rectangle([x, y, x + rng.randint(80, 400), y + rng.randint(80, 400)], fill=colour)
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=85)
+        photos.append(buf.getvalue())
+    return photos
+
+
+def load_photos(image_dir: str) -> List[bytes]:
+    photos = []
+    for name in sorted(os.listdir(image_dir)):
+        if name.lower().endswith((".jpg", ".jpeg", ".png")):
+            with open(os.path.join(image_dir, name), "rb") as f:
+                photos.append(f.read())
+    if not photos:
+        raise SystemExit(f"No .jpg/.png files in {image_dir}")
+    return photos
+
+
+def unique_variant(jpeg_bytes: bytes) -> bytes:
+    """Same image, different bytes: a COM segment after SOI defeats the content-hash cache only."""
+    if not jpeg_bytes.startswith(b"\xff\xd8"):
+        return jpeg_bytes
+    comment = uuid.uuid4().hex.encode("ascii")
+    return jpeg_bytes[:2] + b"\xff\xfe" + (len(comment) + 2).to_bytes(2, "big") + comment + jpeg_bytes[2:]
+
+
+def multipart(field: str, filename: str, data: bytes) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\n"
+            f"Content-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n").encode("ascii") + data + f"\r\n--{boundary}--\r\n".encode("ascii")
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Unknown traffic type '{name}' (expected one of {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise SystemExit("--mix needs at least one traffic type with a positive weight")
+    return mix
+
+
+# ── Traffic ───────────────────────────────────────────────────────────────────
+class Traffic:
+    """Builds and sends one request of a given kind; keeps the image_ids later requests refer to."""
+
+    def __init__(self, base_url: str, photos: List[bytes], repeat_ratio: float, users: int, seed: int):
+        url = urlparse(base_url)
+        self.host, self.port = url.hostname, url.port or (443 if url.scheme == "https" else 80)
+        self.https          = url.scheme == "https"
+        self.photos         = photos
+        self.repeat_ratio   = repeat_ratio
+        self.users          = max(1, users)
+        self._rng           = random.Random(seed)
+        self._lock          = threading.Lock()
+        self._sent: deque   = deque(maxlen=256)   # photos already sent, for repeats
+        self._predicted: deque = deque(maxlen=1024)  # (image_id, detections) awaiting feedback
+        self._pending: deque = deque(maxlen=256)  # image_ids listed by /pending-images
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = self._local.conn = cls(self.host, self.port, timeout=120)
+        return conn
+
+    def _request(self, method: str, path: str, body: Optional[bytes] = None,
+                 headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError, socket.timeout):
+                conn.close()
+                self._local.conn = None
+                # A kept-alive connection the server already closed — retry once on a fresh one
+                if attempt == 2:
+                    raise
+        return 0, b""
+
+    def _json(self, method: str, path: str, payload: Dict[str, Any]) -> Tuple[int, bytes]:
+        return self._request(method, path, json.dumps(payload).encode("utf-8"),
+                             {"Content-Type": "application/json"})
+
+    def send(self, kind: str) -> Tuple[str, int]:
+        """Send one request; returns (endpoint actually hit, HTTP status)."""
+        if kind == "feedback":
+            with self._lock:
+                item = self._predicted.popleft() if self._predicted else None
+            if item is None:
+                kind = "predict"
+            else:
+                return ENDPOINTS[kind], self._feedback(*item)
+        if kind == "community-feedback":
+            with self._lock:
+                image_id = self._pending.popleft() if self._pending else None
+            if image_id is None:
+                return ENDPOINTS["pending-images"], self._pending_images()
+            return ENDPOINTS[kind], self._community_feedback(image_id)
+        if kind == "pending-images":
+            return ENDPOINTS[kind], self._pending_images()
+        return ENDPOINTS["predict"], self._predict()
+
+    def _predict(self) -> int:
+        with self._lock:
+            repeat = self._sent and self._rng.random() < self.repeat_ratio
+            photo = self._rng.choice(self._sent) if repeat else unique_variant(self._rng.choice(self.photos))
+            if not repeat:
+                self._sent.append(photo)
+        body, content_type = multipart("file", "scan.jpg", photo)
+        status, data = self._request("POST", "/predict", body, {"Content-Type": content_type})
+        if status == 200:
+            result = json.loads(data)
+            with self._lock:
+                self._predicted.append((result.get("image_id"), result.get("detections") or []))
+        return status
+
+    def _feedback(self, image_id: str, detections: List[Dict[str, Any]]) -> int:
+        items = [{
+            "detectionId":   d.get("id"),
+            "originalLabel": d.get("label"),
+            "status":        "correct",
+            "box_2d":        d.get("box_2d"),
+        } for d in detections] or [{
+            "originalLabel": self._rng.choice(LABELS), "status": "correct", "box_2d": [0.5, 0.5, 0.3, 0.3],
+        }]
+        status, _ = self._json("POST", "/feedback", {
+            "image_id":          image_id,
+            "feedback":          items,
+            "user_id":           f"bench-user-{self._rng.randrange(self.users)}",
+            "location_verified": True,
+        })
+        return status
+
+    def _pending_images(self) -> int:
+        status, data = self._request("GET", "/pending-images")
+        if status == 200:
+            ids = [item["image_id"] for item in json.loads(data).get("pending_images", [])]
+            with self._lock:
+                known = set(self._pending)
+                self._pending.extend(i for i in ids if i not in known)
+        return status
+
+    def _community_feedback(self, image_id: str) -> int:
+        status, _ = self._json("POST", "/community-feedback", {
+            "image_id": image_id,
+            "user_id":  f"bench-user-{self._rng.randrange(self.users)}",
+            "boxes":    [{"label": self._rng.choice(LABELS), "box": [0.5, 0.5, 0.4, 0.4]}],
+        })
+        return status
+
+
+# ── Server process ────────────────────────────────────────────────────────────
+def _children(pid: int) -> List[int]:
+    """pid and all of its descendants (Linux /proc)."""
+    parents: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat", "r") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+                parents.setdefault(ppid, []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    found, todo = [], [pid]
+    while todo:
+        current = todo.pop()
+        found.append(current)
+        todo.extend(parents.get(current, []))
+    return found
+
+
+def _rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class RssSampler:
+    """Peak of the summed RSS of a process tree, sampled in the background."""
+
+    def __init__(self, pid: int, interval_s: float = 0.1):
+        self.pid        = pid
+        self.interval_s = interval_s
+        self.peak_kb    = 0
+        self.processes  = 0
+        self._stop      = threading.Event()
+        self._thread    = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    @staticmethod
+    def supported() -> bool:
+        return os.path.isdir("/proc/self")
+
+    def start(self) -> "RssSampler":
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            pids = _children(self.pid)
+            total = sum(_rss_kb(pid) for pid in pids)
+            if total > self.peak_kb:
+                self.peak_kb, self.processes = total, len(pids)
+            self._stop.wait(self.interval_s)
+
+    def stop(self) -> Optional[float]:
+        self._stop.set()
+        self._thread.join()
+        return round(self.peak_kb / 1024.0, 1) if self.peak_kb else None
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args: argparse.Namespace) -> Tuple[subprocess.Popen, str, float]:
+    port = args.port or _free_port()
+    env = dict(os.environ, PYTHONUNBUFFERED="1", STORAGE_MEMORY_LATENCY_MS=str(args.backend_latency_ms))
+    if args.workers:
+        env["GUNICORN_WORKERS"] = str(args.workers)
+    if args.threads:
+        env["GUNICORN_THREADS"] = str(args.threads)
+    if args.api_server:
+        env["API_SERVER"] = args.api_server
+    cmd = [sys.executable, os.path.join(HERE, "serve.py"), "--port", str(port),
+           "--server", args.server, "--users", str(args.users), "--storage", args.storage]
+    if args.weights:
+        cmd += ["--weights", os.path.abspath(args.weights)]
+
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, env=env, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    base_url = f"http://127.0.0.1:{port}"
+
+    # /health is 503 until startup and model warmup finish
+    deadline = started + args.startup_timeout
+    while time.perf_counter() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"Server exited with code {proc.returncode} during startup"
+                             + (f" — see {args.server_log}" if args.server_log else " (use --server-log)"))
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/health")
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            if response.status == 200:
+                return proc, base_url, round(time.perf_counter() - started, 2)
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.25)
+    stop_server(proc)
+    raise SystemExit(f"Server not ready after {args.startup_timeout}s")
+
+
+def stop_server(proc: subprocess.Popen) -> None:
+    if proc.poll() is not None:
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)  # gunicorn drains its workers on SIGTERM, like Cloud Run
+        proc.wait(timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+
+
+# ── Load generation ───────────────────────────────────────────────────────────
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: List[Tuple[str, int, float, float]] = []  # (endpoint, status, finished_at, latency_s)
+
+    def record(self, endpoint: str, status: int, finished_at: float, latency_s: float) -> None:
+        with self._lock:
+            self.samples.append((endpoint, status, finished_at, latency_s))
+
+
+def _timed(traffic: Traffic, recorder: Recorder, kind: str, sent_at: float) -> None:
+    try:
+        endpoint, status = traffic.send(kind)
+    except Exception:
+        endpoint, status = ENDPOINTS[kind], 0  # connection error / timeout
+    now = time.perf_counter()
+    recorder.record(endpoint, status, now, now - sent_at)
+
+
+def run_closed_loop(traffic: Traffic, recorder: Recorder, kinds: List[str], weights: List[float],
+                    concurrency: int, stop_at: float, seed: int) -> None:
+    def client(index: int) -> None:
+        rng = random.Random(seed + index)
+        while time.perf_counter() < stop_at:
+            _timed(traffic, recorder, rng.choices(kinds, weights)[0], time.perf_counter())
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def run_open_loop(traffic: Traffic, recorder: Recorder, kinds: List[str], weights: List[float],
+                  rate: float, max_inflight: int, stop_at: float, seed: int) -> None:
+    rng = random.Random(seed)
+    interval = 1.0 / rate
+    next_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="load") as pool:
+        while next_at < stop_at:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(_timed, traffic, recorder, rng.choices(kinds, weights)[0], next_at)
+            next_at += interval
+
+
+# ── Report ────────────────────────────────────────────────────────────────────
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(samples: List[Tuple[str, int, float, float]], seconds: float) -> Dict[str, Any]:
+    latencies = sorted(latency * 1000.0 for _, _, _, latency in samples)
+    errors = sum(1 for _, status, _, _ in samples if status == 0 or status >= 500)
+    count = len(samples)
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value, 2) if value is not None else None
+
+    return {
+        "requests":       count,
+        "errors":         errors,
+        "error_rate":     round(errors / count, 4) if count else 0.0,
+        "throughput_rps": round(count / seconds, 2) if seconds > 0 else 0.0,
+        "latency_ms": {
+            "p50":  ms(percentile(latencies, 50)),
+            "p95":  ms(percentile(latencies, 95)),
+            "p99":  ms(percentile(latencies, 99)),
+            "mean": ms(sum(latencies) / count) if count else None,
+            "max":  ms(latencies[-1]) if latencies else None,
+        },
+        "status_codes": dict(sorted(Counter(str(status) for _, status, _, _ in samples).items())),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    mix = parse_mix(args.mix)
+    kinds, weights = list(mix), list(mix.values())
+    photos = load_photos(args.image_dir) if args.image_dir else synthetic_photos(args.photos, args.seed)
+
+    proc, sampler, startup_seconds = None, None, None
+    base_url = args.url
+    if not base_url:
+        proc, base_url, startup_seconds = start_server(args)
+        print(f"🚀 Server ready at {base_url} in {startup_seconds}s", file=sys.stderr)
+        if RssSampler.supported():
+            sampler = RssSampler(proc.pid).start()
+
+    traffic = Traffic(base_url, photos, args.repeat_ratio, args.users, args.seed)
+    recorder = Recorder()
+    started = time.perf_counter()
+    measure_from = started + args.warmup
+    stop_at = measure_from + args.duration
+    mode = f"rate {args.rate}/s" if args.rate else f"concurrency {args.concurrency}"
+    print(f"📈 {args.warmup}s warmup + {args.duration}s at {mode}, mix {mix}", file=sys.stderr)
+    try:
+        if args.rate:
+            run_open_loop(traffic, recorder, kinds, weights, args.rate, args.max_inflight, stop_at, args.seed)
+        else:
+            run_closed_loop(traffic, recorder, kinds, weights, args.concurrency, stop_at, args.seed)
+    finally:
+        peak_rss_mb = sampler.stop() if sampler else None
+        if proc is not None:
+            stop_server(proc)
+
+    # Count requests that finished inside the measurement window
+    measured = [s for s in recorder.samples if measure_from <= s[2] <= stop_at]
+    window = min(stop_at, max((s[2] for s in measured), default=stop_at)) - measure_from
+    by_endpoint: Dict[str, List[Tuple[str, int, float, float]]] = {}
+    for sample in measured:
+        by_endpoint.setdefault(sample[0], []).append(sample)
+
+    return {
+        "run": {
+            "started_at":   datetime.now(timezone.utc).isoformat(),
+            "git_commit":   _git_commit(),
+            "python":       platform.python_version(),
+            "cpus":         os.cpu_count(),
+            "target":       args.url or "local",
+            "server":       None if args.url else args.server,
+            "api_server":   None if args.url else (args.api_server or os.getenv("API_SERVER", "flask")),
+            "workers":      None if args.url else (args.workers or int(os.getenv("GUNICORN_WORKERS", "1"))),
+            "threads":      None if args.url else (args.threads or int(os.getenv("GUNICORN_THREADS", "8"))),
+        },
+        "config": {
+            "mode":               "open" if args.rate else "closed",
+            "rate":               args.rate,
+            "concurrency":        None if args.rate else args.concurrency,
+            "duration_s":         args.duration,
+            "warmup_s":           args.warmup,
+            "mix":                mix,
+            "photos":             len(photos),
+            "repeat_ratio":       args.repeat_ratio,
+            "backend_latency_ms": args.backend_latency_ms,
+            "storage":            None if args.url else args.storage,
+            "seed":               args.seed,
+        },
+        "startup_seconds": startup_seconds,
+        "peak_rss_mb":     peak_rss_mb,
+        "summary":         summarize(measured, window),
+        "endpoints":       {endpoint: summarize(samples, window) for endpoint, samples in sorted(by_endpoint.items())},
+    }
+
+
+# ── Compare ───────────────────────────────────────────────────────────────────
+def _delta(before: Optional[float], after: Optional[float]) -> Dict[str, Any]:
+    change = None
+    if before not in (None, 0) and after is not None:
+        change = round(100.0 * (after - before) / before, 1)
+    return {"before": before, "after": after, "change_pct": change}
+
+
+def compare(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    """Side-by-side of two reports: overall and per-endpoint latency, throughput, errors, peak RSS."""
+    def section(b: Dict[str, Any], a: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "throughput_rps": _delta(b.get("throughput_rps"), a.get("throughput_rps")),
+            "error_rate":     _delta(b.get("error_rate"), a.get("error_rate")),
+            **{f"{p}_ms": _delta(b.get("latency_ms", {}).get(p), a.get("latency_ms", {}).get(p))
+               for p in ("p50", "p95", "p99")},
+        }
+
+    endpoints = sorted(set(before.get("endpoints", {})) | set(after.get("endpoints", {})))
+    return {
+        "before":          before.get("run", {}).get("git_commit"),
+        "after":           after.get("run", {}).get("git_commit"),
+        "peak_rss_mb":     _delta(before.get("peak_rss_mb"), after.get("peak_rss_mb")),
+        "startup_seconds": _delta(before.get("startup_seconds"), after.get("startup_seconds")),
+        "summary":         section(before.get("summary", {}), after.get("summary", {})),
+        "endpoints":       {e: section(before.get("endpoints", {}).get(e, {}), after.get("endpoints", {}).get(e, {}))
+                            for e in endpoints},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the waste-classifier-eu API")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    r = sub.add_parser("run", help="Start the service (or use --url), replay traffic, write a JSON report")
+    r.add_argument("--url", type=str, default=None, help="Target a running server instead of starting one")
+    r.add_argument("--weights", type=str, default=None, help="Model weights for the local server")
+    r.add_argument("--mix", type=str, default=DEFAULT_MIX, help=f"Traffic weights (default: {DEFAULT_MIX})")
+    r.add_argument("--concurrency", type=int, default=8, help="Closed-loop clients (ignored with --rate)")
+    r.add_argument("--rate", type=float, default=None, help="Open-loop target requests per second")
+    r.add_argument("--max-inflight", type=int, default=256, help="Open-loop cap on outstanding requests")
+    r.add_argument("--duration", type=float, default=60.0, help="Measured seconds")
+    r.add_argument("--warmup", type=float, default=5.0, help="Seconds of traffic before measuring")
+    r.add_argument("--image-dir", type=str, default=None, help="Photos to send (default: synthetic)")
+    r.add_argument("--photos", type=int, default=32, help="Synthetic photos to generate")
+    r.add_argument("--repeat-ratio", type=float, default=0.1, help="Share of /predict resending an earlier photo")
+    r.add_argument("--users", type=int, default=100, help="Seeded Firestore users feedback is attributed to")
+    r.add_argument("--backend-latency-ms", type=float, default=0.0,
+                   help="Delay added to every in-memory storage/document call")
+    r.add_argument("--storage", choices=["memory", "local"], default="memory", help="STORAGE_BACKEND of the local server")
+    r.add_argument("--server", choices=["gunicorn", "flask-dev"], default="gunicorn")
+    r.add_argument("--api-server", choices=["flask", "asgi"], default=None, help="API_SERVER for gunicorn")
+    r.add_argument("--workers", type=int, default=None, help="GUNICORN_WORKERS")
+    r.add_argument("--threads", type=int, default=None, help="GUNICORN_THREADS")
+    r.add_argument("--port", type=int, default=None, help="Local server port (default: a free one)")
+    r.add_argument("--startup-timeout", type=float, default=180.0)
+    r.add_argument("--server-log", type=str, default=None, help="Write the server's output to this file")
+    r.add_argument("--seed", type=int, default=1)
+    r.add_argument("--output", type=str, default=None, help="Write the report here (always printed to stdout)")
+
+    c = sub.add_parser("compare", help="Compare two reports")
+    c.add_argument("before")
+    c.add_argument("after")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        with open(args.before) as f_before, open(args.after) as f_after:
+            result = compare(json.load(f_before), json.load(f_after))
+    else:
+        result = run(args)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
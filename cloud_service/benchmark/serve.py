@@ -0,0 +1,99 @@
+"""
+serve.py — Run the production service locally on in-memory (or local-disk) storage.
+
+Started by loadtest.py (one subprocess per run), but usable on its own for
+poking at the API without touching the real bucket:
+
+  python serve.py --weights ../build_context/weights/best.pt --port 8080
+
+It stages build_context/ in a temp directory the way the Docker build does (with
+shared/*.json copied in), selects STORAGE_BACKEND=memory (or --storage local, see
+storage_backends.py), seeds the bucket with the given weights as
+models/best_latest.pt (so the normal GCS-first weight resolution runs) and the
+Firestore users feedback is attributed to, then serves it exactly as the
+container does:
+gunicorn with gunicorn.conf.py (preload, worker budget, API_SERVER=flask|asgi),
+or Flask's threaded dev server with --server flask-dev where gunicorn isn't
+available (e.g. Windows).
+"""
+
+import os
+import sys
+import glob
+import atexit
+import shutil
+import argparse
+import tempfile
+
+HERE          = os.path.dirname(os.path.abspath(__file__))
+BUILD_CONTEXT = os.path.join(HERE, "..", "build_context")
+SHARED        = os.path.join(HERE, "..", "..", "shared")
+
+
+def stage_build_context() -> str:
+    """Copy of build_context/ with shared/ filled in, as in the image (see build_local.ps1)."""
+    app_dir = os.path.join(tempfile.mkdtemp(prefix="bench-"), "app")
+    shutil.copytree(BUILD_CONTEXT, app_dir, ignore=shutil.ignore_patterns("__pycache__", "serviceAccountKey.json"))
+    for path in glob.glob(os.path.join(SHARED, "*.json")):
+        shutil.copy(path, os.path.join(app_dir, "shared"))
+    owner = os.getpid()
+
+    def cleanup() -> None:
+        # gunicorn workers inherit this handler — only the process that staged the copy removes it
+        if os.getpid() == owner:
+            shutil.rmtree(os.path.dirname(app_dir), ignore_errors=True)
+
+    atexit.register(cleanup)
+    return app_dir
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve build_context/main.py on in-memory or local storage")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8080")))
+    parser.add_argument("--weights", type=str, default=None,
+                        help="Model weights seeded as models/best_latest.pt (default: build_context/weights/best.pt)")
+    parser.add_argument("--server", choices=["gunicorn", "flask-dev"], default="gunicorn")
+    parser.add_argument("--users", type=int, default=100, help="Firestore users/bench-user-{i} docs to seed")
+    parser.add_argument("--storage", choices=["memory", "local"], default="memory",
+                        help="STORAGE_BACKEND (local keeps everything under STORAGE_LOCAL_DIR)")
+    args = parser.parse_args()
+
+    # Read by storage_backends at import time
+    os.environ["STORAGE_BACKEND"] = args.storage
+    os.environ["PORT"] = str(args.port)
+    os.environ.setdefault("ADMIN_TOKEN", "bench")
+    os.environ.setdefault("MODEL_POLL_INTERVAL_S", "0")
+
+    os.chdir(stage_build_context())
+    sys.path.insert(0, os.getcwd())
+
+    from storage_backends import document_store, object_store
+    store = object_store(os.getenv("STORAGE_BUCKET", "retrain_smart_waste_model"))
+    docs = document_store()
+    if args.weights:
+        with open(args.weights, "rb") as f:
+            store.write("models/best_latest.pt", f.read())
+    for i in range(args.users):
+        docs.set(f"users/bench-user-{i}", {"points": 0})
+
+    def report() -> None:
+        counts = {}
+        for info in store.list():
+            prefix = info.name.split("/", 1)[0]
+            counts[prefix] = counts.get(prefix, 0) + 1
+        print(f"📦 Storage of {os.getpid()} at exit: {counts}", flush=True)
+
+    atexit.register(report)
+
+    if args.server == "flask-dev":
+        import main as service
+        service.app.run(host="127.0.0.1", port=args.port, threaded=True)
+        return
+
+    from gunicorn.app.wsgiapp import run
+    sys.argv = ["gunicorn", "--config", "gunicorn.conf.py", "--bind", f"127.0.0.1:{args.port}"]
+    run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+annotated_renderer.py — Lightweight, cached rendering of annotated prediction images.
+
+/predict used to call r.plot() on the full-resolution photo for every request,
+re-encode it as a JPEG and base64 it into the JSON body, even though the app only
+needs detections[].box_2d to draw its own SVG overlay. The annotated image is now:
+  - opt-in on /predict (annotate=1), and
+  - served on demand by GET /render/<image_id> as a plain image/jpeg.
+
+Both paths use render_boxes(), which draws the boxes with PIL.ImageDraw on a copy
+downscaled to RENDER_MAX_SIDE pixels — far cheaper than ultralytics' plotter at 12MP.
+
+RenderCache keeps two size-bounded LRU maps keyed by image_id:
+  sources  — the raw upload bytes + detections of recent predictions (no CPU cost
+             on /predict; decoding only happens if a render is actually requested)
+  rendered — finished JPEGs, so repeated /render calls are a dictionary lookup
+"""
+
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageDraw
+
+from image_decode import decode_image
+
+RENDER_MAX_SIDE        = int(os.getenv("RENDER_MAX_SIDE", "800"))
+RENDER_JPEG_QUALITY    = int(os.getenv("RENDER_JPEG_QUALITY", "80"))
+RENDER_CACHE_MB        = float(os.getenv("RENDER_CACHE_MB", "32"))
+RENDER_SOURCE_CACHE_MB = float(os.getenv("RENDER_SOURCE_CACHE_MB", "64"))
+
+# Box colours per class (RGB) — anything not listed is drawn in white
+LABEL_COLORS = {
+    "glass":     (46, 204, 113),
+    "paper":     (52, 152, 219),
+    "cardboard": (230, 126, 34),
+    "plastic":   (241, 196, 15),
+    "metal":     (155, 89, 182),
+    "trash":     (231, 76, 60),
+}
+
+
+def render_boxes(img: Image.Image, detections: List[Dict[str, Any]],
+                 max_side: int = RENDER_MAX_SIDE, quality: int = RENDER_JPEG_QUALITY) -> bytes:
+    """Draw detection boxes (normalized box_2d) on a downscaled copy of img and return JPEG bytes."""
+    canvas = img.convert('RGB')  # always a copy, even for RGB input
+    canvas.thumbnail((max_side, max_side))
+    width, height = canvas.size
+    draw  = ImageDraw.Draw(canvas)
+    line  = max(2, round(max(width, height) / 300))
+
+    for det in detections:
+        xc, yc, w, h = det["box_2d"]
+        x1, y1 = (xc - w / 2) * width, (yc - h / 2) * height
+        x2, y2 = (xc + w / 2) * width, (yc + h / 2) * height
+        color  = LABEL_COLORS.get(det["label"], (255, 255, 255))
+        draw.rectangle([x1, y1, x2, y2], outline=color, width=line)
+
+        caption = f"{det['label']} {det['confidence']:.2f}"
+        tx1, ty1, tx2, ty2 = draw.textbbox((x1, y1), caption)
+        ty_shift = (ty2 - ty1) + 2 * line if y1 - (ty2 - ty1) - 2 * line >= 0 else 0
+        draw.rectangle([tx1, ty1 - ty_shift, tx2 + 2 * line, ty2 - ty_shift + line], fill=color)
+        draw.text((x1 + line, y1 - ty_shift), caption, fill=(0, 0, 0))
+
+    buffer = io.BytesIO()
+    canvas.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+class _ByteLRU:
+    """OrderedDict LRU evicted by total payload size rather than entry count."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size      = 0
+        self._items: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        self._items.move_to_end(key)
+        return item[0]
+
+    def put(self, key: str, value: Any, nbytes: int) -> None:
+        if nbytes > self.max_bytes:
+            return
+        self.pop(key)
+        self._items[key] = (value, nbytes)
+        self.size += nbytes
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self._items.popitem(last=False)
+            self.size -= evicted
+
+    def pop(self, key: str) -> None:
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.size -= item[1]
+
+
+class RenderCache:
+    """Recent prediction sources and finished renders, keyed by image_id."""
+
+    def __init__(self, source_mb: float = RENDER_SOURCE_CACHE_MB, rendered_mb: float = RENDER_CACHE_MB):
+        self._lock     = threading.Lock()
+        self._sources  = _ByteLRU(int(source_mb * 1024 * 1024))
+        self._rendered = _ByteLRU(int(rendered_mb * 1024 * 1024))
+
+    def remember(self, image_id: str, image_bytes: bytes, detections: List[Dict[str, Any]]) -> None:
+        """Keep the upload and its detections so /render can draw them later without re-running inference."""
+        with self._lock:
+            self._sources.put(image_id, (image_bytes, detections), len(image_bytes))
+
+    def store_rendered(self, image_id: str, jpeg_bytes: bytes) -> None:
+        with self._lock:
+            self._rendered.put(image_id, jpeg_bytes, len(jpeg_bytes))
+
+    def forget(self, image_id: str) -> None:
+        with self._lock:
+            self._sources.pop(image_id)
+            self._rendered.pop(image_id)
+
+    def render(self, image_id: str,
+               load_source: Callable[[], Optional[Tuple[bytes, List[Dict[str, Any]]]]]) -> Optional[bytes]:
+        """
+        Return the annotated JPEG for image_id, rendering it if needed.
+        load_source() is only called when the source isn't cached locally (e.g. the
+        prediction ran on another instance); it returns (image_bytes, detections) or None.
+        """
+        with self._lock:
+            jpeg   = self._rendered.get(image_id)
+            source = self._sources.get(image_id)
+        if jpeg is not None:
+            return jpeg
+
+        if source is None:
+            source = load_source()
+            if source is None:
+                return None
+
+        # Same decode as inference (scaled + EXIF-oriented), so box_2d lines up with the pixels
+        image_bytes, detections = source
+        jpeg = render_boxes(decode_image(image_bytes, RENDER_MAX_SIDE), detections)
+        self.store_rendered(image_id, jpeg)
+        return jpeg
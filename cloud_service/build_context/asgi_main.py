@@ -0,0 +1,690 @@
+"""
+asgi_main.py — Async (ASGI) entry point for the waste-classifier-eu API.
+
+Same routes, same request formats and same response schemas as main.py (the
+Flask app), but served from an asyncio event loop. In main.py every GCS and
+Firestore round trip holds one of the worker's --threads while a slow mobile
+client waits; here a request only occupies the loop while it is doing work:
+
+  - Inference runs on a dedicated executor (INFERENCE_WORKERS threads) that feeds
+    the micro-batching scheduler in prediction_service.py, so batches still fill.
+  - GCS / Firestore calls (the client libraries are blocking) run on a separate
+    I/O executor (ASYNC_IO_WORKERS threads) and independent calls are awaited
+    together with asyncio.gather — e.g. /feedback moves the image, uploads the
+    label and awards points concurrently (the metadata doc goes to the
+    write-behind buffer, see write_behind.py).
+
+Startup, the model, the upload queue, all caches and the route logic live in
+service_core.py, which main.py imports too — importing it runs the same
+StartupOrchestrator (or, with preload, the same gunicorn master/worker split).
+This module only parses requests and builds responses. Run it with:
+
+    API_SERVER=asgi gunicorn --config gunicorn.conf.py      (uvicorn workers)
+    uvicorn asgi_main:app --port 8080                        (local development)
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from starlette.applications import Starlette
+from starlette.datastructures import UploadFile
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from response_codecs import UnsupportedFormat, encode, negotiate
+from service_metrics import (METRICS, CONTENT_TYPE as METRICS_CONTENT_TYPE, HTTP_REQUEST_SECONDS, IN_FLIGHT,
+                             PREDICT_STAGE_SECONDS, observe_stage, track_call)
+from request_tracing import annotate_trace, current_trace_id, end_trace, find_traces, incoming_trace_id, start_trace
+
+from prediction_cache import content_hash
+from model_registry import UnknownModelVersion
+from worker_budget import memory_report
+from pending_feed import InvalidPageToken, parse_page_size
+from sampling_profiler import parse_profile_seconds
+from shared_config import CONFIG
+from service_core import (ADMIN_TOKEN, FEEDBACK_LOG, FEEDBACK_MISSING_WAIT_S, PENDING, PREDICTIONS,
+                          PREDICT_BATCH_MAX_IMAGES, PROFILER, RELOADER, RENDERS, REVIEW_QUEUE, SIGNED_URLS,
+                          STARTUP, STORE, UPLOADS, award_points, backfill_review_queue, cached_result,
+                          claim_pending, community_label_lines, feedback_label_lines, feedback_points,
+                          load_name_to_index, load_pending_for_render, move_to_training, parse_reviewer_id,
+                          pending_image_entry, predict_many, prediction_service, remove_pending_image,
+                          review_request, take_for_review)
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(2 * int(os.getenv("PREDICT_MAX_BATCH", "8")))))
+ASYNC_IO_WORKERS  = int(os.getenv("ASYNC_IO_WORKERS", "32"))
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executors_pid = None
+
+
+def _executor(name: str) -> ThreadPoolExecutor:
+    # Created lazily (and re-created after a fork) so the threads belong to the
+    # process that is serving requests
+    global _executors_pid
+    if _executors_pid != os.getpid():
+        _executors.clear()
+        _executors_pid = os.getpid()
+    if name not in _executors:
+        size = INFERENCE_WORKERS if name == "inference" else ASYNC_IO_WORKERS
+        _executors[name] = ThreadPoolExecutor(max_workers=max(1, size), thread_name_prefix=f"asgi-{name}")
+    return _executors[name]
+
+
+def _in_context(fn: Callable[..., Any], *args, **kwargs) -> Callable[[], Any]:
+    """fn bound to the caller's contextvars (the request trace), for run_in_executor."""
+    return partial(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+async def _io(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking GCS / Firestore call on the I/O executor."""
+    return await asyncio.get_running_loop().run_in_executor(_executor("io"), _in_context(fn, *args, **kwargs))
+
+
+async def _tracked(service: str, op: str, route: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """_io() for a GCS / Firestore call that is recorded in backend_call_seconds."""
+    return await _io(track_call, service, op, route, fn, *args, **kwargs)
+
+
+async def _infer(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run decode + inference (+ rendering) on the inference executor."""
+    return await asyncio.get_running_loop().run_in_executor(_executor("inference"), _in_context(fn, *args, **kwargs))
+
+
+def _flag(request: Request, name: str, form: Optional[Any] = None) -> bool:
+    """Boolean request flag from the query string or multipart form ("1", "true", "yes")."""
+    value = request.query_params.get(name) or (form.get(name) if form is not None else None) or ''
+    return str(value).strip().lower() in ('1', 'true', 'yes')
+
+
+def _is_admin(request: Request) -> bool:
+    return bool(ADMIN_TOKEN) and request.headers.get('X-Admin-Token') == ADMIN_TOKEN
+
+
+def _error(message: str, status: int) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status)
+
+
+def _response_format(request: Request) -> str:
+    """Media type negotiated from ?format= or the Accept header (raises UnsupportedFormat)."""
+    return negotiate(request.headers.get('Accept'), request.query_params.get('format'))
+
+
+def _prediction_response(payload: Dict[str, Any], media_type: str) -> Response:
+    """A /predict or /predict/batch payload serialized as media_type (see response_codecs.py)."""
+    start = time.perf_counter()
+    body, content_type = encode({**payload, "trace_id": current_trace_id()}, media_type)
+    observe_stage("serialize", time.perf_counter() - start)
+    return Response(body, media_type=content_type, headers={'Vary': 'Accept'})
+
+
+class _RequestTracing:
+    """
+    Pure ASGI middleware: starts the request trace, adds X-Trace-Id and records the
+    response.write span up to the last body chunk (BaseHTTPMiddleware can't see that).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request = Request(scope)
+        trace = start_trace(f"{scope['method']} {scope['path']}", incoming_trace_id(request.headers))
+        state = {"status": 500, "write_start": None}
+
+        async def send_traced(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                state["write_start"] = time.perf_counter()
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-trace-id", trace.trace_id.encode("ascii"))]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                trace.add_span("response.write", state["write_start"] or time.perf_counter(), time.perf_counter())
+
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            route = _ROUTE_PATHS.get(scope.get("endpoint"), "unmatched")
+            end_trace(trace, keep=route not in ('/health', '/metrics'), route=route, status=state["status"])
+
+
+class _RequestMetrics(BaseHTTPMiddleware):
+    """In-flight gauge and http_request_duration_seconds, labelled by route template."""
+
+    async def dispatch(self, request: Request, call_next):
+        start = time.perf_counter()
+        IN_FLIGHT.inc()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            IN_FLIGHT.dec()
+            route = _ROUTE_PATHS.get(request.scope.get("endpoint"), "unmatched")
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                         route=route, method=request.method, status=status)
+
+
+class _ReadinessGate(BaseHTTPMiddleware):
+    """Hold early requests until startup finishes; /health and /metrics answer immediately."""
+
+    async def dispatch(self, request: Request, call_next):
+        if request.url.path not in ('/health', '/metrics') and not STARTUP.is_ready():
+            ready = await asyncio.get_running_loop().run_in_executor(None, STARTUP.wait)
+            if not ready:
+                return _error("Service is starting, please retry", 503)
+        return await call_next(request)
+
+
+# ── /feedback ─────────────────────────────────────────────────────────────────
+async def save_feedback(request: Request) -> JSONResponse:
+    try:
+        data = await request.json()
+        image_id = data.get('image_id')
+        feedback_items = data.get('feedback', [])
+        user_id = data.get('user_id')
+        location_verified = data.get('location_verified', False)
+
+        if not image_id:
+            return _error("Missing image_id", 400)
+        annotate_trace(image_id=image_id)
+        print(f"🔍 RECEIVED FEEDBACK: {feedback_items}")
+        print(f"📍 Location Verified: {location_verified}")
+
+        try:
+            name_to_index = load_name_to_index()
+        except Exception as e:
+            print(f"⚠️ Could not load class_map.json: {e}")
+            name_to_index = {}
+
+        label_lines = feedback_label_lines(feedback_items, name_to_index)
+        if not label_lines:
+            print(f"ℹ️ No valid labels to save for image {image_id}")
+            return JSONResponse({
+                "success": True,
+                "message": "No valid feedback to save",
+                "points_added": 0,
+                "location_verified": location_verified
+            })
+
+        # The image first — a label without its image would corrupt the training set
+        if await _io(move_to_training, "/feedback", image_id, FEEDBACK_MISSING_WAIT_S) == "missing":
+            return _error("Image upload has not finished yet — please try again", 409)
+
+        training_image_path = f"training_data/images/{image_id}.jpg"
+        label_path = f"training_data/labels/{image_id}.txt"
+
+        async def upload_label():
+            await _tracked("gcs", "upload", "/feedback", STORE.write, label_path,
+                           "\n".join(label_lines), content_type='text/plain')
+            print(f"✅ Saved label file: {label_path}")
+
+        async def save_metadata():
+            # Buffered and committed in batches (service_core.FEEDBACK_LOG); only a full buffer writes inline
+            await _io(FEEDBACK_LOG.add, 'feedback', {
+                "image_id": image_id,
+                "image_path": training_image_path,
+                "label_path": label_path,
+                "created_at": datetime.utcnow(),
+                "raw_feedback": feedback_items,
+                "location_verified": location_verified,
+                "trace_id": current_trace_id()
+            }, route="/feedback")
+
+        async def add_points() -> int:
+            if not (location_verified and user_id):
+                print(f"ℹ️ No points awarded - Location verified: {location_verified}, User ID present: {bool(user_id)}")
+                return 0
+            points_added = feedback_points(feedback_items)
+            await _io(award_points, "/feedback", user_id, points_added, image_id)
+            return points_added
+
+        # Independent writes — awaited together instead of one round trip after another.
+        # The pending delete runs after the response.
+        _, _, points_added = await asyncio.gather(upload_label(), save_metadata(), add_points())
+
+        return JSONResponse({
+            "success": True,
+            "message": "Training data saved",
+            "points_added": points_added,
+            "location_verified": location_verified
+        })
+
+    except Exception as e:
+        print(f"❌ Feedback Error: {e}")
+        return _error(str(e), 500)
+
+
+# ── /health ───────────────────────────────────────────────────────────────────
+async def health(request: Request) -> JSONResponse:
+    if not STARTUP.is_ready():
+        return JSONResponse({"status": "starting", "startup": STARTUP.report()}, status_code=503)
+    return JSONResponse({
+        "status": "active",
+        "mode": "local_inference",
+        "server": "asgi",
+        "model_version": prediction_service.current_model_version() if prediction_service else None,
+        "startup": STARTUP.report(),
+        "model_reload": RELOADER.status(),
+        "memory": memory_report(),
+        "inference_policy": prediction_service.POLICY.status() if prediction_service else None,
+        "prediction_cache": PREDICTIONS.stats(),
+        "shared_config": CONFIG.status(),
+        "feedback_writes": FEEDBACK_LOG.status(),
+        "pending_feed": {"listing": PENDING.stats(), "signed_urls": SIGNED_URLS.stats()}
+    })
+
+
+# ── /admin/* ──────────────────────────────────────────────────────────────────
+async def reload_model_route(request: Request) -> JSONResponse:
+    if not _is_admin(request):
+        return _error("Unauthorized", 403)
+    if prediction_service is None:
+        return _error("Prediction service not available", 500)
+    try:
+        force = _flag(request, 'force')
+        role = request.query_params.get('role') or RELOADER.role
+        if _flag(request, 'wait'):
+            result = await _io(RELOADER.reload, force, role)
+            return JSONResponse(result, status_code=200 if "error" not in result else 500)
+
+        started = RELOADER.reload_async(force, role)
+        return JSONResponse({"accepted": started, "model_version": prediction_service.current_model_version()},
+                            status_code=202)
+    except Exception as e:
+        print(f"❌ Reload Error: {e}")
+        return _error(str(e), 500)
+
+
+async def promote_model_route(request: Request) -> JSONResponse:
+    if not _is_admin(request):
+        return _error("Unauthorized", 403)
+    if prediction_service is None:
+        return _error("Prediction service not available", 500)
+    try:
+        return JSONResponse(prediction_service.promote_model(request.query_params.get('version')))
+    except UnknownModelVersion as e:
+        return _error(str(e), 404)
+    except Exception as e:
+        print(f"❌ Promote Error: {e}")
+        return _error(str(e), 500)
+
+
+async def models_route(request: Request) -> JSONResponse:
+    if not _is_admin(request):
+        return _error("Unauthorized", 403)
+    if prediction_service is None:
+        return _error("Prediction service not available", 500)
+    return JSONResponse(prediction_service.REGISTRY.status())
+
+
+async def backfill_review_queue_route(request: Request) -> JSONResponse:
+    if not _is_admin(request):
+        return _error("Unauthorized", 403)
+    try:
+        return JSONResponse({"added": await _io(backfill_review_queue, "/admin/review-queue/backfill")})
+    except Exception as e:
+        print(f"❌ Review Queue Backfill Error: {e}")
+        return _error(str(e), 500)
+
+
+# ── /admin/traces, /admin/profile ─────────────────────────────────────────────
+async def traces_route(request: Request) -> JSONResponse:
+    if not _is_admin(request):
+        return _error("Unauthorized", 403)
+    traces = find_traces(request.query_params.get('trace_id'), request.query_params.get('image_id'))
+    return JSONResponse({"traces": traces, "count": len(traces)})
+
+
+async def profile_route(request: Request) -> Response:
+    if not _is_admin(request):
+        return _error("Unauthorized", 403)
+
+    if request.method == 'GET':
+        folded = await _io(PROFILER.read_latest)
+        if folded is None:
+            return JSONResponse({"error": "No profile recorded yet", "profiler": PROFILER.status()}, status_code=404)
+        return Response(folded, media_type='text/plain')
+
+    try:
+        seconds = parse_profile_seconds(request.query_params.get('seconds'))
+    except ValueError:
+        return _error("seconds must be a positive number", 400)
+    if not PROFILER.start(seconds):
+        return JSONResponse({"error": "A profile is already running", "profiler": PROFILER.status()}, status_code=409)
+    if _flag(request, 'wait'):
+        await _io(PROFILER.wait)
+        folded = await _io(PROFILER.read_latest)
+        if folded is None:
+            return JSONResponse({"error": "Profiling failed", "profiler": PROFILER.status()}, status_code=500)
+        return Response(folded, media_type='text/plain')
+    return JSONResponse({"started": True, "profiler": PROFILER.status()}, status_code=202)
+
+
+# ── /metrics ──────────────────────────────────────────────────────────────────
+# Gauge callbacks are registered by service_core.py
+async def metrics(request: Request) -> Response:
+    return Response(METRICS.render(), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+
+# ── /predict ──────────────────────────────────────────────────────────────────
+async def predict_route(request: Request) -> Response:
+    start = time.perf_counter()
+    form = await request.form()
+    # A plain text field named "file" isn't an upload (Flask's request.files skips it too)
+    file = form.get('file')
+    if not isinstance(file, UploadFile):
+        return _error("No file uploaded", 400)
+
+    if prediction_service is None:
+        return _error("Prediction service not available", 500)
+
+    try:
+        image_bytes = await file.read()
+        observe_stage("read", time.perf_counter() - start)
+        annotate = _flag(request, 'annotate', form)
+        media_type = _response_format(request)
+
+        pinned = (request.query_params.get('model_version') or form.get('model_version')
+                  or request.headers.get('X-Model-Version'))
+        if pinned:
+            prediction_service.REGISTRY.get(pinned)  # 404 before uploading anything
+
+        # Same photo scanned again? Reuse the cached result and its pending image
+        digest = content_hash(image_bytes)
+        model_version = prediction_service.current_model_version()
+        cached = PREDICTIONS.get(digest, model_version) if not pinned else None
+        if cached is not None:
+            # One existence check (re-uploaded under a new image_id if feedback consumed it)
+            result = await _io(cached_result, "/predict", cached, digest, model_version, image_bytes)
+            image_id = result['image_id']
+            annotate_trace(image_id=image_id, cache="hit")
+            if annotate and result.get('detections'):
+                with PREDICT_STAGE_SECONDS.time(stage="render"):
+                    result['annotated_image'] = await _infer(RENDERS.render, image_id,
+                                                             lambda: (image_bytes, result['detections']))
+            print(f"♻️ Prediction cache hit for image {image_id}")
+            return _prediction_response(result, media_type)
+
+        # Background upload to pending_images/ (submit() only blocks if the queue is full)
+        image_id = str(uuid.uuid4())
+        annotate_trace(image_id=image_id)
+        await _io(UPLOADS.submit, image_id, image_bytes)
+
+        result = await _infer(prediction_service.get_classification_result, image_bytes,
+                              annotate=annotate, model_version=pinned)
+        result['image_id'] = image_id
+
+        RENDERS.remember(image_id, image_bytes, result.get('detections', []))
+        if not pinned:
+            PREDICTIONS.put(digest, model_version, image_id, result)
+
+        return _prediction_response(result, media_type)
+
+    except UnsupportedFormat as e:
+        return _error(str(e), 406)
+    except UnknownModelVersion as e:
+        return _error(str(e), 404)
+    except Exception as e:
+        print(f"❌ Prediction Error: {e}")
+        return _error(str(e), 500)
+
+
+# ── /predict/batch ────────────────────────────────────────────────────────────
+async def predict_batch_route(request: Request) -> Response:
+    start = time.perf_counter()
+    form = await request.form()
+    files = [f for f in form.getlist('files') + form.getlist('file') if isinstance(f, UploadFile)]
+    if not files:
+        return _error("No files uploaded", 400)
+    if len(files) > PREDICT_BATCH_MAX_IMAGES:
+        return _error(f"Too many images (max {PREDICT_BATCH_MAX_IMAGES})", 413)
+
+    if prediction_service is None:
+        return _error("Prediction service not available", 500)
+
+    try:
+        media_type = _response_format(request)
+        pinned = (request.query_params.get('model_version') or form.get('model_version')
+                  or request.headers.get('X-Model-Version'))
+        if pinned:
+            prediction_service.REGISTRY.get(pinned)
+
+        images = await asyncio.gather(*[f.read() for f in files])
+        observe_stage("read", time.perf_counter() - start)
+        results = await _infer(predict_many, list(images), _flag(request, 'annotate', form), pinned)
+        return _prediction_response({"results": results, "count": len(results)}, media_type)
+
+    except UnsupportedFormat as e:
+        return _error(str(e), 406)
+    except UnknownModelVersion as e:
+        return _error(str(e), 404)
+    except Exception as e:
+        print(f"❌ Batch Prediction Error: {e}")
+        return _error(str(e), 500)
+
+
+# ── /render/<image_id> ────────────────────────────────────────────────────────
+async def render_annotated_image(request: Request) -> Response:
+    if prediction_service is None:
+        return _error("Prediction service not available", 500)
+    image_id = request.path_params['image_id']
+
+    try:
+        # The fallback blocks on GCS and the batcher, so the whole render runs off the loop
+        jpeg_bytes = await _io(RENDERS.render, image_id, partial(load_pending_for_render, image_id))
+        if jpeg_bytes is None:
+            return _error("Image not found", 404)
+        return Response(jpeg_bytes, media_type='image/jpeg',
+                        headers={"Cache-Control": "private, max-age=3600"})
+    except Exception as e:
+        print(f"❌ Render Error: {e}")
+        return _error(str(e), 500)
+
+
+# ── /pending-images ───────────────────────────────────────────────────────────
+async def _signed_entries(items: list) -> list:
+    """Response entries for queue items, reusing cached signed URLs and signing the rest concurrently."""
+    async def signed_url(name: str) -> str:
+        return SIGNED_URLS.cached(name) or await _io(SIGNED_URLS.sign, name)
+
+    urls = await asyncio.gather(*[signed_url(item["object"]) for item in items])
+    return [pending_image_entry(item, url) for item, url in zip(items, urls)]
+
+
+async def get_pending_images(request: Request) -> JSONResponse:
+    try:
+        try:
+            page_size = parse_page_size(request.query_params.get('page_size'))
+            # Only re-runs the review queue query (on the I/O executor) when the cached page list is stale
+            kept, next_page_token = await _io(PENDING.page, request.query_params.get('page_token'), page_size)
+        except InvalidPageToken as e:
+            return _error(str(e), 400)
+        except ValueError:
+            return _error("page_size must be an integer", 400)
+
+        pending_items = await _signed_entries(kept)
+
+        return JSONResponse({
+            "success": True,
+            "pending_images": pending_items,
+            "count": len(pending_items),
+            "next_page_token": next_page_token
+        })
+
+    except Exception as e:
+        print(f"❌ Pending Images Error: {e}")
+        return _error(str(e), 500)
+
+
+async def claim_pending_images(request: Request) -> JSONResponse:
+    try:
+        data = await request.json()
+        try:
+            reviewer_id, image_ids = review_request(data)
+            count = parse_page_size(data.get('count'))
+        except ValueError as e:
+            return _error(str(e), 400)
+
+        claimed = await _io(claim_pending, "/pending-images/claim", reviewer_id, count, image_ids)
+        pending_items = await _signed_entries(claimed)
+
+        return JSONResponse({
+            "success": True,
+            "pending_images": pending_items,
+            "count": len(pending_items),
+            "lease_seconds": REVIEW_QUEUE.lease_s
+        })
+
+    except Exception as e:
+        print(f"❌ Claim Pending Images Error: {e}")
+        return _error(str(e), 500)
+
+
+async def release_pending_images(request: Request) -> JSONResponse:
+    try:
+        try:
+            reviewer_id, image_ids = review_request(await request.json())
+        except ValueError as e:
+            return _error(str(e), 400)
+
+        released = await _tracked("firestore", "transaction", "/pending-images/release",
+                                  REVIEW_QUEUE.release, reviewer_id, image_ids)
+        return JSONResponse({"success": True, "released": released})
+
+    except Exception as e:
+        print(f"❌ Release Pending Images Error: {e}")
+        return _error(str(e), 500)
+
+
+# ── /community-feedback ───────────────────────────────────────────────────────
+async def save_community_feedback(request: Request) -> JSONResponse:
+    try:
+        data = await request.json()
+        image_id = data.get('image_id')
+        boxes = data.get('boxes', [])
+
+        if not image_id:
+            return _error("Missing image_id", 400)
+        try:
+            user_id = parse_reviewer_id(data.get('user_id'))
+        except ValueError as e:
+            return _error(str(e), 400)
+        if not boxes:
+            return _error("No boxes provided — draw at least one bounding box", 400)
+        annotate_trace(image_id=image_id)
+
+        try:
+            name_to_index = load_name_to_index()
+        except Exception as e:
+            print(f"⚠️ Could not load class_map.json: {e}")
+            return _error("Server configuration error", 500)
+
+        label_lines = community_label_lines(boxes, name_to_index)
+        if not label_lines:
+            return _error("No valid boxes after processing", 400)
+
+        label_content = "\n".join(label_lines)
+        print(f"📝 Community YOLO labels ({len(label_lines)} boxes):\n{label_content}")
+
+        training_image_path = f"training_data/images/{image_id}.jpg"
+        label_path = f"training_data/labels/{image_id}.txt"
+
+        # Only the lease holder may submit (service_core.take_for_review); then the first
+        # reviewer to get there wins (precondition copy, see service_core.move_to_training)
+        if not await _io(take_for_review, "/community-feedback", user_id, image_id):
+            return _error("Image is being reviewed by someone else", 409)
+        moved = await _io(move_to_training, "/community-feedback", image_id)
+        if moved == "missing":
+            return _error("Image not found in pending folder", 404)
+        if moved == "already_moved":
+            return _error("Image was already annotated", 409)
+
+        async def upload_label():
+            await _tracked("gcs", "upload", "/community-feedback", STORE.write, label_path,
+                           label_content, content_type='text/plain')
+            print(f"✅ Saved community label file: {label_path}")
+
+        async def save_metadata():
+            await _io(FEEDBACK_LOG.add, 'community_feedback', {
+                "image_id": image_id,
+                "image_path": training_image_path,
+                "label_path": label_path,
+                "boxes": boxes,
+                "box_count": len(label_lines),
+                "reviewer_id": user_id,
+                "created_at": datetime.utcnow(),
+                "source": "community_review",
+                "trace_id": current_trace_id()
+            }, route="/community-feedback")
+
+        await asyncio.gather(upload_label(), save_metadata())
+
+        return JSONResponse({
+            "success": True,
+            "message": f"Saved {len(label_lines)} annotation(s). Thank you!"
+        })
+
+    except Exception as e:
+        print(f"❌ Community Feedback Error: {e}")
+        return _error(str(e), 500)
+
+
+# ── DELETE /pending-images/<image_id> ─────────────────────────────────────────
+async def delete_pending_image(request: Request) -> JSONResponse:
+    image_id = request.path_params['image_id']
+    try:
+        pending_path = f"pending_images/{image_id}.jpg"
+        if await _io(remove_pending_image, "/pending-images/{image_id}", image_id):
+            print(f"🗑️ Deleted duplicate pending image: {pending_path}")
+            return JSONResponse({"success": True, "message": "Image removed from queue"})
+        return _error("Image not found in pending folder", 404)
+    except Exception as e:
+        print(f"❌ Delete Pending Error: {e}")
+        return _error(str(e), 500)
+
+
+app = Starlette(
+    routes=[
+        Route('/feedback', save_feedback, methods=['POST']),
+        Route('/health', health, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET']),
+        Route('/admin/reload-model', reload_model_route, methods=['POST']),
+        Route('/admin/promote-model', promote_model_route, methods=['POST']),
+        Route('/admin/models', models_route, methods=['GET']),
+        Route('/admin/review-queue/backfill', backfill_review_queue_route, methods=['POST']),
+        Route('/admin/traces', traces_route, methods=['GET']),
+        Route('/admin/profile', profile_route, methods=['GET', 'POST']),
+        Route('/predict', predict_route, methods=['POST']),
+        Route('/predict/batch', predict_batch_route, methods=['POST']),
+        Route('/render/{image_id}', render_annotated_image, methods=['GET']),
+        Route('/pending-images', get_pending_images, methods=['GET']),
+        Route('/pending-images/claim', claim_pending_images, methods=['POST']),
+        Route('/pending-images/release', release_pending_images, methods=['POST']),
+        Route('/community-feedback', save_community_feedback, methods=['POST']),
+        Route('/pending-images/{image_id}', delete_pending_image, methods=['DELETE']),
+    ],
+    middleware=[Middleware(_RequestTracing), Middleware(_RequestMetrics), Middleware(_ReadinessGate)],
+)
+
+# Route template per endpoint, so request metrics aren't labelled by raw path
+_ROUTE_PATHS = {route.endpoint: route.path for route in app.routes}
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get("PORT", 8080)))
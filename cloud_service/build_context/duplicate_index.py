@@ -0,0 +1,197 @@
+"""
+duplicate_index.py — Perceptual-hash near-duplicate detection for pending_images/.
+
+Community reviewers kept getting near-identical photos (the same item scanned a
+few times from slightly different angles), which is why DELETE /pending-images/<id>
+exists. This module lets the service spot those duplicates itself:
+
+  dhash()          — 64-bit difference hash: grayscale 9x8 thumbnail, one bit per
+                     "is this pixel brighter than its right neighbour". Robust to
+                     re-encoding, resizing and small exposure changes.
+  BKTree           — metric tree over Hamming distance, so "everything within
+                     distance d of this hash" touches only a fraction of the nodes.
+  DuplicateIndex   — thread-safe BK-tree of the images this instance uploaded
+                     recently (predict_route's background upload), so a new photo
+                     can be tagged "duplicate_of" an earlier one. Bounded: entries
+                     expire after DUPLICATE_MAX_AGE_S (the bucket lifecycle rule
+                     deletes pending images by then anyway), the oldest go first
+                     beyond DUPLICATE_INDEX_MAX, and an image that leaves the queue
+                     on this instance is dropped at once.
+
+The hash is also written to the GCS object metadata ("dhash") and the review queue
+entry, so collapse() groups duplicates in a listing from the listing alone — it
+doesn't add to the index, which would otherwise grow with every page served.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+# Max Hamming distance (out of 64 bits) at which two photos count as near-duplicates
+DUPLICATE_MAX_DISTANCE = int(os.getenv("DUPLICATE_MAX_DISTANCE", "6"))
+DUPLICATE_INDEX_MAX    = int(os.getenv("DUPLICATE_INDEX_MAX", "20000"))
+DUPLICATE_MAX_AGE_S    = float(os.getenv("DUPLICATE_MAX_AGE_S", str(3 * 86400)))  # the bucket lifecycle rule's age
+
+
+def dhash(img: Image.Image, hash_size: int = 8) -> int:
+    """64-bit difference hash of an image (hash_size=8 → 9x8 thumbnail)."""
+    small  = img.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = small.tobytes()  # one byte per pixel in mode 'L', row by row
+    value  = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def hash_to_hex(value: int) -> str:
+    return f"{value:016x}"
+
+
+def hex_to_hash(text: Optional[str]) -> Optional[int]:
+    try:
+        return int(text, 16) if text else None
+    except ValueError:
+        return None
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance. Nodes are [hash, key, {distance: child}]."""
+
+    def __init__(self):
+        self._root = None
+        self.size  = 0
+
+    def add(self, value: int, key: str) -> None:
+        self.size += 1
+        if self._root is None:
+            self._root = [value, key, {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, key, {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, str]]:
+        """All (distance, key) pairs within max_distance of value, closest first."""
+        if self._root is None:
+            return []
+        matches, stack = [], [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                matches.append((distance, node[1]))
+            # Triangle inequality: only children whose edge is within ±max_distance can match
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        return sorted(matches)
+
+
+class DuplicateIndex:
+    """Thread-safe near-duplicate lookup over recently uploaded pending images."""
+
+    def __init__(self, max_distance: int = DUPLICATE_MAX_DISTANCE,
+                 max_entries: int = DUPLICATE_INDEX_MAX,
+                 max_age_s: float = DUPLICATE_MAX_AGE_S):
+        self.max_distance = max_distance
+        self.max_entries  = max(1, max_entries)
+        self.max_age_s    = max_age_s
+        self._lock        = threading.Lock()
+        self._tree        = BKTree()
+        # Live entries in insertion order: image_id -> (hash, monotonic time added).
+        # Tree nodes whose key isn't here are dead until the next _rebuild()
+        self._hashes: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._hashes)
+
+    def add(self, image_id: str, value: int) -> Optional[str]:
+        """
+        Index image_id and return the id of an existing near-duplicate (if any).
+        Re-adding a known image is a no-op.
+        """
+        with self._lock:
+            self._expire(time.monotonic())
+            if image_id in self._hashes:
+                return None
+            duplicate = self._nearest(value, exclude=image_id)
+            self._hashes[image_id] = (value, time.monotonic())
+            self._tree.add(value, image_id)
+            self._expire(time.monotonic())
+            return duplicate
+
+    def remove(self, image_id: str) -> None:
+        """image_id has left the pending queue."""
+        with self._lock:
+            self._hashes.pop(image_id, None)
+            self._maybe_rebuild()
+
+    def find(self, value: int, exclude: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            self._expire(time.monotonic())
+            return self._nearest(value, exclude)
+
+    def collapse(self, items: List[Dict], limit: int) -> List[Dict]:
+        """
+        Group near-duplicate listing entries. Each item needs "image_id" and an
+        optional int "dhash". The first item of each group is kept (in listing
+        order) and gains "duplicate_ids"; items without a hash are never grouped.
+        At most `limit` groups are returned.
+        """
+        kept: List[Dict] = []
+        page_tree = BKTree()
+        by_id: Dict[str, Dict] = {}
+        for item in items:
+            value = item.get("dhash")
+            if value is not None:
+                match = page_tree.search(value, self.max_distance)
+                if match:
+                    by_id[match[0][1]]["duplicate_ids"].append(item["image_id"])
+                    continue
+            if len(kept) >= limit:
+                continue  # keep scanning so later duplicates of kept items still fold in
+            entry = {**item, "duplicate_ids": []}
+            by_id[item["image_id"]] = entry
+            kept.append(entry)
+            if value is not None:
+                page_tree.add(value, item["image_id"])
+        return kept
+
+    def _nearest(self, value: int, exclude: Optional[str]) -> Optional[str]:
+        for _, key in self._tree.search(value, self.max_distance):
+            if key != exclude and key in self._hashes:
+                return key
+        return None
+
+    def _expire(self, now: float) -> None:
+        """Drop the oldest entries while they're past max_age_s or over max_entries."""
+        cutoff = now - self.max_age_s
+        while self._hashes:
+            _, added_at = next(iter(self._hashes.values()))
+            if added_at >= cutoff and len(self._hashes) <= self.max_entries:
+                break
+            self._hashes.popitem(last=False)
+        self._maybe_rebuild()
+
+    def _maybe_rebuild(self) -> None:
+        # BK-trees don't support in-place deletion — rebuild once dead nodes pile up
+        if self._tree.size - len(self._hashes) > max(1024, len(self._hashes) // 2):
+            self._tree = BKTree()
+            for key, (value, _) in self._hashes.items():
+                self._tree.add(value, key)
@@ -0,0 +1,156 @@
+"""
+engine_parity.py — Check that every inference engine returns the same detections.
+
+Runs the same images through each backend in inference_engines.py and compares
+the detections against the reference engine (torch by default). Boxes are matched
+per class by IoU; a matched pair passes when IoU >= --min-iou and the confidence
+difference is <= --score-tol. Unmatched boxes on either side are failures.
+
+Also reports the mean per-image latency of each engine, so the same run tells you
+whether switching INFERENCE_ENGINE is both safe and worth it.
+
+Needs the optional runtimes: pip install -r requirements-engines.txt
+
+Usage:
+    python engine_parity.py --weights weights/best.pt --images ../../ml/data/trashnet/dataset-resized/glass
+    python engine_parity.py --weights weights/best.pt --images ./samples --engines torch,onnxruntime --limit 20
+
+Exit code is 0 when every engine matches the reference on every image, 1 otherwise.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Any, Dict, List
+
+from PIL import Image
+
+from inference_engines import ENGINES, ENGINE_TORCH, load_engine, extract_detections
+
+CONF_THRESHOLD = 0.25  # same threshold prediction_service.py uses
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def _xywhn_to_xyxy(box: List[float]) -> List[float]:
+    xc, yc, w, h = box
+    return [xc - w / 2, yc - h / 2, xc + w / 2, yc + h / 2]
+
+
+def box_iou(a: List[float], b: List[float]) -> float:
+    """IoU of two normalized [x_center, y_center, w, h] boxes."""
+    ax1, ay1, ax2, ay2 = _xywhn_to_xyxy(a)
+    bx1, by1, bx2, by2 = _xywhn_to_xyxy(b)
+    inter_w = max(0.0, min(ax2, bx2) - max(ax1, bx1))
+    inter_h = max(0.0, min(ay2, by2) - max(ay1, by1))
+    inter   = inter_w * inter_h
+    union   = (ax2 - ax1) * (ay2 - ay1) + (bx2 - bx1) * (by2 - by1) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def compare_detections(reference: List[Dict[str, Any]], candidate: List[Dict[str, Any]],
+                       min_iou: float, score_tol: float) -> Dict[str, Any]:
+    """Greedy same-class IoU matching of candidate detections against the reference."""
+    unmatched  = list(candidate)
+    worst_iou  = 1.0
+    worst_diff = 0.0
+    missing    = 0
+
+    for ref in reference:
+        best, best_iou = None, 0.0
+        for cand in unmatched:
+            if cand["label"] != ref["label"]:
+                continue
+            iou = box_iou(ref["box_2d"], cand["box_2d"])
+            if iou > best_iou:
+                best, best_iou = cand, iou
+        if best is None or best_iou < min_iou:
+            missing += 1
+            continue
+        unmatched.remove(best)
+        worst_iou  = min(worst_iou, best_iou)
+        worst_diff = max(worst_diff, abs(ref["confidence"] - best["confidence"]))
+
+    return {
+        "ok":              missing == 0 and not unmatched and worst_diff <= score_tol,
+        "missing":         missing,
+        "extra":           len(unmatched),
+        "min_iou":         round(worst_iou, 4),
+        "max_score_diff":  round(worst_diff, 4),
+    }
+
+
+def list_images(images_dir: str, limit: int) -> List[str]:
+    paths = sorted(
+        os.path.join(images_dir, name) for name in os.listdir(images_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return paths[:limit] if limit else paths
+
+
+def run_parity(weights: str, image_paths: List[str], engine_names: List[str],
+               reference: str, min_iou: float, score_tol: float) -> Dict[str, Any]:
+    engines = {name: load_engine(name, weights) for name in engine_names}
+    report  = {"reference": reference, "images": len(image_paths), "engines": {}}
+
+    # Run every engine over every image first, then compare against the reference
+    outputs: Dict[str, List[List[Dict[str, Any]]]] = {}
+    for name, engine in engines.items():
+        if engine.name != name:
+            print(f"⚠️ {name} is unavailable (fell back to {engine.name}) — skipping")
+            continue
+        per_image, elapsed = [], 0.0
+        for path in image_paths:
+            img   = Image.open(path).convert('RGB')
+            start = time.perf_counter()
+            r     = engine.predict(img, conf=CONF_THRESHOLD, save=False, verbose=False)[0]
+            elapsed += time.perf_counter() - start
+            per_image.append(extract_detections(r, engine.names))
+        outputs[name] = per_image
+        report["engines"][name] = {
+            "mean_latency_ms": round(1000 * elapsed / max(1, len(image_paths)), 2),
+        }
+
+    if reference not in outputs:
+        raise RuntimeError(f"Reference engine '{reference}' could not be loaded")
+
+    for name, per_image in outputs.items():
+        if name == reference:
+            continue
+        failures = []
+        for path, ref_dets, cand_dets in zip(image_paths, outputs[reference], per_image):
+            result = compare_detections(ref_dets, cand_dets, min_iou, score_tol)
+            if not result["ok"]:
+                failures.append({"image": os.path.basename(path), **result})
+        report["engines"][name].update({"ok": not failures, "failures": failures})
+
+    report["ok"] = all(e.get("ok", True) for e in report["engines"].values())
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare detections across inference engines")
+    parser.add_argument('--weights', default=os.path.join('weights', 'best.pt'),
+                        help='Path to the .pt weights (exports are created next to it)')
+    parser.add_argument('--images', required=True, help='Directory of sample images')
+    parser.add_argument('--engines', default=','.join(ENGINES),
+                        help='Comma-separated engine names to compare')
+    parser.add_argument('--reference', default=ENGINE_TORCH, help='Engine treated as ground truth')
+    parser.add_argument('--limit', type=int, default=50, help='Max images to check (0 = all)')
+    parser.add_argument('--min-iou', type=float, default=0.9, help='Minimum IoU for a matched box')
+    parser.add_argument('--score-tol', type=float, default=0.02, help='Max confidence difference')
+    args = parser.parse_args()
+
+    engine_names = [name.strip() for name in args.engines.split(',') if name.strip()]
+    if args.reference not in engine_names:
+        engine_names.insert(0, args.reference)
+
+    report = run_parity(args.weights, list_images(args.images, args.limit), engine_names,
+                        args.reference, args.min_iou, args.score_tol)
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["ok"] else 1)
+
+
+if __name__ == '__main__':
+    main()
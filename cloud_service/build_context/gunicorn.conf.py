@@ -0,0 +1,77 @@
+"""
+gunicorn.conf.py — Preload-and-fork serving for waste-classifier-eu.
+
+With GUNICORN_PRELOAD=1 (default) the master imports the app once. service_core.py sees
+MODEL_PRELOAD=1 and loads the YOLO weights synchronously in the master *without*
+running inference (OpenMP thread pools don't survive fork). Workers are then
+forked from that master and share the weight tensors copy-on-write, so adding a
+worker costs its private heap instead of another full model copy on the 2Gi instance.
+
+Per worker (post_fork / post_worker_init):
+  - torch intra/inter-op threads are budgeted from the available CPUs (worker_budget.py)
+  - service_core.start_worker() runs the per-process startup phases: Firebase credentials,
+    warmup and the weights poller — none of which may be shared across a fork
+  - once ready, the worker prints its RSS split into shared (copy-on-write) and
+    private memory; the same numbers are returned by GET /health
+  - on graceful shutdown (worker_exit, e.g. Cloud Run's SIGTERM) service_core.stop_worker()
+    commits or spools the buffered Firestore feedback writes (write_behind.py)
+
+API_SERVER picks the app: "flask" (default, main:app on gthread workers) or
+"asgi" (asgi_main:app on uvicorn workers — same routes, async I/O).
+
+Tunables (env vars): API_SERVER, GUNICORN_WORKERS, GUNICORN_THREADS, GUNICORN_PRELOAD,
+PORT, TORCH_INTRA_OP_THREADS, TORCH_INTER_OP_THREADS.
+"""
+
+import gc
+import os
+
+from worker_budget import apply_thread_budget, available_cpus, thread_budget
+
+bind         = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers      = int(os.getenv("GUNICORN_WORKERS", "1"))
+threads      = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout      = 120
+preload_app  = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+if os.getenv("API_SERVER", "flask").lower() == "asgi":
+    wsgi_app     = "asgi_main:app"
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    wsgi_app     = "main:app"
+
+if preload_app:
+    # Read by service_core.py at import time in the master
+    os.environ.setdefault("MODEL_PRELOAD", "1")
+
+
+def when_ready(server):
+    cpus = available_cpus()
+    intra, inter = thread_budget(workers, cpus)
+    print(f"🔧 gunicorn: {wsgi_app}, {workers} worker(s) x {threads} threads, preload={preload_app}, "
+          f"{cpus} CPU(s) → {intra} intra-op / {inter} inter-op torch threads per worker")
+
+
+def pre_fork(server, worker):
+    # Move everything the master allocated (model included) out of the GC's
+    # generations so collections in the workers don't touch — and copy — those pages
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    applied = apply_thread_budget(*thread_budget(workers))
+    print(f"🔧 Worker {worker.pid}: torch threads {applied}")
+
+
+def post_worker_init(worker):
+    # The app is loaded by now (inherited from the master when preloading)
+    import service_core
+    service_core.start_worker()
+
+
+def worker_exit(server, worker):
+    # Runs in the worker on graceful shutdown (Cloud Run's SIGTERM): commit or spool
+    # the buffered Firestore writes before the process goes away
+    import service_core
+    service_core.stop_worker()
@@ -0,0 +1,25 @@
+"""
+image_decode.py — Reduced-resolution, orientation-corrected image decoding.
+
+Phone uploads are typically 12MP JPEGs (4000x3000). Decoding them at full size
+only for ultralytics to letterbox them down to 640 costs CPU and ~36MB of pixels
+per image per worker. decode_image() asks libjpeg for a DCT-scaled decode
+(1/2, 1/4 or 1/8) via Image.draft(), picking the smallest scale that still
+covers target_size on both sides, then applies the EXIF orientation in the same
+pass so detections line up with the photo as the user sees it.
+
+Non-JPEG inputs (PNG, WebP...) ignore draft() and are decoded normally.
+"""
+
+import io
+
+from PIL import Image, ImageOps
+
+
+def decode_image(image_bytes: bytes, target_size: int) -> Image.Image:
+    """Decode image_bytes to an RGB image no smaller than target_size on either side (if the source allows)."""
+    img = Image.open(io.BytesIO(image_bytes))
+    if target_size and target_size > 0:
+        img.draft('RGB', (target_size, target_size))  # no-op for non-JPEG formats
+    img = ImageOps.exif_transpose(img)
+    return img.convert('RGB')
@@ -0,0 +1,186 @@
+"""
+inference_engines.py — Pluggable CPU inference backends for prediction_service.py.
+
+Every engine wraps an ultralytics YOLO handle, so all backends accept the same
+predict() arguments and return the same ultralytics Results objects. That keeps
+the detections schema built by prediction_service._build_response() identical
+no matter which runtime actually executes the network.
+
+Available engines:
+  torch       — the trained .pt weights on PyTorch CPU (default, always available)
+  onnxruntime — weights exported to ONNX and executed by ONNX Runtime
+  openvino    — weights exported to OpenVINO IR and executed by the OpenVINO CPU plugin
+
+Engine selection (first match wins):
+  1. INFERENCE_ENGINE env var (e.g. set on the Cloud Run revision)
+  2. "engine" key in shared/model_meta.json
+  3. "torch"
+
+Exports are created lazily next to the .pt file the first time a non-torch engine
+is loaded (best.pt → best.onnx / best_openvino_model/) and reused while they are
+newer than the weights. If an optional runtime is missing or the export fails,
+the service falls back to the torch engine so it always comes up healthy.
+
+The onnxruntime / openvino runtimes are not in requirements.txt — they are listed
+in requirements-engines.txt and only installed in images built with
+--build-arg INFERENCE_RUNTIMES=1, which is how cloudbuild.yaml builds the
+deployed revision.
+"""
+
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+ENGINE_TORCH    = "torch"
+ENGINE_ONNX     = "onnxruntime"
+ENGINE_OPENVINO = "openvino"
+DEFAULT_ENGINE  = ENGINE_TORCH
+
+
+def import_runtime() -> None:
+    """
+    Import ultralytics (and with it torch). This is the slowest part of a cold
+    start, so the startup orchestrator runs it in parallel with the other phases;
+    everything below imports ultralytics lazily.
+    """
+    import ultralytics  # noqa: F401
+
+
+class InferenceEngine:
+    """
+    Base engine — a thin, duck-typed stand-in for ultralytics.YOLO.
+
+    Exposes .names and .predict() so the rest of the service can treat any engine
+    exactly like the YOLO object it used to hold in MODEL.
+    """
+
+    name = DEFAULT_ENGINE
+
+    def __init__(self, weights_path: str):
+        from ultralytics import YOLO
+        self.weights_path = weights_path
+        self.model_path   = self._prepare(weights_path)
+        self.model        = YOLO(self.model_path, task='detect')
+
+    @property
+    def names(self) -> Dict[int, str]:
+        return self.model.names
+
+    def predict(self, source: Any, **kwargs) -> List[Any]:
+        return self.model.predict(source, **kwargs)
+
+    def _prepare(self, weights_path: str) -> str:
+        """Return the path ultralytics should load for this engine."""
+        return weights_path
+
+
+class TorchEngine(InferenceEngine):
+    """PyTorch CPU — loads the .pt weights directly."""
+
+    name = ENGINE_TORCH
+
+
+class _ExportedEngine(InferenceEngine):
+    """Shared export-and-cache logic for runtimes that need converted weights."""
+
+    export_format = ""
+    runtime_module = ""
+
+    def _prepare(self, weights_path: str) -> str:
+        __import__(self.runtime_module)  # fail fast (ImportError) if the runtime isn't installed
+        exported = self._exported_path(weights_path)
+        if os.path.exists(exported) and os.path.getmtime(exported) >= os.path.getmtime(weights_path):
+            return exported
+
+        from ultralytics import YOLO
+        print(f"🔧 Exporting {weights_path} to {self.export_format} for the {self.name} engine...")
+        # dynamic=True keeps batch size and input resolution free, which the
+        # micro-batching scheduler relies on
+        return YOLO(weights_path).export(format=self.export_format, dynamic=True, verbose=False)
+
+    def _exported_path(self, weights_path: str) -> str:
+        raise NotImplementedError
+
+
+class OnnxRuntimeEngine(_ExportedEngine):
+    """ONNX Runtime CPU execution provider."""
+
+    name           = ENGINE_ONNX
+    export_format  = "onnx"
+    runtime_module = "onnxruntime"
+
+    def _exported_path(self, weights_path: str) -> str:
+        return os.path.splitext(weights_path)[0] + ".onnx"
+
+
+class OpenVinoEngine(_ExportedEngine):
+    """OpenVINO CPU plugin."""
+
+    name           = ENGINE_OPENVINO
+    export_format  = "openvino"
+    runtime_module = "openvino"
+
+    def _exported_path(self, weights_path: str) -> str:
+        return os.path.splitext(weights_path)[0] + "_openvino_model"
+
+
+ENGINES = {
+    ENGINE_TORCH:    TorchEngine,
+    ENGINE_ONNX:     OnnxRuntimeEngine,
+    ENGINE_OPENVINO: OpenVinoEngine,
+}
+
+
+def resolve_engine_name(model_meta: Optional[Dict[str, Any]] = None) -> str:
+    """Pick the engine name from INFERENCE_ENGINE, then model_meta.json, then the default."""
+    name = os.getenv("INFERENCE_ENGINE") or (model_meta or {}).get("engine") or DEFAULT_ENGINE
+    name = name.strip().lower()
+    if name not in ENGINES:
+        print(f"⚠️ Unknown inference engine '{name}' — using {DEFAULT_ENGINE}")
+        return DEFAULT_ENGINE
+    return name
+
+
+def load_engine(name: str, weights_path: str) -> InferenceEngine:
+    """
+    Load the requested engine, falling back to the torch engine if the optional
+    runtime is missing or the export fails.
+    """
+    engine_cls = ENGINES.get(name, TorchEngine)
+    try:
+        return engine_cls(weights_path)
+    except Exception as e:
+        if engine_cls is TorchEngine:
+            raise
+        print(f"⚠️ Could not load {name} engine ({e}) — falling back to {DEFAULT_ENGINE}")
+        return TorchEngine(weights_path)
+
+
+def extract_detections(r, names: Dict[int, str]) -> List[Dict[str, Any]]:
+    """
+    Convert one Results object into the detections list returned by /predict:
+      [{"id": "box_0", "label": "plastic", "confidence": 0.912, "box_2d": [xc, yc, w, h]}, ...]
+    box_2d is normalized to [0, 1] — the same format as a YOLO label line — at the
+    model's full precision: /feedback writes it back into the training labels.
+    """
+    boxes = r.boxes
+    if len(boxes) == 0:
+        return []
+
+    # One host copy per field for all boxes instead of an .item() call per box.
+    # Confidences are rounded to 3 places as before; xywhn is passed through as is
+    class_ids   = np.asarray(boxes.cls.cpu().numpy(), dtype=np.int64).tolist()
+    confidences = np.round(np.asarray(boxes.conf.cpu().numpy(), dtype=np.float64), 3).tolist()
+    xywhn       = np.asarray(boxes.xywhn.cpu().numpy()).tolist()
+
+    return [
+        {
+            "id":         f"box_{i}",
+            "label":      names.get(class_id, "unknown"),
+            "confidence": confidence,
+            "box_2d":     box_2d,
+        }
+        for i, (class_id, confidence, box_2d) in enumerate(zip(class_ids, confidences, xywhn))
+    ]
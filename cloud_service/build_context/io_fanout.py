@@ -0,0 +1,69 @@
+"""
+io_fanout.py — Run the independent storage / Firestore calls of one request concurrently.
+
+/feedback used to make 6–8 network round trips one after another: exists, copy
+and delete of the pending image, the label upload, the Firestore add, then a
+user get and update. None of the writes depend on each other, so the Flask
+routes now submit them to FANOUT and wait for all of them at once — the request
+costs about as much as its slowest call instead of the sum.
+asgi_main.py gets the same shape from asyncio.gather() on its own I/O executor.
+
+  FANOUT.submit(fn, ...)      start fn on the pool, in the caller's context (trace)
+  FANOUT.gather(f1, f2, ...)  wait for all of them; re-raise the first failure
+  FANOUT.background(fn, ...)  fire-and-forget cleanup that must not delay the
+                              response (e.g. deleting the copied pending image);
+                              failures are only logged
+
+The pool is created lazily and again after a fork, like the upload queue's, and
+its worker threads are joined at interpreter exit, so queued cleanup still runs
+on a graceful shutdown.
+"""
+
+import os
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, List, Optional
+
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", "32"))
+
+
+class Fanout:
+    """A shared thread pool for the concurrent I/O of request handlers."""
+
+    def __init__(self, max_workers: int = FANOUT_WORKERS):
+        self._max_workers = max(1, max_workers)
+        self._lock        = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid         = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                    thread_name_prefix="io-fanout")
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        return self._get_executor().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+    @staticmethod
+    def gather(*futures: Future) -> List[Any]:
+        """Results of futures in order, once all of them are done (no write is left running)."""
+        wait(futures)
+        return [future.result() for future in futures]
+
+    def background(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        future = self.submit(fn, *args, **kwargs)
+        future.add_done_callback(_log_failure)
+        return future
+
+
+def _log_failure(future: Future) -> None:
+    error = future.exception()
+    if error is not None:
+        print(f"⚠️ Background storage call failed: {error}")
+
+
+FANOUT = Fanout()
@@ -3,51 +3,139 @@ main.py — Flask API for the waste-classifier-eu Cloud Run service.
 
 This is the production backend. It runs inside a Docker container deployed to
 Google Cloud Run (europe-west1). The frontend React Native app sends all
-image and feedback requests here.
+image and feedback requests here. asgi_main.py serves the same routes from an
+asyncio event loop (API_SERVER=asgi, see gunicorn.conf.py). Both are thin
+request / response layers over service_core.py, which owns the backends, the
+caches, startup and the route logic they share.
 
 Endpoints:
   POST /predict              — Accept a photo, run YOLOv8 inference, return detections
+                               (add annotate=1 to also get annotated_image_base64,
+                               model_version=... to pin a resident model version;
+                               Accept / ?format= selects JSON, msgpack, CBOR or multipart)
+  POST /predict/batch        — Same as /predict for several images ("files" parts) in one
+                               batched forward pass; one result (with its own image_id) per image
+  GET  /render/<id>          — Annotated JPEG for a recent prediction (rendered on demand, cached)
   POST /feedback             — Accept user corrections, write YOLO labels to GCS, award points
-  GET  /pending-images       — Return up to 10 unreviewed images for community annotation
+  GET  /pending-images       — Return a page of unreviewed images for community annotation
+                               (?page_size=, ?page_token= from the previous page's
+                               next_page_token; near-duplicate photos are collapsed into one entry)
+  POST /pending-images/claim — Lease up to N pending images to a reviewer (nobody else gets them)
+  POST /pending-images/release — Hand leased images back to the review queue
   POST /community-feedback   — Save community-drawn bounding box annotations to GCS
   DELETE /pending-images/<id> — Remove a specific image from the pending review queue
-  GET  /health               — Health check used by Cloud Run's readiness probe
+  GET  /health               — Readiness probe: 503 until startup + model warmup finish,
+                               then 200 with the per-phase startup timing breakdown
+  POST /admin/reload-model   — Hot-swap to the latest best_latest.pt (X-Admin-Token header)
+                               (role=candidate loads it as a shadow candidate instead)
+  POST /admin/promote-model  — Make the shadow candidate (or ?version=...) the active model
+  GET  /admin/models         — Resident model versions, memory, latency and shadow agreement
+  POST /admin/review-queue/backfill — Queue pending images that predate the review queue
+  GET  /admin/traces         — Recent request traces (?trace_id= or ?image_id=), see request_tracing.py
+  POST /admin/profile        — Sample all thread stacks for ?seconds=N (at most 60) into a flamegraph (folded) file;
+                               GET returns the last profile (see sampling_profiler.py)
+  GET  /metrics              — Prometheus metrics: per-stage /predict latency, GCS/Firestore
+                               call latency, in-flight requests, queue depths (service_metrics.py)
 
 GCS bucket layout (retrain_smart_waste_model):
-  pending_images/{uuid}.jpg      — Uploaded on /predict; awaiting user feedback
+  pending_images/{uuid}.jpg      — Uploaded in the background on /predict; awaiting user feedback
+                                   (and queued for community review in Firestore review_queue/{uuid})
   training_data/images/{uuid}.jpg — Confirmed images (moved here by /feedback)
   training_data/labels/{uuid}.txt — YOLO label files generated from user corrections
 
 Points system (awarded by /feedback when location_verified=true):
   5 points per valid correction (status = "correct" or "wrong_label")
   Capped at 25 points per scan submission
+  Added atomically (Firestore Increment) together with a users/{uid}/points_history entry
 """
 
 import os
-import sys
+import time
 import uuid
-import firebase_admin
-from flask import Flask, request, jsonify
-from firebase_admin import firestore, credentials, storage
+from flask import Flask, Response, g, request, jsonify
 from datetime import datetime
 
-try:
-    from prediction_service import get_classification_result
-except ImportError as e:
-    print(f"❌ Error importing prediction_service: {e}")
-    get_classification_result = None
+from prediction_cache import content_hash
+from model_registry import UnknownModelVersion
+from worker_budget import memory_report
+from response_codecs import UnsupportedFormat, encode, negotiate
+from service_metrics import (METRICS, CONTENT_TYPE as METRICS_CONTENT_TYPE, HTTP_REQUEST_SECONDS, IN_FLIGHT,
+                             PREDICT_STAGE_SECONDS, observe_stage, track_call)
+from request_tracing import annotate_trace, current_trace_id, end_trace, find_traces, incoming_trace_id, start_trace
+from io_fanout import FANOUT
+from pending_feed import InvalidPageToken, parse_page_size
+from sampling_profiler import parse_profile_seconds
+from shared_config import CONFIG
+# Backends, caches, startup and the route logic shared with asgi_main.py
+from service_core import (ADMIN_TOKEN, FEEDBACK_LOG, FEEDBACK_MISSING_WAIT_S, PENDING, PREDICTIONS,
+                          PREDICT_BATCH_MAX_IMAGES, PROFILER, RELOADER, RENDERS, REVIEW_QUEUE, SIGNED_URLS,
+                          STARTUP, STORE, UPLOADS, award_points, backfill_review_queue, cached_result,
+                          claim_pending, community_label_lines, current_model_version, feedback_label_lines,
+                          feedback_points, get_classification_result, load_name_to_index,
+                          load_pending_for_render, move_to_training, parse_reviewer_id, pending_image_entry,
+                          predict_many, prediction_service, remove_pending_image, review_request, take_for_review)
 
-if not firebase_admin._apps:
-    cred = credentials.Certificate("serviceAccountKey.json")
-    firebase_admin.initialize_app(cred)
+app = Flask(__name__)
 
-db = firestore.client()
 
-app = Flask(__name__)
+@app.before_request
+def _start_request_metrics():
+    g.request_start = time.perf_counter()
+    g.trace = start_trace(f"{request.method} {request.path}", incoming_trace_id(request.headers))
+    IN_FLIGHT.inc()
+
+
+@app.after_request
+def _observe_request(response):
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - g.request_start,
+                                 route=route, method=request.method, status=response.status_code)
+
+    # The trace ends once the WSGI server has written the last body byte
+    trace, write_start = g.trace, time.perf_counter()
+    response.headers['X-Trace-Id'] = trace.trace_id
+
+    def _finish_trace():
+        trace.add_span("response.write", write_start, time.perf_counter())
+        end_trace(trace, keep=route not in ('/health', '/metrics'), route=route, status=response.status_code)
+
+    response.call_on_close(_finish_trace)
+    return response
+
+
+@app.teardown_request
+def _end_request_metrics(exc):
+    if 'request_start' in g:
+        IN_FLIGHT.dec()
+
+
+@app.before_request
+def _wait_until_ready():
+    """Hold early requests until startup finishes; /health and /metrics answer immediately."""
+    if request.path in ('/health', '/metrics') or STARTUP.is_ready():
+        return None
+    if not STARTUP.wait():
+        return jsonify({"error": "Service is starting, please retry"}), 503
+    return None
+
+
+def _flag(name: str) -> bool:
+    """Read a boolean request flag from the query string or multipart form ("1", "true", "yes")."""
+    value = request.args.get(name) or request.form.get(name) or ''
+    return value.strip().lower() in ('1', 'true', 'yes')
+
+
+def _response_format() -> str:
+    """Media type negotiated from ?format= or the Accept header (raises UnsupportedFormat)."""
+    return negotiate(request.headers.get('Accept'), request.args.get('format'))
 
-# GCS bucket where all training data and model weights are stored.
-# Override via STORAGE_BUCKET env var if needed (e.g. for a staging bucket).
-BUCKET_NAME = os.getenv("STORAGE_BUCKET", "retrain_smart_waste_model")
+
+def _prediction_response(payload: dict, media_type: str) -> Response:
+    """A /predict or /predict/batch payload serialized as media_type (see response_codecs.py)."""
+    start = time.perf_counter()
+    body, content_type = encode({**payload, "trace_id": current_trace_id()}, media_type)
+    observe_stage("serialize", time.perf_counter() - start)
+    return Response(body, status=200, content_type=content_type, headers={'Vary': 'Accept'})
 
 # ── /feedback ─────────────────────────────────────────────────────────────────
 # Called by the frontend after the user reviews the ML detections.
@@ -68,53 +156,19 @@ def save_feedback():
 
         if not image_id:
             return jsonify({"error": "Missing image_id"}), 400
+        annotate_trace(image_id=image_id)
         print(f"🔍 RECEIVED FEEDBACK: {feedback_items}")
         print(f"📍 Location Verified: {location_verified}")
 
         # --- GENERATE YOLO LABEL FILE CONTENT ---
         # Format: <class_index> <x_center> <y_center> <width> <height>
-        label_lines = []
-        
-        # --- LOAD CLASS MAP ---
         try:
-             # In Docker (Cloud Run), 'shared' is copied to the same directory as main.py
-            base_dir = os.path.dirname(os.path.abspath(__file__))
-            class_map_path = os.path.join(base_dir, 'shared', 'class_map.json')
-            
-            import json
-            with open(class_map_path, 'r') as f:
-                class_data = json.load(f)
-            
-            # Helper to get ID from label
-            name_to_index = class_data.get('name_to_index', {})
+            name_to_index = load_name_to_index()
         except Exception as e:
             print(f"⚠️ Could not load class_map.json: {e}")
             name_to_index = {}
 
-        for item in feedback_items:
-            # We only want to save "True" detections or "Corrected" ones
-            status = item.get('status')
-            box = item.get('box_2d') # [x, y, w, h]
-
-            final_label = item.get('originalLabel')
-
-            if status == 'ghost':
-                continue # Skip "Bad Box" - don't train on this
-            elif status == 'wrong_label':
-                final_label = item.get('correctedLabel')
-
-            # Normalize label to lowercase for lookup (model returns lowercase, frontend may send uppercase)
-            normalized_label = final_label.lower() if final_label else None
-
-            if box and normalized_label and normalized_label in name_to_index:
-                # Convert label to integer ID (use normalized lowercase)
-                class_id = name_to_index[normalized_label]
-                # Append line: "CLASS_ID x y w h"
-                line = f"{class_id} {box[0]} {box[1]} {box[2]} {box[3]}"
-                label_lines.append(line)
-            else:
-                print(f"⚠️ Label '{final_label}' (normalized: '{normalized_label}') not found in class map or no box provided.")
-
+        label_lines = feedback_label_lines(feedback_items, name_to_index)
         label_content = "\n".join(label_lines)
 
         # --- ONLY SAVE IF THERE'S VALID FEEDBACK ---
@@ -127,69 +181,41 @@ def save_feedback():
                 "location_verified": location_verified
             }), 200
 
-        bucket = storage.bucket(BUCKET_NAME)
+        # --- MOVE IMAGE FIRST — a label without its image would corrupt the training set ---
+        if move_to_training("/feedback", image_id, FEEDBACK_MISSING_WAIT_S) == "missing":
+            return jsonify({"error": "Image upload has not finished yet — please try again"}), 409
 
-        # --- MOVE IMAGE FROM PENDING TO TRAINING_DATA ---
-        pending_path = f"pending_images/{image_id}.jpg"
+        # --- UPLOAD LABEL, SAVE METADATA, AWARD POINTS — concurrently ---
         training_image_path = f"training_data/images/{image_id}.jpg"
-
-        pending_blob = bucket.blob(pending_path)
-        if pending_blob.exists():
-            # Copy to training_data folder
-            bucket.copy_blob(pending_blob, bucket, training_image_path)
-            # Delete from pending folder
-            pending_blob.delete()
-            print(f"✅ Moved image from {pending_path} to {training_image_path}")
-        else:
-            print(f"⚠️ Pending image not found: {pending_path}")
-
-        # --- UPLOAD LABEL FILE TO STORAGE ---
         label_path = f"training_data/labels/{image_id}.txt"
-        label_blob = bucket.blob(label_path)
-        label_blob.upload_from_string(label_content, content_type='text/plain')
-        print(f"✅ Saved label file: {label_path}")
 
-        # --- SAVE METADATA TO FIRESTORE ---
-        # We update the 'feedback' collection to link everything
-        db.collection('feedback').add({
+        writes = [
+            FANOUT.submit(track_call, "gcs", "upload", "/feedback",
+                          STORE.write, label_path, label_content, content_type='text/plain'),
+        ]
+        # We update the 'feedback' collection to link everything (buffered, committed in batches)
+        FEEDBACK_LOG.add('feedback', {
             "image_id": image_id,
-            "image_path": f"training_data/images/{image_id}.jpg",
+            "image_path": training_image_path,
             "label_path": label_path,
             "created_at": datetime.utcnow(),
             "raw_feedback": feedback_items,
-            "location_verified": location_verified
-        })
+            "location_verified": location_verified,
+            "trace_id": current_trace_id()
+        }, route="/feedback")
 
         # --- AWARD POINTS ONLY IF LOCATION VERIFIED ---
         points_added = 0
-
         if location_verified and user_id:
-            # Calculate points based on feedback quality
-            valid_feedback_count = sum(1 for item in feedback_items if item.get('status') in ['correct', 'wrong_label'])
-
             # Award 5 points per valid feedback item (minimum 5, maximum 25)
-            points_added = max(5, min(valid_feedback_count * 5, 25))
-
-            # Update user points in Firestore
-            try:
-                user_ref = db.collection('users').document(user_id)
-                user_doc = user_ref.get()
-
-                if user_doc.exists:
-                    current_points = user_doc.to_dict().get('points', 0)
-                    new_points = current_points + points_added
-                    user_ref.update({
-                        'points': new_points,
-                        'lastUpdated': firestore.SERVER_TIMESTAMP
-                    })
-                    print(f"✅ Awarded {points_added} points to user {user_id}. New balance: {new_points}")
-                else:
-                    print(f"⚠️ User {user_id} not found in Firestore")
-            except Exception as e:
-                print(f"❌ Error updating user points: {e}")
+            points_added = feedback_points(feedback_items)
+            writes.append(FANOUT.submit(award_points, "/feedback", user_id, points_added, image_id))
         else:
             print(f"ℹ️ No points awarded - Location verified: {location_verified}, User ID present: {bool(user_id)}")
 
+        FANOUT.gather(*writes)
+        print(f"✅ Saved label file: {label_path}")
+
         return jsonify({
             "success": True,
             "message": "Training data saved",
@@ -202,17 +228,157 @@ def save_feedback():
         return jsonify({"error": str(e)}), 500
 
 # ── /health ───────────────────────────────────────────────────────────────────
-# Lightweight probe used by Cloud Run to confirm the container is ready to serve.
+# Readiness probe used by Cloud Run to confirm the container is ready to serve.
+# Returns 503 while the startup phases (credentials, weights, model, warmup) run.
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({"status": "active", "mode": "local_inference"}), 200
+    if not STARTUP.is_ready():
+        return jsonify({"status": "starting", "startup": STARTUP.report()}), 503
+    return jsonify({
+        "status": "active",
+        "mode": "local_inference",
+        "model_version": current_model_version() if prediction_service else None,
+        "startup": STARTUP.report(),
+        "model_reload": RELOADER.status(),
+        "memory": memory_report(),
+        "inference_policy": prediction_service.POLICY.status() if prediction_service else None,
+        "prediction_cache": PREDICTIONS.stats(),
+        "shared_config": CONFIG.status(),
+        "feedback_writes": FEEDBACK_LOG.status(),
+        "pending_feed": {"listing": PENDING.stats(), "signed_urls": SIGNED_URLS.stats()}
+    }), 200
+
+# ── /metrics ──────────────────────────────────────────────────────────────────
+# Prometheus scrape target (text format). Stage histograms are recorded where the
+# work happens (prediction_service.py, upload_queue.py, the routes below); the
+# gauges registered in service_core.py are sampled here at scrape time.
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(METRICS.render(), status=200, content_type=METRICS_CONTENT_TYPE)
+
+# ── /admin/reload-model ───────────────────────────────────────────────────────
+# Called by retrain_deployer after a better model is promoted, so running
+# instances switch to it without a new Cloud Run revision. Other instances pick
+# the new generation up on their next poll (MODEL_POLL_INTERVAL_S).
+# Query params: force=1 reloads even if the generation is unchanged,
+#               wait=1 blocks until the swap is done and returns its result,
+#               role=candidate loads the weights as a shadow candidate (see
+#               model_registry.py) instead of swapping them in.
+def _is_admin() -> bool:
+    return bool(ADMIN_TOKEN) and request.headers.get('X-Admin-Token') == ADMIN_TOKEN
+
+
+@app.route('/admin/reload-model', methods=['POST'])
+def reload_model_route():
+    if not _is_admin():
+        return jsonify({"error": "Unauthorized"}), 403
+
+    if prediction_service is None:
+        return jsonify({"error": "Prediction service not available"}), 500
+
+    try:
+        force = _flag('force')
+        role = request.args.get('role') or RELOADER.role
+        if _flag('wait'):
+            result = RELOADER.reload(force, role)
+            return jsonify(result), 200 if "error" not in result else 500
+
+        started = RELOADER.reload_async(force, role)
+        return jsonify({"accepted": started, "model_version": current_model_version()}), 202
+
+    except Exception as e:
+        print(f"❌ Reload Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# ── /admin/promote-model ──────────────────────────────────────────────────────
+# Promote the shadow candidate (or ?version=<resident version>, e.g. to roll back)
+# to the active model once GET /admin/models shows enough agreement.
+@app.route('/admin/promote-model', methods=['POST'])
+def promote_model_route():
+    if not _is_admin():
+        return jsonify({"error": "Unauthorized"}), 403
+
+    if prediction_service is None:
+        return jsonify({"error": "Prediction service not available"}), 500
+
+    try:
+        return jsonify(prediction_service.promote_model(request.args.get('version'))), 200
+    except UnknownModelVersion as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        print(f"❌ Promote Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# ── /admin/models ─────────────────────────────────────────────────────────────
+@app.route('/admin/models', methods=['GET'])
+def models_route():
+    if not _is_admin():
+        return jsonify({"error": "Unauthorized"}), 403
+
+    if prediction_service is None:
+        return jsonify({"error": "Prediction service not available"}), 500
+
+    return jsonify(prediction_service.REGISTRY.status()), 200
+
+# ── /admin/review-queue/backfill ──────────────────────────────────────────────
+# One-off after deploying the review queue: queues the pending_images/ objects
+# uploaded before it existed (idempotent — already queued images are skipped).
+@app.route('/admin/review-queue/backfill', methods=['POST'])
+def backfill_review_queue_route():
+    if not _is_admin():
+        return jsonify({"error": "Unauthorized"}), 403
+    try:
+        return jsonify({"added": backfill_review_queue("/admin/review-queue/backfill")}), 200
+    except Exception as e:
+        print(f"❌ Review Queue Backfill Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# ── /admin/traces, /admin/profile ─────────────────────────────────────────────
+# Slow-request investigation without a redeploy: look up a request's spans by
+# trace_id (returned by /predict and in X-Trace-Id) or image_id, and sample
+# this instance's stacks for a few seconds into a flamegraph file.
+@app.route('/admin/traces', methods=['GET'])
+def traces_route():
+    if not _is_admin():
+        return jsonify({"error": "Unauthorized"}), 403
+
+    traces = find_traces(request.args.get('trace_id'), request.args.get('image_id'))
+    return jsonify({"traces": traces, "count": len(traces)}), 200
+
+
+@app.route('/admin/profile', methods=['GET', 'POST'])
+def profile_route():
+    if not _is_admin():
+        return jsonify({"error": "Unauthorized"}), 403
+
+    if request.method == 'GET':
+        folded = PROFILER.read_latest()
+        if folded is None:
+            return jsonify({"error": "No profile recorded yet", "profiler": PROFILER.status()}), 404
+        return Response(folded, mimetype='text/plain')
+
+    try:
+        seconds = parse_profile_seconds(request.args.get('seconds'))
+    except ValueError:
+        return jsonify({"error": "seconds must be a positive number"}), 400
+    if not PROFILER.start(seconds):
+        return jsonify({"error": "A profile is already running", "profiler": PROFILER.status()}), 409
+    if request.args.get('wait', '0').lower() in ('1', 'true', 'yes'):
+        PROFILER.wait()
+        folded = PROFILER.read_latest()
+        if folded is None:
+            return jsonify({"error": "Profiling failed", "profiler": PROFILER.status()}), 500
+        return Response(folded, mimetype='text/plain')
+    return jsonify({"started": True, "profiler": PROFILER.status()}), 202
 
 # ── /predict ──────────────────────────────────────────────────────────────────
 # Main classification endpoint. Receives a raw photo from the app camera,
-# saves it to GCS pending_images/ (so feedback can reference it later by UUID),
-# then runs YOLOv8 inference and returns all detected objects + annotated image.
+# starts saving it to GCS pending_images/ in the background (so feedback can
+# reference it later by UUID), runs YOLOv8 inference in parallel and returns all
+# detected objects + annotated image without waiting for the upload.
 @app.route('/predict', methods=['POST'])
 def predict_route():
+    start = time.perf_counter()
     if 'file' not in request.files:
         return jsonify({"error": "No file uploaded"}), 400
 
@@ -223,72 +389,206 @@ def predict_route():
     try:
         # 1. Read image bytes
         image_bytes = file.read()
-
-        # 2. Upload to PENDING folder (will be moved to training_data if feedback is submitted)
+        observe_stage("read", time.perf_counter() - start)
+
+        annotate = _flag('annotate')
+        media_type = _response_format()
+
+        # Optional pin to a resident model version (validation / A-B comparisons).
+        # Pinned requests bypass the prediction cache, which follows the active version.
+        pinned = (request.args.get('model_version') or request.form.get('model_version')
+                  or request.headers.get('X-Model-Version'))
+        if pinned:
+            prediction_service.REGISTRY.get(pinned)  # 404 before uploading anything
+
+        # 2. Same photo scanned again (e.g. a retry after a flaky upload)? Reuse the
+        # cached result and the image_id whose pending image is already in GCS
+        digest = content_hash(image_bytes)
+        model_version = current_model_version()
+        cached = PREDICTIONS.get(digest, model_version) if not pinned else None
+        if cached is not None:
+            result = cached_result("/predict", cached, digest, model_version, image_bytes)
+            image_id = result['image_id']
+            annotate_trace(image_id=image_id, cache="hit")
+            if annotate and result.get('detections'):
+                with PREDICT_STAGE_SECONDS.time(stage="render"):
+                    result['annotated_image'] = RENDERS.render(image_id, lambda: (image_bytes, result['detections']))
+            print(f"♻️ Prediction cache hit for image {image_id}")
+            return _prediction_response(result, media_type)
+
+        # 3. Start the upload to the PENDING folder (will be moved to training_data if feedback is submitted)
         # Images in pending_images/ are auto-deleted after a few days via bucket lifecycle rule
+        # The upload runs on the background queue — inference doesn't wait for it
         image_id = str(uuid.uuid4())
-        pending_path = f"pending_images/{image_id}.jpg"
-
-        bucket = storage.bucket(BUCKET_NAME)
-        blob = bucket.blob(pending_path)
-        blob.upload_from_string(image_bytes, content_type='image/jpeg')
+        annotate_trace(image_id=image_id)
+        UPLOADS.submit(image_id, image_bytes)
 
-        # 3. Run Inference
-        result = get_classification_result(image_bytes)
+        # 4. Run Inference (in parallel with the upload)
+        # The annotated image is opt-in — the app draws its own overlay from box_2d
+        result = get_classification_result(image_bytes, annotate=annotate, model_version=pinned)
 
-        # 4. Attach the ID to the response
+        # 5. Attach the ID to the response
         result['image_id'] = image_id
 
-        return jsonify(result)
+        # 6. Keep the source so GET /render/<image_id> can draw it later without re-running
+        # inference, and cache the result for rescans of the same bytes
+        RENDERS.remember(image_id, image_bytes, result.get('detections', []))
+        if not pinned:
+            PREDICTIONS.put(digest, model_version, image_id, result)
 
+        return _prediction_response(result, media_type)
+
+    except UnsupportedFormat as e:
+        return jsonify({"error": str(e)}), 406
+    except UnknownModelVersion as e:
+        return jsonify({"error": str(e)}), 404
     except Exception as e:
         print(f"❌ Prediction Error: {e}")
         return jsonify({"error": str(e)}), 500
 
+# ── /predict/batch ────────────────────────────────────────────────────────────
+# Several photos in one multipart request (repeated "files" parts, or repeated
+# "file"), e.g. a bin's contents photographed piece by piece. Cache misses go
+# through one batched forward pass, every new image is queued for upload at once
+# (the upload queue runs them concurrently), and the response has one
+# /predict-schema result per image, in request order, each with its own image_id.
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch_route():
+    start = time.perf_counter()
+    files = request.files.getlist('files') + request.files.getlist('file')
+    if not files:
+        return jsonify({"error": "No files uploaded"}), 400
+    if len(files) > PREDICT_BATCH_MAX_IMAGES:
+        return jsonify({"error": f"Too many images (max {PREDICT_BATCH_MAX_IMAGES})"}), 413
+
+    if get_classification_result is None:
+        return jsonify({"error": "Prediction service not available"}), 500
+
+    try:
+        media_type = _response_format()
+        pinned = (request.args.get('model_version') or request.form.get('model_version')
+                  or request.headers.get('X-Model-Version'))
+        if pinned:
+            prediction_service.REGISTRY.get(pinned)
+
+        images = [f.read() for f in files]
+        observe_stage("read", time.perf_counter() - start)
+        results = predict_many(images, _flag('annotate'), pinned)
+        return _prediction_response({"results": results, "count": len(results)}, media_type)
+
+    except UnsupportedFormat as e:
+        return jsonify({"error": str(e)}), 406
+    except UnknownModelVersion as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        print(f"❌ Batch Prediction Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# ── /render/<image_id> ────────────────────────────────────────────────────────
+# Annotated JPEG for a prediction, drawn on demand with the lightweight renderer
+# on a downscaled copy and cached by image_id. If this instance no longer has the
+# source (evicted, or the prediction ran elsewhere), the pending image is fetched
+# from GCS and re-classified.
+@app.route('/render/<image_id>', methods=['GET'])
+def render_annotated_image(image_id):
+    if get_classification_result is None:
+        return jsonify({"error": "Prediction service not available"}), 500
+
+    try:
+        jpeg_bytes = RENDERS.render(image_id, lambda: load_pending_for_render(image_id))
+        if jpeg_bytes is None:
+            return jsonify({"error": "Image not found"}), 404
+        return Response(jpeg_bytes, mimetype='image/jpeg',
+                        headers={"Cache-Control": "private, max-age=3600"})
+    except Exception as e:
+        print(f"❌ Render Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
 # ── /pending-images ───────────────────────────────────────────────────────────
 # Community review feed. Returns images that were uploaded via /predict but
 # whose owner never submitted feedback (e.g. app closed, no correction made).
 # The CommunityReviewScreen fetches these and lets other users annotate them,
 # giving the ML pipeline additional labeled training data it wouldn't otherwise have.
+# Near-identical photos (same dHash within DUPLICATE_MAX_DISTANCE bits) are folded
+# into one entry whose duplicate_ids lists the others, so reviewers only see each item once.
+# GET is a cached, cursor-paginated view of the review queue's indexed query
+# (pending_feed.py); the screen then claims what it shows so no two reviewers
+# annotate the same image (review_queue.py). Signed URLs are reused until close to expiry.
 @app.route('/pending-images', methods=['GET'])
 def get_pending_images():
-    """Get a batch of pending images for community review (max 10 at a time)"""
+    """Get a page of pending images for community review (?page_size=, ?page_token=)"""
     try:
-        bucket = storage.bucket(BUCKET_NAME)
-        blobs = bucket.list_blobs(prefix="pending_images/", max_results=10)
-
-        pending_items = []
-        for blob in blobs:
-            # Skip the folder itself
-            if blob.name == "pending_images/":
-                continue
-
-            # Extract image_id from path (e.g., "pending_images/uuid.jpg" -> "uuid")
-            image_id = blob.name.replace("pending_images/", "").replace(".jpg", "")
-
-            # Generate a signed URL for viewing (valid for 1 hour)
-            signed_url = blob.generate_signed_url(
-                version="v4",
-                expiration=3600,  # 1 hour
-                method="GET"
-            )
-
-            pending_items.append({
-                "image_id": image_id,
-                "image_url": signed_url,
-                "created_at": blob.time_created.isoformat() if blob.time_created else None
-            })
+        try:
+            page_size = parse_page_size(request.args.get('page_size'))
+            kept, next_page_token = PENDING.page(request.args.get('page_token'), page_size)
+        except InvalidPageToken as e:
+            return jsonify({"error": str(e)}), 400
+        except ValueError:
+            return jsonify({"error": "page_size must be an integer"}), 400
+
+        pending_items = [pending_image_entry(item, SIGNED_URLS.get(item["object"])) for item in kept]
 
         return jsonify({
             "success": True,
             "pending_images": pending_items,
-            "count": len(pending_items)
+            "count": len(pending_items),
+            "next_page_token": next_page_token
         }), 200
 
     except Exception as e:
         print(f"❌ Pending Images Error: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/pending-images/claim', methods=['POST'])
+def claim_pending_images():
+    """Lease pending images to a reviewer for REVIEW_LEASE_S so nobody else gets them.
+
+    Expected payload:
+    {
+        "user_id": "firebase-uid",
+        "count": 10,                       # optional, default/max as for page_size
+        "image_ids": ["uuid", ...]         # optional, claimed first (the page already shown)
+    }
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            reviewer_id, image_ids = review_request(data)
+            count = parse_page_size(data.get('count'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        claimed = claim_pending("/pending-images/claim", reviewer_id, count, image_ids)
+        pending_items = [pending_image_entry(item, SIGNED_URLS.get(item["object"])) for item in claimed]
+
+        return jsonify({
+            "success": True,
+            "pending_images": pending_items,
+            "count": len(pending_items),
+            "lease_seconds": REVIEW_QUEUE.lease_s
+        }), 200
+
+    except Exception as e:
+        print(f"❌ Claim Pending Images Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/pending-images/release', methods=['POST'])
+def release_pending_images():
+    """Hand leased images back to the queue (skipped, or the reviewer left the screen)."""
+    try:
+        try:
+            reviewer_id, image_ids = review_request(request.get_json(silent=True) or {})
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        released = track_call("firestore", "transaction", "/pending-images/release",
+                              REVIEW_QUEUE.release, reviewer_id, image_ids)
+        return jsonify({"success": True, "released": released}), 200
+
+    except Exception as e:
+        print(f"❌ Release Pending Images Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/community-feedback', methods=['POST'])
 def save_community_feedback():
     """Save user-drawn bounding box annotations from community review.
@@ -296,7 +596,7 @@ def save_community_feedback():
     Expected payload:
       {
         "image_id": "...",
-        "user_id": "...",
+        "user_id": "...",   // required: the reviewer holding the lease (uid or per-session id)
         "boxes": [
           {"label": "plastic", "box": [x_center, y_center, w, h]},  // normalized 0-1
           ...
@@ -306,39 +606,27 @@ def save_community_feedback():
     try:
         data = request.json
         image_id = data.get('image_id')
-        user_id = data.get('user_id')
         boxes = data.get('boxes', [])
 
         if not image_id:
             return jsonify({"error": "Missing image_id"}), 400
+        try:
+            user_id = parse_reviewer_id(data.get('user_id'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         if not boxes:
             return jsonify({"error": "No boxes provided — draw at least one bounding box"}), 400
+        annotate_trace(image_id=image_id)
 
         # Load class map
         try:
-            base_dir = os.path.dirname(os.path.abspath(__file__))
-            class_map_path = os.path.join(base_dir, 'shared', 'class_map.json')
-            import json
-            with open(class_map_path, 'r') as f:
-                class_data = json.load(f)
-            name_to_index = class_data.get('name_to_index', {})
+            name_to_index = load_name_to_index()
         except Exception as e:
             print(f"⚠️ Could not load class_map.json: {e}")
             return jsonify({"error": "Server configuration error"}), 500
 
         # Build YOLO label file — one line per box
-        label_lines = []
-        for item in boxes:
-            label = (item.get('label') or '').lower()
-            box = item.get('box')  # [x_center, y_center, w, h] normalized 0-1
-            if label not in name_to_index:
-                print(f"⚠️ Skipping unknown label: '{label}'")
-                continue
-            if not box or len(box) != 4:
-                print(f"⚠️ Skipping malformed box: {box}")
-                continue
-            class_id = name_to_index[label]
-            label_lines.append(f"{class_id} {box[0]} {box[1]} {box[2]} {box[3]}")
+        label_lines = community_label_lines(boxes, name_to_index)
 
         if not label_lines:
             return jsonify({"error": "No valid boxes after processing"}), 400
@@ -346,28 +634,23 @@ def save_community_feedback():
         label_content = "\n".join(label_lines)
         print(f"📝 Community YOLO labels ({len(label_lines)} boxes):\n{label_content}")
 
-        bucket = storage.bucket(BUCKET_NAME)
-
-        # Move image from pending to training_data
-        pending_path = f"pending_images/{image_id}.jpg"
-        training_image_path = f"training_data/images/{image_id}.jpg"
+        # Only the reviewer holding the lease (or anyone, once it has expired) may submit
+        if not take_for_review("/community-feedback", user_id, image_id):
+            return jsonify({"error": "Image is being reviewed by someone else"}), 409
 
-        pending_blob = bucket.blob(pending_path)
-        if pending_blob.exists():
-            bucket.copy_blob(pending_blob, bucket, training_image_path)
-            pending_blob.delete()
-            print(f"✅ Moved image from {pending_path} to {training_image_path}")
-        else:
+        # Move image from pending to training_data — the first reviewer to get there wins
+        moved = move_to_training("/community-feedback", image_id)
+        if moved == "missing":
             return jsonify({"error": "Image not found in pending folder"}), 404
+        if moved == "already_moved":
+            return jsonify({"error": "Image was already annotated"}), 409
 
-        # Save label file
+        # Save label file; the Firestore metadata is buffered and committed in batches
+        training_image_path = f"training_data/images/{image_id}.jpg"
         label_path = f"training_data/labels/{image_id}.txt"
-        label_blob = bucket.blob(label_path)
-        label_blob.upload_from_string(label_content, content_type='text/plain')
-        print(f"✅ Saved community label file: {label_path}")
-
-        # Save metadata to Firestore
-        db.collection('community_feedback').add({
+        track_call("gcs", "upload", "/community-feedback",
+                   STORE.write, label_path, label_content, content_type='text/plain')
+        FEEDBACK_LOG.add('community_feedback', {
             "image_id": image_id,
             "image_path": training_image_path,
             "label_path": label_path,
@@ -375,8 +658,10 @@ def save_community_feedback():
             "box_count": len(label_lines),
             "reviewer_id": user_id,
             "created_at": datetime.utcnow(),
-            "source": "community_review"
-        })
+            "source": "community_review",
+            "trace_id": current_trace_id()
+        }, route="/community-feedback")
+        print(f"✅ Saved community label file: {label_path}")
 
         return jsonify({
             "success": True,
@@ -391,11 +676,8 @@ def save_community_feedback():
 def delete_pending_image(image_id):
     """Remove a duplicate or unwanted image from the pending review queue."""
     try:
-        bucket = storage.bucket(BUCKET_NAME)
         pending_path = f"pending_images/{image_id}.jpg"
-        blob = bucket.blob(pending_path)
-        if blob.exists():
-            blob.delete()
+        if remove_pending_image("/pending-images/<image_id>", image_id):
             print(f"🗑️ Deleted duplicate pending image: {pending_path}")
             return jsonify({"success": True, "message": "Image removed from queue"}), 200
         else:
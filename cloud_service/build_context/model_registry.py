@@ -0,0 +1,242 @@
+"""
+model_registry.py — Resident model versions, pinning and shadow-inference stats.
+
+prediction_service.py used to hold exactly one MODEL. ModelRegistry keeps a few
+LoadedModel snapshots resident at once so that:
+
+  - a request can pin a version (POST /predict?model_version=...), e.g. to compare
+    the previous and the current model on the same photo;
+  - a candidate model (a retrained best_latest.pt that has not been promoted yet)
+    can run in shadow: a SHADOW_FRACTION sample of /predict traffic is also sent
+    through it asynchronously, after the response has been computed, and the
+    agreement/latency against the serving model is recorded in ShadowStats;
+  - rollback to the previous version is a promote, not a download.
+
+Memory accounting: each entry records the process RSS growth measured while its
+engine was loaded (approximate — other threads allocate too) and the size of the
+file the engine was loaded from. At most MODEL_REGISTRY_MAX versions stay
+resident; the least recently used one that is neither active nor the candidate
+is evicted first.
+"""
+
+import os
+import time
+import threading
+from typing import Any, Dict, List, Optional
+
+MODEL_REGISTRY_MAX  = int(os.getenv("MODEL_REGISTRY_MAX", "3"))
+SHADOW_FRACTION     = float(os.getenv("SHADOW_FRACTION", "0.1"))
+SHADOW_MAX_INFLIGHT = int(os.getenv("SHADOW_MAX_INFLIGHT", "4"))
+
+
+class UnknownModelVersion(LookupError):
+    """A request pinned a model version that is not resident in this process."""
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process (Linux /proc; 0 where unavailable)."""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+def path_size_bytes(path: str) -> int:
+    """Size of a model file, or of an export directory (OpenVINO) summed over its files."""
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(path) for name in names)
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class _Latency:
+    """Running count / mean / max of a latency in seconds."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max   = 0.0
+
+    def add(self, seconds: float, n: int = 1) -> None:
+        self.count += n
+        self.total += seconds * n
+        self.max    = max(self.max, seconds)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "count":   self.count,
+            "mean_ms": round(1000 * self.total / self.count, 2) if self.count else None,
+            "max_ms":  round(1000 * self.max, 2),
+        }
+
+
+class ShadowStats:
+    """Agreement and latency of a candidate model against the serving model on sampled traffic."""
+
+    def __init__(self, candidate_version: Optional[str] = None):
+        self.candidate_version = candidate_version
+        self.samples        = 0
+        self.top1_agree     = 0
+        self.count_agree    = 0
+        self.errors         = 0
+        self.dropped        = 0
+        self.primary        = _Latency()
+        self.shadow         = _Latency()
+        self.disagreements: Dict[str, int] = {}
+
+    def record(self, primary_top1: str, shadow_top1: str, primary_count: int, shadow_count: int,
+               primary_s: float, shadow_s: float) -> None:
+        self.samples += 1
+        self.top1_agree  += primary_top1 == shadow_top1
+        self.count_agree += primary_count == shadow_count
+        if primary_top1 != shadow_top1:
+            key = f"{primary_top1}->{shadow_top1}"
+            self.disagreements[key] = self.disagreements.get(key, 0) + 1
+        self.primary.add(primary_s)
+        self.shadow.add(shadow_s)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "candidate_version": self.candidate_version,
+            "samples":           self.samples,
+            "top1_agreement":    round(self.top1_agree / self.samples, 4) if self.samples else None,
+            "count_agreement":   round(self.count_agree / self.samples, 4) if self.samples else None,
+            "errors":            self.errors,
+            "dropped":           self.dropped,
+            "primary_latency":   self.primary.as_dict(),
+            "shadow_latency":    self.shadow.as_dict(),
+            "top_disagreements": dict(sorted(self.disagreements.items(), key=lambda kv: -kv[1])[:10]),
+        }
+
+
+class ModelRegistry:
+    """Thread-safe map of resident model versions → LoadedModel plus per-version accounting."""
+
+    def __init__(self, max_models: int = MODEL_REGISTRY_MAX,
+                 shadow_fraction: float = SHADOW_FRACTION,
+                 shadow_max_inflight: int = SHADOW_MAX_INFLIGHT):
+        self.max_models        = max(1, max_models)
+        self.shadow_fraction   = min(1.0, max(0.0, shadow_fraction))
+        self._shadow_slots     = threading.BoundedSemaphore(max(1, shadow_max_inflight))
+        self._lock             = threading.Lock()
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self.active_version: Optional[str]    = None
+        self.candidate_version: Optional[str] = None
+        self.shadow            = ShadowStats()
+
+    # ── Membership ────────────────────────────────────────────────────────────
+    def register(self, model: Any, rss_delta: int, path: str) -> None:
+        """Add (or replace) a resident version. model is a prediction_service.LoadedModel."""
+        with self._lock:
+            self._models[model.version] = {
+                "model":      model,
+                "path":       path,
+                "rss_bytes":  max(0, rss_delta),
+                "file_bytes": path_size_bytes(model.engine.model_path),
+                "loaded_at":  time.time(),
+                "last_used":  time.time(),
+                "latency":    _Latency(),
+            }
+            self._evict(keep=model.version)  # a fresh load is about to be activated or shadowed
+
+    def get(self, version: str) -> Any:
+        """Resident LoadedModel for version, or raise UnknownModelVersion."""
+        with self._lock:
+            entry = self._models.get(version)
+            if entry is None:
+                raise UnknownModelVersion(f"Model version '{version}' is not loaded "
+                                          f"(resident: {', '.join(self._models) or 'none'})")
+            entry["last_used"] = time.time()
+            return entry["model"]
+
+    def versions(self) -> List[str]:
+        with self._lock:
+            return list(self._models)
+
+    def mark_active(self, version: str) -> None:
+        with self._lock:
+            self.active_version = version
+            if self.candidate_version == version:
+                self.candidate_version = None
+            self._evict()
+
+    def set_candidate(self, version: Optional[str]) -> None:
+        """Shadow version (None stops shadowing). Resets the shadow stats."""
+        with self._lock:
+            if version is not None and version not in self._models:
+                raise UnknownModelVersion(f"Model version '{version}' is not loaded")
+            self.candidate_version = version
+            self.shadow = ShadowStats(version)
+
+    def candidate(self) -> Any:
+        with self._lock:
+            entry = self._models.get(self.candidate_version) if self.candidate_version else None
+            return entry["model"] if entry is not None else None
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        protected = {self.active_version, self.candidate_version, keep}
+        while len(self._models) > self.max_models:
+            evictable = [v for v in self._models if v not in protected]
+            if not evictable:
+                return
+            oldest = min(evictable, key=lambda v: self._models[v]["last_used"])
+            del self._models[oldest]
+            print(f"🗑️ Evicted model {oldest} from the registry")
+
+    # ── Accounting ────────────────────────────────────────────────────────────
+    def record_latency(self, version: str, seconds: float, n_images: int) -> None:
+        """Forward-pass time of one batch of n_images on version."""
+        with self._lock:
+            entry = self._models.get(version)
+            if entry is not None:
+                entry["latency"].add(seconds / max(1, n_images), max(1, n_images))
+
+    def try_shadow_slot(self) -> bool:
+        """Bound concurrent shadow inferences; a sample is dropped rather than queued."""
+        if self._shadow_slots.acquire(blocking=False):
+            return True
+        with self._lock:
+            self.shadow.dropped += 1
+        return False
+
+    def release_shadow_slot(self) -> None:
+        self._shadow_slots.release()
+
+    def record_shadow(self, **kwargs) -> None:
+        with self._lock:
+            self.shadow.record(**kwargs)
+
+    def record_shadow_error(self) -> None:
+        with self._lock:
+            self.shadow.errors += 1
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {
+                version: {
+                    "generation":        entry["model"].generation,
+                    "engine":            entry["model"].engine.name,
+                    "path":              entry["path"],
+                    "rss_mb":            round(entry["rss_bytes"] / 1024 / 1024, 1),
+                    "file_mb":           round(entry["file_bytes"] / 1024 / 1024, 1),
+                    "loaded_at":         entry["loaded_at"],
+                    "latency_per_image": entry["latency"].as_dict(),
+                }
+                for version, entry in self._models.items()
+            }
+            return {
+                "active_version":    self.active_version,
+                "candidate_version": self.candidate_version,
+                "max_models":        self.max_models,
+                "shadow_fraction":   self.shadow_fraction,
+                "process_rss_mb":    round(rss_bytes() / 1024 / 1024, 1),
+                "models":            models,
+                "shadow":            self.shadow.as_dict(),
+            }
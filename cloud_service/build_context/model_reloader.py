@@ -0,0 +1,103 @@
+"""
+model_reloader.py — Hot reload of best_latest.pt without a new Cloud Run revision.
+
+Until now a retrained model only went live when retrain_deployer forced a new
+revision: every instance cold-started, re-downloaded the weights and re-warmed.
+ModelReloader lets running instances pick up the new weights themselves:
+
+  - Polling: a daemon thread checks the blob's generation every
+    MODEL_POLL_INTERVAL_S seconds (one metadata request; 0 disables polling).
+  - On demand: POST /admin/reload-model calls reload() directly, e.g. from
+    retrain_deployer right after a better model is promoted.
+
+A reload downloads the new generation, loads and warms a second engine while the
+current one keeps serving, then swaps prediction_service.ACTIVE in one step
+(see prediction_service.reload_model). Reloads are serialized, so a poll and an
+admin call can never load the same weights twice at once. A failed reload is
+logged and leaves the serving model untouched.
+
+With MODEL_RELOAD_ROLE=candidate new weights are not swapped in: they are loaded as
+the registry's shadow candidate (see model_registry.py) and only go live through
+POST /admin/promote-model.
+"""
+
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, Optional
+
+MODEL_POLL_INTERVAL_S = float(os.getenv("MODEL_POLL_INTERVAL_S", "300"))
+MODEL_RELOAD_ROLE     = os.getenv("MODEL_RELOAD_ROLE", "active")  # "active" or "candidate"
+
+
+class ModelReloader:
+    """Serializes hot reloads and optionally polls for new weights in the background."""
+
+    def __init__(self, reload_fn: Callable[[bool, str], Dict[str, Any]],
+                 poll_interval_s: float = MODEL_POLL_INTERVAL_S,
+                 role: str = MODEL_RELOAD_ROLE):
+        self._reload_fn     = reload_fn
+        self.poll_interval  = max(0.0, poll_interval_s)
+        self.role           = role
+        self._reload_lock   = threading.Lock()
+        self._lock          = threading.Lock()
+        self._thread        = None
+        self._pid           = None
+        self._reloading     = False
+        self.reloads        = 0
+        self.failures       = 0
+        self.last_check     = None
+        self.last_result: Optional[Dict[str, Any]] = None
+
+    def reload(self, force: bool = False, role: Optional[str] = None) -> Dict[str, Any]:
+        """Check for (and load) a new generation. Blocks while another reload runs."""
+        with self._reload_lock:
+            self._reloading = True
+            try:
+                result = self._reload_fn(force, role or self.role)
+                if result.get("reloaded"):
+                    self.reloads += 1
+            except Exception as e:
+                print(f"❌ Model reload failed (still serving the previous model): {e}")
+                self.failures += 1
+                result = {"reloaded": False, "error": str(e)}
+            finally:
+                self._reloading = False
+                self.last_check = time.time()
+            self.last_result = result
+            return result
+
+    def reload_async(self, force: bool = False, role: Optional[str] = None) -> bool:
+        """Start a reload on a background thread. Returns False if one is already running."""
+        if self._reloading:
+            return False
+        threading.Thread(target=self.reload, args=(force, role), name="model-reload", daemon=True).start()
+        return True
+
+    def start_polling(self) -> None:
+        """Start the poll thread (no-op if polling is disabled or already running in this process)."""
+        if self.poll_interval <= 0:
+            return
+        with self._lock:
+            # Re-created after a fork so the poller runs in the serving process
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid    = os.getpid()
+            self._thread = threading.Thread(target=self._poll, name="model-poller", daemon=True)
+            self._thread.start()
+
+    def _poll(self) -> None:
+        while True:
+            time.sleep(self.poll_interval)
+            self.reload()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "poll_interval_s": self.poll_interval,
+            "role":            self.role,
+            "reloading":       self._reloading,
+            "reloads":         self.reloads,
+            "failures":        self.failures,
+            "last_check":      self.last_check,
+            "last_result":     self.last_result,
+        }
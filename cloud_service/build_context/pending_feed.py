@@ -0,0 +1,209 @@
+"""
+pending_feed.py — Cached, paginated view of the review queue for GET /pending-images.
+
+Every /pending-images call used to list the bucket prefix and V4-sign a URL for
+each returned blob (an RSA signature per image), and every reviewer got the same
+first 10 images. The PrefetchContext fires the call for every user right after
+login, so it's hot. The images now come from the review queue (review_queue.py):
+
+  PendingFeed      keeps the result of the queue's indexed query (available
+                   entries in review order) per process and re-runs it at most
+                   every PENDING_LIST_TTL_S (concurrent requests share the
+                   refresh). page(token, size) walks that list:
+                     - the returned page_token is a cursor (the review-order key
+                       of the last entry consumed), not an offset, so pages stay
+                       consistent across refreshes and instances
+                     - near-duplicates are collapsed per page (duplicate_index.py);
+                       images folded into an entry are consumed with it and don't
+                       come back on the next page
+                   This is a read-only preview — reviewers don't collide because
+                   the screen claims what it shows (POST /pending-images/claim).
+                   Images that leave the queue on this instance are discarded from
+                   the cached list at once; other instances drop them on refresh.
+  SignedUrlCache   signs URLs valid for SIGNED_URL_TTL_S and hands the same URL
+                   out again until less than SIGNED_URL_MIN_REMAINING_S is left,
+                   so a reviewer always has at least that long to load it.
+
+Page size: ?page_size= (default PENDING_PAGE_SIZE, at most PENDING_MAX_PAGE_SIZE).
+"""
+
+import os
+import json
+import time
+import base64
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from duplicate_index import DuplicateIndex, hex_to_hash
+
+PENDING_PREFIX             = "pending_images/"
+PENDING_PAGE_SIZE          = int(os.getenv("PENDING_PAGE_SIZE", "10"))
+PENDING_MAX_PAGE_SIZE      = int(os.getenv("PENDING_MAX_PAGE_SIZE", "50"))
+PENDING_SCAN_FACTOR        = 4  # look at extra entries so collapsing still fills a page
+PENDING_LIST_TTL_S         = float(os.getenv("PENDING_LIST_TTL_S", "5"))
+PENDING_LIST_LIMIT         = int(os.getenv("PENDING_LIST_LIMIT", "2000"))
+SIGNED_URL_TTL_S           = int(os.getenv("SIGNED_URL_TTL_S", "3600"))
+SIGNED_URL_MIN_REMAINING_S = int(os.getenv("SIGNED_URL_MIN_REMAINING_S", "900"))
+SIGNED_URL_CACHE_SIZE      = int(os.getenv("SIGNED_URL_CACHE_SIZE", "4096"))
+
+# Review order of a queue entry: priority desc, enqueued_at asc, then image_id
+ReviewKey = Tuple[float, float, str]
+
+
+class InvalidPageToken(ValueError):
+    pass
+
+
+def review_key(entry: Dict[str, Any]) -> ReviewKey:
+    return (-entry["priority"], entry["enqueued_at"], entry["image_id"])
+
+
+def encode_page_token(after: ReviewKey) -> str:
+    raw = json.dumps(list(after), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_page_token(text: str) -> ReviewKey:
+    try:
+        priority, enqueued_at, image_id = json.loads(base64.urlsafe_b64decode(text + "=" * (-len(text) % 4)))
+        return (float(priority), float(enqueued_at), str(image_id))
+    except Exception:
+        raise InvalidPageToken("Invalid page_token")
+
+
+def parse_page_size(value: Optional[str]) -> int:
+    """?page_size= clamped to 1..PENDING_MAX_PAGE_SIZE (ValueError if it isn't a number)."""
+    if value in (None, ""):
+        return PENDING_PAGE_SIZE
+    return max(1, min(int(value), PENDING_MAX_PAGE_SIZE))
+
+
+class PendingFeed:
+    """TTL-cached review queue entries, served as cursor-paginated, duplicate-collapsed pages."""
+
+    def __init__(self, list_fn: Callable[[], List[Dict[str, Any]]], duplicates: DuplicateIndex,
+                 ttl_s: float = PENDING_LIST_TTL_S):
+        self._list_fn    = list_fn
+        self._duplicates = duplicates
+        self._ttl_s      = ttl_s
+        self._lock       = threading.Lock()
+        self._refresh    = threading.Lock()
+        self._entries: List[Dict[str, Any]] = []
+        self._listed_at  = None
+        self.hits        = 0
+        self.misses      = 0
+
+    def listing(self) -> List[Dict[str, Any]]:
+        """The cached queue entries in review order; queried again once older than ttl_s."""
+        entries = self._cached()
+        if entries is not None:
+            return entries
+        with self._refresh:
+            entries = self._cached()  # another request may have refreshed it while we waited
+            if entries is not None:
+                return entries
+            entries = sorted(self._list_fn(), key=review_key)
+            with self._lock:
+                self.misses += 1
+                self._entries, self._listed_at = entries, time.monotonic()
+            return entries
+
+    def page(self, page_token: Optional[str], page_size: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Up to page_size collapsed queue entries (each gains "duplicate_ids") and the next page's token."""
+        entries = self.listing()
+        window = entries
+        if page_token:
+            after = decode_page_token(page_token)
+            window = entries[bisect_right([review_key(entry) for entry in entries], after):]
+        scan = window[:page_size * PENDING_SCAN_FACTOR]
+
+        kept = self._duplicates.collapse([
+            {**entry, "dhash": hex_to_hash(entry.get("dhash"))} for entry in scan
+        ], page_size)
+
+        # Everything up to the first entry that is neither returned nor folded into
+        # a returned entry has been handed out; the next page resumes after it
+        handed_out = {item["image_id"] for item in kept}
+        handed_out.update(duplicate for item in kept for duplicate in item["duplicate_ids"])
+        consumed = 0
+        while consumed < len(scan) and scan[consumed]["image_id"] in handed_out:
+            consumed += 1
+        if consumed == 0 or consumed == len(window):
+            return kept, None
+        return kept, encode_page_token(review_key(scan[consumed - 1]))
+
+    def discard(self, image_ids: List[str]) -> None:
+        """image_ids left the queue or were claimed on this instance — stop handing them out before the refresh."""
+        gone = set(image_ids)
+        with self._lock:
+            self._entries = [entry for entry in self._entries if entry["image_id"] not in gone]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            listed_at = self._listed_at
+            return {
+                "listed":        len(self._entries),
+                "listing_age_s": round(time.monotonic() - listed_at, 1) if listed_at is not None else None,
+                "hits":          self.hits,
+                "misses":        self.misses,
+            }
+
+    def _cached(self) -> Optional[List[Dict[str, Any]]]:
+        """The cached entries if they're younger than ttl_s (counted as a hit), else None."""
+        with self._lock:
+            if self._listed_at is None or time.monotonic() - self._listed_at >= self._ttl_s:
+                return None
+            self.hits += 1
+            return self._entries
+
+
+class SignedUrlCache:
+    """Reuses V4 signed URLs per object name until they get close to expiry."""
+
+    def __init__(self, sign_fn: Callable[[str, int], str],
+                 ttl_s: int = SIGNED_URL_TTL_S,
+                 min_remaining_s: int = SIGNED_URL_MIN_REMAINING_S,
+                 max_entries: int = SIGNED_URL_CACHE_SIZE):
+        self._sign_fn         = sign_fn
+        self._ttl_s           = ttl_s
+        self._min_remaining_s = min(min_remaining_s, ttl_s // 2)
+        self._max_entries     = max(1, max_entries)
+        self._lock            = threading.Lock()
+        self._urls: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.hits             = 0
+        self.misses           = 0
+
+    def cached(self, name: str) -> Optional[str]:
+        """The cached URL for name if it's still valid for long enough, else None."""
+        with self._lock:
+            entry = self._urls.get(name)
+            if entry is None or entry[1] - time.time() < self._min_remaining_s:
+                return None
+            self._urls.move_to_end(name)
+            self.hits += 1
+            return entry[0]
+
+    def sign(self, name: str) -> str:
+        """Sign a fresh URL for name and cache it."""
+        expires_at = time.time() + self._ttl_s
+        url = self._sign_fn(name, self._ttl_s)
+        with self._lock:
+            self.misses += 1
+            self._urls[name] = (url, expires_at)
+            self._urls.move_to_end(name)
+            while len(self._urls) > self._max_entries:
+                self._urls.popitem(last=False)
+        return url
+
+    def get(self, name: str) -> str:
+        return self.cached(name) or self.sign(name)
+
+    def discard(self, name: str) -> None:
+        with self._lock:
+            self._urls.pop(name, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._urls), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,200 @@
+"""
+prediction_cache.py — Content-hash cache of /predict results.
+
+Users often rescan the exact same photo (retries after a flaky mobile upload,
+double taps). Without a cache every rescan re-runs YOLO and stores another copy
+of the image in pending_images/. PredictionCache keys results by the SHA-256 of
+the uploaded bytes together with the model version, so a hit returns the cached
+result and the image_id of the copy that was already uploaded (service_core.cached_result
+checks that copy is still pending — another instance may have consumed it).
+
+  - In-process LRU bounded by PREDICTION_CACHE_MB (size of the serialized results).
+  - Optional disk tier under PREDICTION_CACHE_DIR (one JSON file per entry,
+    bounded by PREDICTION_CACHE_DISK_MB) that survives worker restarts.
+  - Invalidates automatically: when the model version changes, the memory tier is
+    cleared and the disk tier for the old version is deleted.
+  - discard_image(image_id) drops an entry once its pending image has been
+    consumed by /feedback or /community-feedback, so a rescan after that starts fresh.
+
+Cached results never contain the annotated image — annotation is rendered per
+request from the bytes in hand (see annotated_renderer.py).
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+PREDICTION_CACHE_MB      = float(os.getenv("PREDICTION_CACHE_MB", "16"))
+PREDICTION_CACHE_DIR     = os.getenv("PREDICTION_CACHE_DIR", "")
+PREDICTION_CACHE_DISK_MB = float(os.getenv("PREDICTION_CACHE_DISK_MB", "256"))
+
+
+def content_hash(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class PredictionCache:
+    """LRU of {"image_id": ..., "result": {...}} keyed by (model_version, sha256)."""
+
+    def __init__(self, max_mb: float = PREDICTION_CACHE_MB,
+                 disk_dir: str = PREDICTION_CACHE_DIR,
+                 disk_max_mb: float = PREDICTION_CACHE_DISK_MB):
+        self.max_bytes      = int(max_mb * 1024 * 1024)
+        self.disk_dir       = disk_dir or None
+        self.disk_max_bytes = int(disk_max_mb * 1024 * 1024)
+        self.size           = 0
+        self.hits           = 0
+        self.misses         = 0
+        self.evictions      = 0
+        self._lock          = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], int]]" = OrderedDict()
+        self._by_image_id: Dict[str, str] = {}
+        self._model_version: Optional[str] = None
+        self._disk_size     = 0
+
+    # ── Public API ────────────────────────────────────────────────────────────
+    def get(self, digest: str, model_version: str) -> Optional[Dict[str, Any]]:
+        """Return {"image_id", "result"} for a previously seen image, or None."""
+        with self._lock:
+            self._check_version(model_version)
+            item = self._entries.get(digest)
+            if item is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return item[0]
+
+        entry = self._read_disk(digest, model_version)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._insert(digest, entry)
+            return entry
+
+    def put(self, digest: str, model_version: str, image_id: str, result: Dict[str, Any]) -> None:
+        entry = {"image_id": image_id, "result": {**result, "annotated_image": None}}
+        with self._lock:
+            self._check_version(model_version)
+            if self._model_version != model_version:
+                return  # a newer model took over while this request was running
+            self._insert(digest, entry)
+        self._write_disk(digest, model_version, entry)
+
+    def discard_image(self, image_id: str) -> None:
+        """Forget the entry that points at image_id (its pending image has been consumed)."""
+        with self._lock:
+            digest = self._by_image_id.pop(image_id, None)
+            if digest is None:
+                return
+            self._remove(digest)
+            version = self._model_version
+        if self.disk_dir and version:
+            try:
+                os.remove(self._disk_path(digest, version))
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries":       len(self._entries),
+                "bytes":         self.size,
+                "hits":          self.hits,
+                "misses":        self.misses,
+                "evictions":     self.evictions,
+                "hit_rate":      round(self.hits / lookups, 3) if lookups else 0.0,
+                "model_version": self._model_version,
+            }
+
+    # ── Memory tier ───────────────────────────────────────────────────────────
+    def _check_version(self, model_version: str) -> None:
+        if model_version == self._model_version:
+            return
+        if self._model_version is not None:
+            print(f"♻️ Model version changed ({self._model_version} → {model_version}) — clearing prediction cache")
+            self._drop_disk_version(self._model_version)
+        elif self.disk_dir and os.path.isdir(self.disk_dir):
+            # First lookup in this process — entries left behind by older models are stale
+            for name in os.listdir(self.disk_dir):
+                if os.path.join(self.disk_dir, name) != self._version_dir(model_version):
+                    shutil.rmtree(os.path.join(self.disk_dir, name), ignore_errors=True)
+        self._entries.clear()
+        self._by_image_id.clear()
+        self.size = 0
+        self._model_version = model_version
+
+    def _insert(self, digest: str, entry: Dict[str, Any]) -> None:
+        nbytes = len(json.dumps(entry, separators=(',', ':')))
+        if nbytes > self.max_bytes:
+            return
+        self._remove(digest)
+        self._entries[digest] = (entry, nbytes)
+        self._by_image_id[entry["image_id"]] = digest
+        self.size += nbytes
+        while self.size > self.max_bytes:
+            evicted, _ = next(iter(self._entries.items()))
+            self._remove(evicted)
+            self.evictions += 1
+
+    def _remove(self, digest: str) -> None:
+        item = self._entries.pop(digest, None)
+        if item is None:
+            return
+        self.size -= item[1]
+        if self._by_image_id.get(item[0]["image_id"]) == digest:
+            del self._by_image_id[item[0]["image_id"]]
+
+    # ── Disk tier (optional) ──────────────────────────────────────────────────
+    def _version_dir(self, model_version: str) -> str:
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in model_version)
+        return os.path.join(self.disk_dir, safe)
+
+    def _disk_path(self, digest: str, model_version: str) -> str:
+        return os.path.join(self._version_dir(model_version), f"{digest}.json")
+
+    def _read_disk(self, digest: str, model_version: str) -> Optional[Dict[str, Any]]:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(digest, model_version), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, digest: str, model_version: str, entry: Dict[str, Any]) -> None:
+        if not self.disk_dir:
+            return
+        try:
+            version_dir = self._version_dir(model_version)
+            os.makedirs(version_dir, exist_ok=True)
+            payload = json.dumps(entry, separators=(',', ':'))
+            with open(self._disk_path(digest, model_version), 'w') as f:
+                f.write(payload)
+            self._disk_size += len(payload)
+            if self._disk_size > self.disk_max_bytes:
+                self._trim_disk(version_dir)
+        except OSError as e:
+            print(f"⚠️ Could not write prediction cache entry to disk: {e}")
+
+    def _trim_disk(self, version_dir: str) -> None:
+        """Delete the oldest files until the disk tier is back under ~90% of its budget."""
+        files = sorted((os.path.join(version_dir, name) for name in os.listdir(version_dir)),
+                       key=os.path.getmtime)
+        total = sum(os.path.getsize(path) for path in files)
+        for path in files:
+            if total <= 0.9 * self.disk_max_bytes:
+                break
+            total -= os.path.getsize(path)
+            os.remove(path)
+        self._disk_size = total
+
+    def _drop_disk_version(self, model_version: str) -> None:
+        if self.disk_dir:
+            shutil.rmtree(self._version_dir(model_version), ignore_errors=True)
+            self._disk_size = 0
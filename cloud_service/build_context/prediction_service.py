@@ -3,12 +3,47 @@ prediction_service.py — YOLOv8 inference wrapper for the waste-classifier-eu C
 
 Responsibilities:
   1. At startup: load model weights (from GCS if available, otherwise baked-in fallback)
-  2. On each request: run YOLOv8 inference, return detections + annotated image
+  2. On each request: run YOLOv8 inference, return detections (+ annotated image on request)
+
+Startup is driven by service_core.py's StartupOrchestrator (see startup.py), which calls
+the steps below in order — nothing heavy happens at import time:
+  import_runtime()        — import ultralytics/torch (inference_engines.py; in parallel with the next two)
+  resolve_weights_path()  — pick baked-in vs GCS weights, downloading only if needed
+  load_model(source)      — load the inference engine and make it the active model
+  warmup_model()          — one dummy inference so the first real request is fast
+
+Hot reload (see model_reloader.py):
+  reload_model() loads a newer best_latest.pt generation next to the serving one,
+  warms it up, then swaps ACTIVE in a single assignment. Every batch reads ACTIVE
+  once and hands that same snapshot to _build_response(), so in-flight requests
+  finish on the model they started with and nothing is dropped during a rollout.
+
+Model registry (see model_registry.py):
+  Several versions can be resident at once. A request may pin one
+  (get_classification_result(..., model_version=...)), and a candidate loaded with
+  reload_model(role="candidate") shadows a SHADOW_FRACTION sample of traffic after
+  the response is built, on a thread of its own (never the batching scheduler's) —
+  promote_model() makes it the active model.
+
+Adaptive input resolution (see resolution_policy.py):
+  Each request runs at one of the imgsz tiers in model_meta.json's "inference_policy"
+  (e.g. 320/480/640), picked from the latency budget and the scheduler's queue depth.
+  Responses report the resolution used as "imgsz".
+
+Micro-batching:
+  Requests never call MODEL.predict() directly. Each decoded image is handed to a
+  single scheduler thread that waits up to PREDICT_MAX_WAIT_MS for more images to
+  arrive (or until PREDICT_MAX_BATCH are queued) and runs one batched forward pass.
+  Under lunch-time scan spikes this replaces N single-image passes with a few
+  batched ones; when traffic is idle a request only waits PREDICT_MAX_WAIT_MS.
 
 Weight loading strategy:
   - Primary  : download gs://retrain_smart_waste_model/models/best_latest.pt at container startup
                This file is updated by the Kaggle retraining notebook when a better model is found.
-               Forcing a new Cloud Run revision (via retrain_deployer) triggers a fresh download.
+               Running instances pick up a new generation without a redeploy: model_reloader.py
+               polls the blob's generation and POST /admin/reload-model triggers a check at once.
+               Skipped when the blob's md5 matches the baked-in weights (cloudbuild.yaml bakes
+               best_latest.pt into the image), or when /tmp already holds that generation.
   - Fallback : use weights/best.pt baked into the Docker image at build time.
                Guarantees the service always starts even if GCS is unreachable.
 
@@ -17,137 +52,571 @@ Waste categories (class IDs from shared/class_map.json):
 """
 
 import os
-import io
-import json
+import time
+import queue
+import random
 import base64
+import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from PIL import Image
-from ultralytics import YOLO
-from typing import Dict, Any, List
+from typing import Dict, Any, List, NamedTuple, Optional
+
+from inference_engines import load_engine, resolve_engine_name, extract_detections
+from annotated_renderer import render_boxes
+from image_decode import decode_image
+from model_registry import ModelRegistry, UnknownModelVersion, rss_bytes
+from resolution_policy import ResolutionPolicy
+from service_metrics import INFERENCE_BATCH_SIZE, observe_stage
+from request_tracing import traced
+from storage_backends import ObjectInfo, object_store
+from shared_config import CONFIG, SHARED_DIR
 
 # ── 1. Path resolution ────────────────────────────────────────────────────────
 # BASE_DIR resolves to /app/ inside Docker, or the local file's directory when
-# running locally for development.
+# running locally for development. shared/ (class map, model meta, tips) is
+# located and loaded by shared_config.py.
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# shared/ contains class_map.json and model_meta.json.
-# In Docker these are copied alongside main.py. Locally they live one level up.
-_shared_docker = os.path.join(BASE_DIR, 'shared')
-_shared_local  = os.path.join(BASE_DIR, '..', 'shared')
-SHARED_DIR = _shared_docker if os.path.isdir(_shared_docker) else _shared_local
+# ── 2. Weight loading — GCS first, baked-in fallback ─────────────────────────
+_weights_baked      = os.path.join(BASE_DIR, 'weights', 'best.pt')  # always present in the image
+_weights_gcs_local  = '/tmp/best_latest.pt'                         # download destination
+_weights_gcs_marker = _weights_gcs_local + '.generation'            # GCS generation of the local copy
 
-CLASS_MAP_PATH  = os.path.join(SHARED_DIR, 'class_map.json')
-MODEL_META_PATH = os.path.join(SHARED_DIR, 'model_meta.json')
+WEIGHTS_BUCKET = 'retrain_smart_waste_model'
+WEIGHTS_BLOB   = 'models/best_latest.pt'
 
-# ── 2. Weight loading — GCS first, baked-in fallback ─────────────────────────
-_weights_baked    = os.path.join(BASE_DIR, 'weights', 'best.pt')  # always present in the image
-_weights_gcs_local = '/tmp/best_latest.pt'                         # download destination
 
-def _try_download_latest_weights() -> str:
+def _md5_base64(path: str) -> str:
+    """MD5 of a file in the base64 form GCS reports as blob.md5_hash."""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return base64.b64encode(digest.digest()).decode('ascii')
+
+
+class WeightsSource(NamedTuple):
+    """Where a set of weights came from — generation is None for the baked-in fallback."""
+    path:       str
+    generation: Optional[str]
+    from_gcs:   bool
+
+
+def _latest_weights_blob() -> Optional[ObjectInfo]:
+    """Metadata (md5, generation, custom metadata) of models/best_latest.pt, or None."""
+    # The same pooled, fork-aware client main.py uses for the bucket (storage_backends.py)
+    return object_store(WEIGHTS_BUCKET).stat(WEIGHTS_BLOB)
+
+
+def resolve_weights_path(current_generation: Optional[str] = None,
+                         only_if_changed: bool = False) -> Optional[WeightsSource]:
     """
-    Try to download the latest trained weights from GCS.
-    Returns the local path to use for loading the model.
+    Decide which weights to load and download them only if necessary.
 
-    Called once at module import (container startup). If GCS is unreachable or
-    the file doesn't exist, falls back silently to the baked-in weights so the
-    service always comes up healthy.
+    One metadata request (get_blob) tells us the live blob's md5 and generation:
+      - only_if_changed and the generation is the one being served → None (hot reload no-op)
+      - md5 matches the baked-in weights → use them, no download
+      - /tmp already holds this generation (e.g. a restarted worker) → reuse it
+      - otherwise download to /tmp (via a temp file, renamed atomically)
+    If GCS is unreachable or the file doesn't exist, falls back silently to the
+    baked-in weights so the service always comes up healthy.
     """
+    baked = WeightsSource(_weights_baked, None, False)
     try:
-        from google.cloud import storage as _gcs
-        bucket = _gcs.Client().bucket('retrain_smart_waste_model')
-        blob   = bucket.blob('models/best_latest.pt')
-        if blob.exists():
-            blob.download_to_filename(_weights_gcs_local)
-            print(f"✅ Downloaded latest weights from GCS → {_weights_gcs_local}")
-            return _weights_gcs_local
+        blob = _latest_weights_blob()
+        generation = str(blob.generation) if blob is not None else None
+        if only_if_changed and generation == current_generation:
+            return None
+        if blob is None:
+            print(f"ℹ️ No {WEIGHTS_BLOB} in GCS — using baked-in weights")
+            return baked
+
+        if os.path.exists(_weights_baked) and blob.md5_hash == _md5_base64(_weights_baked):
+            print("✅ Baked-in weights match the latest GCS weights — skipping download")
+            return WeightsSource(_weights_baked, generation, False)
+
+        if os.path.exists(_weights_gcs_local) and os.path.exists(_weights_gcs_marker):
+            with open(_weights_gcs_marker, 'r') as f:
+                if f.read().strip() == generation:
+                    print(f"✅ {_weights_gcs_local} already holds generation {generation} — skipping download")
+                    return WeightsSource(_weights_gcs_local, generation, True)
+
+        partial = _weights_gcs_local + '.part'
+        object_store(WEIGHTS_BUCKET).download(WEIGHTS_BLOB, partial)
+        os.replace(partial, _weights_gcs_local)
+        with open(_weights_gcs_marker, 'w') as f:
+            f.write(generation)
+        print(f"✅ Downloaded latest weights from GCS → {_weights_gcs_local} (generation {generation})")
+        return WeightsSource(_weights_gcs_local, generation, True)
     except Exception as e:
         print(f"⚠️ Could not download weights from GCS (using baked-in): {e}")
-    return _weights_baked
-
-MODEL_WEIGHTS_PATH = _try_download_latest_weights()
-
-# ── 3. Class map and model metadata ──────────────────────────────────────────
-try:
-    with open(CLASS_MAP_PATH, 'r') as f:
-        CLASS_DATA = json.load(f)
-        # {0: "glass", 1: "paper", 2: "cardboard", 3: "plastic", 4: "metal", 5: "trash"}
-        LABELS = {int(k): v for k, v in CLASS_DATA['index_to_name'].items()}
-except FileNotFoundError:
-    print(f"❌ Error: Class map not found at {CLASS_MAP_PATH}")
-    LABELS = {}
-
-try:
-    with open(MODEL_META_PATH, 'r') as f:
-        MODEL_META     = json.load(f)
-        MODEL_VERSION  = MODEL_META.get("version", "v2s-yolo-default")
-        CONF_THRESHOLD = 0.25  # Detections below this confidence are discarded
-except FileNotFoundError:
-    print(f"❌ Error: Model meta not found at {MODEL_META_PATH}")
-    MODEL_VERSION  = "v2s-yolo-default"
-    CONF_THRESHOLD = 0.25
-
-# ── 4. Recycling tips returned to the frontend ────────────────────────────────
-TIPS_MAP = {
-    "BIODEGRADABLE": "Place in a compost bin or designated organics waste container.",
-    "CARDBOARD":     "Break down boxes flat before recycling.",
-    "GLASS":         "Empty, rinse, and place in the glass bin. Labels are okay.",
-    "METAL":         "Ensure cans are clean and dry. No sharp scrap metal.",
-    "PAPER":         "Keep dry and flatten before placing in the paper bin.",
-    "PLASTIC":       "Empty and rinse container. If it's a bottle/jug, put the cap back on.",
-    "TRASH":         "This item belongs in general waste. Consider if any parts can be recycled separately."
-}
-
-# ── 5. Model loading ──────────────────────────────────────────────────────────
-# Loaded once at startup into a global — reused for every prediction request.
-# YOLO() loads the PyTorch model into memory; this takes a few seconds on cold start.
+    return None if only_if_changed else baked
+
+
+MODEL_WEIGHTS_PATH = _weights_baked  # replaced by load_model() at startup
+
+# ── 3. Class map, model metadata and tips (shared_config.py) ─────────────────
+# One snapshot shared with the feedback routes (service_core.py); reloaded when the files change
+MODEL_META     = CONFIG.current().model_meta
+MODEL_VERSION  = MODEL_META.get("version", "v2s-yolo-default")
+CONF_THRESHOLD = 0.25  # Detections below this confidence are discarded
+if not MODEL_META:
+    print(f"❌ Error: Model meta not found in {SHARED_DIR}")
+
+# Uploads are decoded at reduced resolution (JPEG DCT scaling) so that the shorter
+# side is still >= DECODE_SIZE — no point decoding 12MP when YOLO runs at 640
+DECODE_SIZE = int(MODEL_META.get("decode_size", 640))
+
+# imgsz tier per request from the latency budget and current load
+POLICY = ResolutionPolicy.from_meta(MODEL_META)
+
+# ── 4. Model loading ──────────────────────────────────────────────────────────
+# Loaded at startup into ACTIVE — reused for every prediction request until a hot reload.
+# MODEL is an InferenceEngine (see inference_engines.py) — it behaves like the
+# ultralytics YOLO object but may execute on ONNX Runtime or OpenVINO instead of
+# PyTorch. Pick the backend with INFERENCE_ENGINE or "engine" in model_meta.json.
+INFERENCE_ENGINE = resolve_engine_name(MODEL_META)
+
+
+class LoadedModel(NamedTuple):
+    """An immutable snapshot of a servable model. ACTIVE is swapped as a whole."""
+    engine:     Any            # InferenceEngine
+    version:    str
+    generation: Optional[str]  # GCS generation of best_latest.pt (None = baked-in fallback)
+
+
+ACTIVE: Optional[LoadedModel] = None
+
+# Every resident version (active, shadow candidate, recent previous ones)
+REGISTRY = ModelRegistry()
+
+# Kept in sync with ACTIVE for code that reads the module globals directly
 MODEL = None
-try:
-    if os.path.exists(MODEL_WEIGHTS_PATH):
-        MODEL = YOLO(MODEL_WEIGHTS_PATH)
-        print(f"✅ ML Model ({MODEL_VERSION}) loaded from {MODEL_WEIGHTS_PATH}")
-    else:
-        print(f"⚠️ Warning: Model weights not found at {MODEL_WEIGHTS_PATH}")
-except Exception as e:
-    print(f"❌ Error loading ML model: {e}")
-    MODEL = None
+MODEL_GENERATION: Optional[str] = None
+
+_swap_lock = threading.Lock()
+
+
+def _version_for(source: WeightsSource) -> str:
+    """
+    model_meta.json describes the baked-in weights. Weights downloaded from GCS get
+    their generation appended, so caches keyed by version (prediction_cache.py)
+    invalidate when a new best_latest.pt goes live.
+    """
+    base = CONFIG.current().model_meta.get("version", "v2s-yolo-default")
+    return f"{base}+g{source.generation}" if source.from_gcs else base
+
+
+def build_model(source: WeightsSource) -> LoadedModel:
+    """Load an engine for source and register it, without activating it."""
+    rss_before = rss_bytes()
+    engine = load_engine(INFERENCE_ENGINE, source.path)
+    loaded = LoadedModel(engine, _version_for(source), source.generation)
+    REGISTRY.register(loaded, rss_bytes() - rss_before, source.path)
+    return loaded
+
+
+def activate_model(loaded: LoadedModel) -> None:
+    """Atomically make loaded the model that serves new (unpinned) batches."""
+    global ACTIVE, MODEL, MODEL_VERSION, MODEL_GENERATION, MODEL_WEIGHTS_PATH
+    with _swap_lock:
+        ACTIVE             = loaded
+        MODEL              = loaded.engine
+        MODEL_VERSION      = loaded.version
+        MODEL_GENERATION   = loaded.generation
+        MODEL_WEIGHTS_PATH = loaded.engine.weights_path
+        REGISTRY.mark_active(loaded.version)
+    # Feedback labels are written with class_map.json's indices — they must mean
+    # the same classes as this model's head
+    CONFIG.bind_model(loaded.engine.names)
+
+
+def load_model(source: WeightsSource) -> None:
+    """Load and activate the model for source (called once at startup)."""
+    try:
+        if os.path.exists(source.path):
+            loaded = build_model(source)
+            activate_model(loaded)
+            print(f"✅ ML Model ({loaded.version}, {loaded.engine.name} engine) loaded from {loaded.engine.model_path}")
+        else:
+            print(f"⚠️ Warning: Model weights not found at {source.path}")
+    except Exception as e:
+        print(f"❌ Error loading ML model: {e}")
+
+
+def _warmup_image() -> Image.Image:
+    return Image.new('RGB', (DECODE_SIZE, DECODE_SIZE), (114, 114, 114))
+
+
+def warmup_model() -> None:
+    """
+    Push one blank image per resolution tier through the batching scheduler so
+    the predictor is built, kernels are initialized and the scheduler thread is
+    running before the first real request. These cold passes aren't fed to POLICY —
+    they'd skew its per-tier latency estimates towards the smaller tiers.
+    """
+    if ACTIVE is None:
+        return
+    for imgsz in POLICY.tiers:
+        BATCHER.submit(_warmup_image(), imgsz=imgsz, observe=False).result(timeout=PREDICT_TIMEOUT_S)
+
+
+def reload_model(force: bool = False, role: str = "active") -> Dict[str, Any]:
+    """
+    Load the latest best_latest.pt generation (if it changed) and warm it up off the
+    request path. role="active" swaps it in; role="candidate" keeps the current
+    model serving and shadows sampled traffic through the new one instead.
+    Returns a short status dict for logs / the admin API.
+    """
+    if role not in ("active", "candidate"):
+        raise ValueError(f"Unknown reload role '{role}'")
+    candidate = REGISTRY.candidate() if role == "candidate" else None
+    current   = (candidate or ACTIVE).generation if (candidate or ACTIVE) is not None else None
+    source    = resolve_weights_path(current, only_if_changed=not force)
+    if source is None:
+        return {"reloaded": False, "reason": "no new generation", "model_version": MODEL_VERSION}
+
+    start  = time.perf_counter()
+    loaded = build_model(source)
+    # Warm the new engine directly — the scheduler keeps serving the old model meanwhile
+    for imgsz in POLICY.tiers:
+        loaded.engine.predict([_warmup_image()], conf=CONF_THRESHOLD, imgsz=imgsz, save=False, verbose=False)
+    elapsed = round(time.perf_counter() - start, 2)
+
+    if role == "candidate":
+        REGISTRY.set_candidate(loaded.version)
+        print(f"🧪 Loaded candidate model {loaded.version} in {elapsed}s — shadowing {MODEL_VERSION}")
+        return {"reloaded": True, "role": role, "candidate_version": loaded.version,
+                "model_version": MODEL_VERSION, "generation": loaded.generation, "load_s": elapsed}
+
+    previous = MODEL_VERSION
+    activate_model(loaded)
+    print(f"🔄 Hot-swapped model {previous} → {loaded.version} in {elapsed}s")
+    return {"reloaded": True, "role": role, "previous_version": previous, "model_version": loaded.version,
+            "generation": loaded.generation, "load_s": elapsed}
+
+
+def promote_model(version: Optional[str] = None) -> Dict[str, Any]:
+    """Make a resident version (default: the shadow candidate) the active model."""
+    version = version or REGISTRY.candidate_version
+    if version is None:
+        raise UnknownModelVersion("No candidate model to promote")
+    loaded   = REGISTRY.get(version)
+    previous = MODEL_VERSION
+    activate_model(loaded)
+    print(f"🚀 Promoted model {previous} → {loaded.version}")
+    return {"promoted": True, "previous_version": previous, "model_version": loaded.version}
+
+
+# ── 5. Micro-batching scheduler ───────────────────────────────────────────────
+# Tunables (env vars so they can be changed per Cloud Run revision without a rebuild):
+#   PREDICT_MAX_BATCH   — most images run in one forward pass (1 disables batching)
+#   PREDICT_MAX_WAIT_MS — how long the first queued image waits for company
+#   PREDICT_TIMEOUT_S   — how long a request waits for its result before giving up
+PREDICT_MAX_BATCH   = int(os.getenv("PREDICT_MAX_BATCH", "8"))
+PREDICT_MAX_WAIT_MS = float(os.getenv("PREDICT_MAX_WAIT_MS", "5"))
+PREDICT_TIMEOUT_S   = float(os.getenv("PREDICT_TIMEOUT_S", "60"))
+
+
+def _fail(futures: List[Future], error: BaseException) -> None:
+    """Resolve every future that has no result yet with error."""
+    for future in futures:
+        if not future.done():
+            future.set_exception(error)
+
+
+class _BatchScheduler:
+    """
+    Collects images from concurrent request threads and runs them through the
+    active model (or the version a request pinned) in batches. Each caller gets a
+    Future that resolves to its own (ultralytics Results, LoadedModel) pair, or the
+    exception that stopped its group (no model loaded, the forward pass, a short
+    result list) — a failure never leaves a future waiting or kills the thread.
+
+    submit_many() queues several images as one unit, so a multi-image request
+    (/predict/batch) always shares a single forward pass even when it is larger
+    than max_batch.
+
+    Only the scheduler thread ever touches MODEL.predict(), so the ultralytics
+    predictor (which is not thread-safe) is never entered concurrently.
+    """
+
+    def __init__(self, max_batch: int, max_wait_ms: float):
+        self.max_batch = max(1, max_batch)
+        self.max_wait  = max(0.0, max_wait_ms) / 1000.0
+        self._lock     = threading.Lock()
+        self._queue    = None
+        self._thread   = None
+        self._pid      = None
+
+    def submit(self, img: Image.Image, model: Optional[LoadedModel] = None, imgsz: Optional[int] = None,
+               observe: bool = True) -> Future:
+        """
+        Queue one decoded image for inference (on model, default: the active one,
+        at imgsz, default: the largest tier) and return its Future. observe=False
+        keeps the pass out of POLICY's latency estimates (warmup).
+        """
+        return self.submit_many([img], model, imgsz, observe)[0]
+
+    def submit_many(self, images: List[Image.Image], model: Optional[LoadedModel] = None,
+                    imgsz: Optional[int] = None, observe: bool = True) -> List[Future]:
+        """Queue images as one unit — they are never split across forward passes."""
+        futures = [Future() for _ in images]
+        self._ensure_worker().put((images, futures, model, imgsz or POLICY.max_tier, observe))
+        return futures
+
+    def pending(self) -> int:
+        """Requests waiting for a forward pass (approximate)."""
+        q = self._queue
+        return q.qsize() if q is not None and self._pid == os.getpid() else 0
+
+    def _ensure_worker(self) -> queue.Queue:
+        # The thread is started lazily (and restarted after a fork) so that
+        # importing this module never leaves a scheduler running in the wrong process.
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._queue  = queue.Queue()
+                self._pid    = os.getpid()
+                self._thread = threading.Thread(target=self._run, args=(self._queue,),
+                                                name="predict-batcher", daemon=True)
+                self._thread.start()
+            return self._queue
+
+    def _run(self, q: queue.Queue) -> None:
+        while True:
+            batch    = [q.get()]  # block until at least one request arrives
+            count    = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while count < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                count += len(batch[-1][0])
+            # The thread must outlive any bad batch — callers of a dead scheduler's
+            # queue would only find out after PREDICT_TIMEOUT_S
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                print(f"❌ Inference batch failed: {e}")
+                _fail([future for _, futures, _, _, _ in batch for future in futures], e)
+
+    def _run_batch(self, batch: List[Any]) -> None:
+        active = ACTIVE  # one snapshot per batch — a hot swap only affects later batches
+
+        # One forward pass per (model, imgsz); unpinned requests first so pinned versions queue behind them
+        groups: Dict[Any, List[Any]] = {}
+        for images, futures, model, imgsz, observe in batch:
+            model = model or active
+            if model is None:  # before load_model(), or after it failed
+                _fail(futures, RuntimeError("ML model is not loaded. Check server logs."))
+                continue
+            group = groups.setdefault((model.version, imgsz), [model, imgsz, [], True])
+            group[2].extend(zip(images, futures))
+            group[3] = group[3] and observe  # a warmup image makes the whole pass cold
+        order = sorted(groups.values(), key=lambda g: g[0] is not active)
+
+        for model, imgsz, items, observe in order:
+            try:
+                self._run_group(model, imgsz, items, observe and model is active)
+            except Exception as e:
+                print(f"❌ Inference on {model.version} at imgsz={imgsz} failed: {e}")
+                _fail([future for _, future in items], e)
+
+    def _run_group(self, model: LoadedModel, imgsz: int, items: List[Any], observe: bool) -> None:
+        """One forward pass for items [(image, future)]; results are handed out before metrics are recorded."""
+        start = time.perf_counter()
+        results = model.engine.predict([img for img, _ in items], conf=CONF_THRESHOLD, imgsz=imgsz,
+                                       save=False, project='temp_runs', name='web_predict',
+                                       verbose=False)
+        elapsed = time.perf_counter() - start
+        if len(results) != len(items):
+            raise RuntimeError(f"{model.engine.name} engine returned {len(results)} results for {len(items)} images")
+
+        for (_, future), r in zip(items, results):
+            future.set_result((r, model, imgsz))
+
+        REGISTRY.record_latency(model.version, elapsed, len(items))
+        INFERENCE_BATCH_SIZE.observe(len(items))
+        if observe:
+            POLICY.observe(imgsz, elapsed / len(items))
+
+
+BATCHER = _BatchScheduler(PREDICT_MAX_BATCH, PREDICT_MAX_WAIT_MS)
 
 
 # ── 6. Prediction function ────────────────────────────────────────────────────
-def get_classification_result(image_bytes: bytes) -> Dict[str, Any]:
+def current_model_version() -> str:
+    """Version string of the model currently serving (used to key caches)."""
+    return MODEL_VERSION
+
+
+@traced("get_classification_result")
+def get_classification_result(image_bytes: bytes, annotate: bool = False,
+                              model_version: Optional[str] = None) -> Dict[str, Any]:
     """
     Run YOLOv8 object detection on the provided image bytes.
 
+    model_version pins a resident registry version instead of the active model
+    (raises UnknownModelVersion if it isn't loaded). Unpinned requests may also be
+    sampled into shadow inference on the candidate model — that runs after this
+    function returns and never changes the response.
+
+    annotate=True also renders the boxes onto a downscaled copy of the image and
+    returns the JPEG bytes as annotated_image (sent as annotated_image_base64 in
+    JSON responses, raw in msgpack/CBOR/multipart — see response_codecs.py). It's off by default — the app draws its
+    own overlay from detections[].box_2d, and GET /render/<image_id> serves the
+    annotated JPEG on demand.
+
     Returns a dict matching the PredictionResponse schema expected by the frontend:
       prediction             — top-1 class name (e.g. "plastic")
       confidence             — top-1 confidence score (0.0–1.0)
       topk                   — list of [class_name, score] sorted by confidence
       tips                   — recycling instructions for the top-1 class
       model_version          — version string from model_meta.json
-      annotated_image_base64 — JPEG with bounding boxes drawn, base64-encoded
+      imgsz                  — input resolution the model ran at (see resolution_policy.py)
+      annotated_image        — JPEG bytes with bounding boxes drawn (None unless annotate=True)
       detections             — list of all detected objects with id, label, confidence, box_2d
     """
-    if MODEL is None:
+    if ACTIVE is None:
         raise RuntimeError("ML model is not loaded. Check server logs.")
+    pinned = REGISTRY.get(model_version) if model_version else None
 
-    img = Image.open(io.BytesIO(image_bytes))
+    # Decode near the inference resolution, with EXIF orientation applied
+    start = time.perf_counter()
+    img = decode_image(image_bytes, DECODE_SIZE)
+    observe_stage("decode", time.perf_counter() - start)
 
-    # Run inference — results[0] contains all detections for the single input image
-    results = MODEL.predict(img, conf=CONF_THRESHOLD, save=False,
-                            project='temp_runs', name='web_predict', verbose=False)
-    r = results[0]
+    # Hand the image to the batching scheduler — the result is this image's own
+    # Results object, even if it shared a forward pass with other requests
+    start = time.perf_counter()
+    imgsz = POLICY.choose(BATCHER.pending())
+    r, model, imgsz = BATCHER.submit(img, pinned, imgsz).result(timeout=PREDICT_TIMEOUT_S)
+    primary_s = time.perf_counter() - start
+    observe_stage("inference", primary_s)
+
+    response = _build_response(r, model, imgsz, img if annotate else None)
+    if pinned is None:
+        _maybe_shadow(img, response, model, primary_s)
+    return response
+
+
+@traced("get_classification_results")
+def get_classification_results(images: List[bytes], annotate: bool = False,
+                               model_version: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Classify several images with one batched forward pass (used by /predict/batch).
+
+    Returns one PredictionResponse dict per input, in order. An image that can't be
+    decoded gets {"error": "..."} in its slot instead of failing the whole batch.
+    """
+    if ACTIVE is None:
+        raise RuntimeError("ML model is not loaded. Check server logs.")
+    pinned = REGISTRY.get(model_version) if model_version else None
+
+    decoded: List[Optional[Image.Image]] = []
+    results: List[Optional[Dict[str, Any]]] = []
+    for image_bytes in images:
+        start = time.perf_counter()
+        try:
+            decoded.append(decode_image(image_bytes, DECODE_SIZE))
+            results.append(None)
+        except Exception as e:
+            decoded.append(None)
+            results.append({"error": f"Could not decode image: {e}"})
+        observe_stage("decode", time.perf_counter() - start)
+
+    valid = [i for i, img in enumerate(decoded) if img is not None]
+    if not valid:
+        return results
+
+    start = time.perf_counter()
+    imgsz = POLICY.choose(BATCHER.pending() + len(valid) - 1)
+    futures = BATCHER.submit_many([decoded[i] for i in valid], pinned, imgsz)
+    raw = [future.result(timeout=PREDICT_TIMEOUT_S) for future in futures]
+    primary_s = time.perf_counter() - start
+    observe_stage("inference", primary_s)
+    for i, (r, model, imgsz) in zip(valid, raw):
+        results[i] = _build_response(r, model, imgsz, decoded[i] if annotate else None)
+
+    if pinned is None:
+        for i in valid:
+            _maybe_shadow(decoded[i], results[i], model, primary_s)
+    return results
+
+
+# Shadow inference runs on its own single thread, so a candidate forward pass never
+# holds up a primary batch or counts towards BATCHER.pending() (and the resolution
+# choice). REGISTRY's shadow slots (SHADOW_MAX_INFLIGHT) bound how many samples wait.
+_shadow_lock = threading.Lock()
+_shadow_executor: Optional[ThreadPoolExecutor] = None
+_shadow_pid = None
+
+
+def _shadow_pool() -> ThreadPoolExecutor:
+    # Created lazily (and re-created after a fork) like the upload queue's workers
+    global _shadow_executor, _shadow_pid
+    with _shadow_lock:
+        if _shadow_executor is None or _shadow_pid != os.getpid():
+            _shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow-inference")
+            _shadow_pid      = os.getpid()
+        return _shadow_executor
+
+
+def _maybe_shadow(img: Image.Image, response: Dict[str, Any], model: LoadedModel, primary_s: float) -> None:
+    """
+    Run a sampled request through the candidate model and compare the results.
+    Fire-and-forget: queued on the shadow thread once the primary response is built.
+    """
+    candidate = REGISTRY.candidate()
+    if candidate is None or candidate.version == model.version:
+        return
+    if random.random() >= REGISTRY.shadow_fraction or not REGISTRY.try_shadow_slot():
+        return
+
+    start = time.perf_counter()
+
+    def _shadow() -> None:
+        try:
+            # Promoted while this sample waited — the batcher thread owns that engine now
+            if candidate is ACTIVE:
+                return
+            # Same resolution as the primary so the comparison is about the weights only
+            forward_start = time.perf_counter()
+            r = candidate.engine.predict([img], conf=CONF_THRESHOLD, imgsz=response.get("imgsz"),
+                                         save=False, verbose=False)[0]
+            REGISTRY.record_latency(candidate.version, time.perf_counter() - forward_start, 1)
+            detections = extract_detections(r, candidate.engine.names)
+            shadow_top1 = max(detections, key=lambda d: d["confidence"])["label"] if detections else "unidentified"
+            REGISTRY.record_shadow(
+                primary_top1=response["prediction"], shadow_top1=shadow_top1,
+                primary_count=len(response.get("detections", [])), shadow_count=len(detections),
+                primary_s=primary_s, shadow_s=time.perf_counter() - start,
+            )
+        except Exception as e:
+            print(f"⚠️ Shadow inference on {candidate.version} failed: {e}")
+            REGISTRY.record_shadow_error()
+        finally:
+            REGISTRY.release_shadow_slot()
 
-    # Generate annotated image (bounding boxes drawn by YOLO) encoded as base64 JPEG
-    # Sent back to the frontend to display before the user draws their own corrections
     try:
-        annotated_img = r.plot()  # returns numpy array with boxes drawn
-        pil_img = Image.fromarray(annotated_img)
-        buffer  = io.BytesIO()
-        pil_img.save(buffer, format='JPEG', quality=85)
-        buffer.seek(0)
-        encoded_image_string = base64.b64encode(buffer.read()).decode('utf-8')
-    except Exception as e:
-        print(f"Error encoding annotated image: {e}")
-        encoded_image_string = None
+        _shadow_pool().submit(_shadow)
+    except Exception:
+        REGISTRY.release_shadow_slot()
+        raise
+
 
+def _build_response(r, model: LoadedModel, imgsz: int, annotate_img: Image.Image = None) -> Dict[str, Any]:
+    """
+    Convert one ultralytics Results object into the PredictionResponse dict.
+    model is the snapshot that produced r (its class names and version are reported)
+    and imgsz the input resolution it ran at.
+    If annotate_img is given, the detections are drawn onto it and returned as JPEG bytes.
+    """
     # No objects detected — return an "unidentified" response
     if len(r.boxes) == 0:
         return {
@@ -155,33 +624,22 @@ def get_classification_result(image_bytes: bytes) -> Dict[str, Any]:
             "confidence": 0.0,
             "topk": [],
             "tips": "Could not identify the item. Please ensure the item is clearly visible.",
-            "model_version": MODEL_VERSION,
-            "annotated_image_base64": None,
+            "model_version": model.version,
+            "imgsz": imgsz,
+            "annotated_image": None,
         }
 
     # Build detections list and top-k map from all detected boxes
+    # box_2d: [x_center, y_center, width, height] normalized to [0, 1]
+    # Used by the frontend to draw SVG overlay boxes and stored in YOLO label format
+    detections = extract_detections(r, model.engine.names)
+
+    # Keep the highest confidence score per class for the top-k list
     top_k_map  = {}  # {class_name: highest_confidence} — deduplicates multiple boxes of same class
-    detections = []
-
-    for i, box in enumerate(r.boxes):
-        class_id   = int(box.cls[0].item())
-        confidence = float(box.conf[0].item())
-        class_name = MODEL.names.get(class_id, "unknown") if MODEL else "unknown"
-
-        # box_2d: [x_center, y_center, width, height] normalized to [0, 1]
-        # Used by the frontend to draw SVG overlay boxes and stored in YOLO label format
-        xywhn = box.xywhn[0].tolist()
-        print("xywhn", xywhn)
-        detections.append({
-            "id":         f"box_{i}",
-            "label":      class_name,
-            "confidence": round(confidence, 3),
-            "box_2d":     xywhn
-        })
-
-        # Keep the highest confidence score per class for the top-k list
-        if class_name not in top_k_map or confidence > top_k_map[class_name]:
-            top_k_map[class_name] = confidence
+    for det in detections:
+        class_name = det["label"]
+        if class_name not in top_k_map or det["confidence"] > top_k_map[class_name]:
+            top_k_map[class_name] = det["confidence"]
 
     # Sort classes by confidence descending for the top-k response
     top_k_list: List[List[Any]] = sorted(
@@ -190,21 +648,30 @@ def get_classification_result(image_bytes: bytes) -> Dict[str, Any]:
         reverse=True
     )
 
+    # Annotated image (opt-in) — lightweight PIL renderer on a downscaled copy
+    # Kept as raw JPEG bytes; response_codecs.py base64-encodes it only for JSON responses
+    jpeg_bytes = None
+    if annotate_img is not None:
+        start = time.perf_counter()
+        try:
+            jpeg_bytes = render_boxes(annotate_img, detections)
+            observe_stage("render", time.perf_counter() - start)
+        except Exception as e:
+            print(f"Error encoding annotated image: {e}")
+
     top_prediction_name       = top_k_list[0][0]
     top_prediction_confidence = top_k_list[0][1]
 
-    # Look up recycling tip using uppercase key (TIPS_MAP keys are uppercase)
-    tips = TIPS_MAP.get(
-        top_prediction_name.upper(),
-        "Sorting instructions not found. Check local guidelines."
-    )
+    # Recycling tip from shared/tips.json (keys are uppercase class names)
+    tips = CONFIG.current().tip_for(top_prediction_name)
 
     return {
         "prediction":             top_prediction_name,
         "confidence":             top_prediction_confidence,
         "topk":                   top_k_list,
         "tips":                   tips,
-        "model_version":          MODEL_VERSION,
-        "annotated_image_base64": encoded_image_string,
+        "model_version":          model.version,
+        "imgsz":                  imgsz,
+        "annotated_image":        jpeg_bytes,
         "detections":             detections
     }
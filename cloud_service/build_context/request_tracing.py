@@ -0,0 +1,196 @@
+"""
+request_tracing.py — Per-request trace IDs and spans.
+
+Every request gets a trace ID: the one Cloud Run puts in X-Cloud-Trace-Context
+(or a W3C traceparent) when present, a fresh one otherwise. It is returned in the
+X-Trace-Id header and in the /predict body ("trace_id"), so a slow scan reported
+by a user can be looked up directly.
+
+Spans are recorded on the current trace (a contextvar, so it follows the request
+into executor threads that copy the context):
+  - get_classification_result / get_classification_results   (traced decorator)
+  - the /predict stages decode, inference, render, upload, serialize and every
+    GCS / Firestore call routed through service_metrics.track_call
+  - response.write — from the handler returning until the last body byte is sent
+
+When a request finishes, its trace is kept in a small in-memory buffer
+(GET /admin/traces?trace_id=...|image_id=...) and, if it took longer than
+TRACE_LOG_SLOW_MS or was sampled (TRACE_SAMPLE_RATE), printed as one structured
+JSON log line. The line carries logging.googleapis.com/trace, so Cloud Logging
+groups it with the request log, and image_id, which links a /predict trace to the
+/feedback trace for the same photo. The image_id (and the /predict trace_id kept
+in the image's GCS metadata) then follows the photo into training_data/ and the
+trained_data/{ts}/ archive of the retraining run that used it.
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional
+
+TRACE_LOG_SLOW_MS = float(os.getenv("TRACE_LOG_SLOW_MS", "1000"))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "256"))
+GCP_PROJECT       = os.getenv("GOOGLE_CLOUD_PROJECT") or os.getenv("GCP_PROJECT", "")
+
+
+class Trace:
+    """Spans and attributes of one request."""
+
+    def __init__(self, trace_id: str, name: str):
+        self.trace_id   = trace_id
+        self.name       = name
+        self.started_at = time.time()
+        self._start     = time.perf_counter()
+        self._lock      = threading.Lock()
+        self.attrs: Dict[str, Any] = {}
+        self.spans: List[Dict[str, Any]] = []
+        self.duration_ms: Optional[float] = None
+
+    def add_span(self, name: str, start: float, end: float, **attrs: Any) -> None:
+        span = {
+            "name":        name,
+            "start_ms":    round(1000 * (start - self._start), 2),
+            "duration_ms": round(1000 * (end - start), 2),
+        }
+        if attrs:
+            span["attrs"] = attrs
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+        self.duration_ms = round(1000 * (time.perf_counter() - self._start), 2)
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ms"])
+        return {
+            "trace_id":    self.trace_id,
+            "name":        self.name,
+            "started_at":  self.started_at,
+            "duration_ms": self.duration_ms,
+            "attrs":       dict(self.attrs),
+            "spans":       spans,
+        }
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+
+_recent: deque = deque(maxlen=max(1, TRACE_BUFFER_SIZE))
+_recent_lock = threading.Lock()
+
+
+def incoming_trace_id(headers: Mapping[str, str]) -> str:
+    """Trace ID from X-Cloud-Trace-Context ("TRACE/SPAN;o=1") or traceparent, else a new one."""
+    cloud = headers.get("X-Cloud-Trace-Context")
+    if cloud:
+        trace_id = cloud.split("/", 1)[0].strip()
+        if trace_id:
+            return trace_id
+    parent = headers.get("traceparent")
+    if parent:
+        parts = parent.split("-")
+        if len(parts) >= 3 and len(parts[1]) == 32:
+            return parts[1]
+    return uuid.uuid4().hex
+
+
+def start_trace(name: str, trace_id: str) -> Trace:
+    """Make a new trace current for this request (reset with end_trace)."""
+    trace = Trace(trace_id, name)
+    _current.set(trace)
+    return trace
+
+
+def end_trace(trace: Trace, keep: bool = True, **attrs: Any) -> None:
+    """
+    Finish trace, buffer it and log it if it was slow or sampled.
+    keep=False only finishes it (health probes and metric scrapes would crowd the buffer).
+    """
+    trace.finish(**attrs)
+    if _current.get() is trace:
+        _current.set(None)
+    if not keep:
+        return
+    with _recent_lock:
+        _recent.append(trace)
+    if trace.duration_ms >= TRACE_LOG_SLOW_MS or random.random() < TRACE_SAMPLE_RATE:
+        _log(trace)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current.get()
+    return trace.trace_id if trace is not None else None
+
+
+def annotate_trace(**attrs: Any) -> None:
+    """Attach attributes (e.g. image_id) to the current trace."""
+    trace = _current.get()
+    if trace is not None:
+        trace.attrs.update({k: v for k, v in attrs.items() if v is not None})
+
+
+def record_span(name: str, seconds: float, **attrs: Any) -> None:
+    """Record a span that just ended after `seconds` on the current trace."""
+    trace = _current.get()
+    if trace is not None:
+        end = time.perf_counter()
+        trace.add_span(name, end - seconds, end, **attrs)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace = _current.get()
+        if trace is not None:
+            trace.add_span(name, start, time.perf_counter(), **attrs)
+
+
+def traced(name: str) -> Callable:
+    """Decorator: record every call of the function as a span."""
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def find_traces(trace_id: Optional[str] = None, image_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Buffered traces (newest first), optionally filtered by trace_id or image_id."""
+    with _recent_lock:
+        traces = list(_recent)
+    return [
+        trace.as_dict() for trace in reversed(traces)
+        if (trace_id is None or trace.trace_id == trace_id)
+        and (image_id is None or trace.attrs.get("image_id") == image_id)
+    ]
+
+
+def _log(trace: Trace) -> None:
+    entry = trace.as_dict()
+    slow = trace.duration_ms >= TRACE_LOG_SLOW_MS
+    entry["severity"] = "WARNING" if slow else "INFO"
+    entry["message"] = f"⏱️ {trace.name} took {trace.duration_ms} ms ({'slow' if slow else 'sampled'})"
+    if GCP_PROJECT:
+        entry["logging.googleapis.com/trace"] = f"projects/{GCP_PROJECT}/traces/{trace.trace_id}"
+    # Top-level image_id so Cloud Logging can filter /predict and /feedback traces of one photo
+    if "image_id" in trace.attrs:
+        entry["image_id"] = trace.attrs["image_id"]
+    print(json.dumps(entry, default=str), flush=True)
@@ -0,0 +1,104 @@
+"""
+resolution_policy.py — Latency-budget-driven choice of the YOLO input resolution.
+
+MODEL.predict() used to run every image at the ultralytics default imgsz (640).
+Under load that is the wrong trade-off: a request that waits behind a queue of
+640px forward passes misses its latency target, while the same photo at 480 or
+320 would usually still be classified correctly. ResolutionPolicy picks one of a
+few resolution tiers per request:
+
+  - Each tier's cost is tracked as an EWMA of measured milliseconds per image
+    (fed by the micro-batching scheduler after every forward pass), seeded from
+    "tier_latency_ms" in model_meta.json so the first requests don't guess.
+  - The expected latency of a tier is its per-image cost times the number of
+    images ahead of this one (the scheduler's queue) plus one.
+  - The largest tier whose expected latency fits the budget wins; when nothing
+    fits, the smallest tier is used.
+
+Configured by "inference_policy" in shared/model_meta.json:
+
+    "inference_policy": {
+      "tiers": [320, 480, 640],
+      "latency_budget_ms": 400,
+      "tier_latency_ms": {"320": 45, "480": 95, "640": 170}
+    }
+
+INFERENCE_LATENCY_BUDGET_MS overrides the budget (0 = always the largest tier).
+retraining/calibrate_resolution.py measures the accuracy-vs-latency curve of
+the current weights and prints a block like the one above.
+"""
+
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+DEFAULT_TIERS = [640]
+
+
+def _stride_multiple(size: int, stride: int = 32) -> int:
+    """YOLO input sizes must be multiples of the network stride."""
+    return max(stride, int(round(size / stride)) * stride)
+
+
+class ResolutionPolicy:
+    """Chooses an imgsz tier from a latency budget and the current queue depth."""
+
+    def __init__(self, tiers: List[int], latency_budget_ms: float = 0.0,
+                 seed_latency_ms: Optional[Dict[int, float]] = None, alpha: float = 0.2):
+        self.tiers     = sorted({_stride_multiple(int(t)) for t in tiers}) or list(DEFAULT_TIERS)
+        self.budget_ms = max(0.0, float(latency_budget_ms or 0.0))
+        self.alpha     = alpha
+        self._lock     = threading.Lock()
+        self._ms: Dict[int, float] = {
+            _stride_multiple(int(t)): float(ms) for t, ms in (seed_latency_ms or {}).items()
+        }
+        self.chosen: Dict[int, int] = {t: 0 for t in self.tiers}
+
+    @classmethod
+    def from_meta(cls, meta: Dict[str, Any]) -> "ResolutionPolicy":
+        config = meta.get("inference_policy") or {}
+        budget = os.getenv("INFERENCE_LATENCY_BUDGET_MS") or config.get("latency_budget_ms", 0)
+        return cls(config.get("tiers", DEFAULT_TIERS), float(budget),
+                   config.get("tier_latency_ms"))
+
+    @property
+    def max_tier(self) -> int:
+        return self.tiers[-1]
+
+    def choose(self, queued_images: int = 0) -> int:
+        """imgsz for a request that has queued_images ahead of it."""
+        tier = self.max_tier
+        if self.budget_ms > 0 and len(self.tiers) > 1:
+            with self._lock:
+                fitting = [t for t in self.tiers
+                           if self._estimate_ms(t) is None
+                           or self._estimate_ms(t) * (queued_images + 1) <= self.budget_ms]
+            tier = fitting[-1] if fitting else self.tiers[0]
+        with self._lock:
+            self.chosen[tier] = self.chosen.get(tier, 0) + 1
+        return tier
+
+    def observe(self, imgsz: int, seconds_per_image: float) -> None:
+        """Record the measured cost of one forward pass at imgsz."""
+        ms = 1000.0 * seconds_per_image
+        with self._lock:
+            previous = self._ms.get(imgsz)
+            self._ms[imgsz] = ms if previous is None else (1 - self.alpha) * previous + self.alpha * ms
+
+    def _estimate_ms(self, tier: int) -> Optional[float]:
+        if tier in self._ms:
+            return self._ms[tier]
+        # Not measured yet — scale the nearest measured tier by pixel count
+        if not self._ms:
+            return None
+        known = min(self._ms, key=lambda t: abs(t - tier))
+        return self._ms[known] * (tier / known) ** 2
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tiers":             self.tiers,
+                "latency_budget_ms": self.budget_ms,
+                "ms_per_image":      {str(t): round(ms, 2) for t, ms in sorted(self._ms.items())},
+                "chosen":            {str(t): n for t, n in self.chosen.items()},
+            }
@@ -0,0 +1,183 @@
+"""
+response_codecs.py — Content negotiation for /predict and /predict/batch responses.
+
+On a cellular connection the size of the /predict response is most of the latency
+a user perceives, and the JSON body carried the annotated image base64-encoded
+(+33%). Prediction results now hold the annotated JPEG as raw bytes under
+"annotated_image"; the representation is chosen per request:
+
+  application/json     (default) — the PredictionResponse schema the app already
+                       parses, annotated_image_base64 included; serialized with
+                       orjson when it's installed
+  application/msgpack  — same fields, "annotated_image" as a raw binary value
+  application/cbor     — same fields, "annotated_image" as a raw byte string
+  multipart/mixed      — a JSON part (without the image) followed by one raw
+                       image/jpeg part per annotated image, named
+                       "annotated_image" (or "annotated_image_<index>" for a batch)
+
+The format comes from ?format=json|msgpack|cbor|multipart, else from the Accept
+header (q-values honoured). Formats whose library isn't installed are never
+negotiated; asking for one explicitly raises UnsupportedFormat (→ 406).
+"""
+
+import json
+import uuid
+import base64
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+MEDIA_JSON      = "application/json"
+MEDIA_MSGPACK   = "application/msgpack"
+MEDIA_CBOR      = "application/cbor"
+MEDIA_MULTIPART = "multipart/mixed"
+
+IMAGE_KEY = "annotated_image"
+
+_ALIASES = {
+    "json":                    MEDIA_JSON,
+    "msgpack":                 MEDIA_MSGPACK,
+    "application/x-msgpack":   MEDIA_MSGPACK,
+    "application/vnd.msgpack": MEDIA_MSGPACK,
+    "cbor":                    MEDIA_CBOR,
+    "multipart":               MEDIA_MULTIPART,
+    "multipart/form-data":     MEDIA_MULTIPART,
+}
+
+
+class UnsupportedFormat(ValueError):
+    """The requested response format is unknown or its library isn't installed."""
+
+
+def available_formats() -> List[str]:
+    formats = [MEDIA_JSON, MEDIA_MULTIPART]
+    if msgpack is not None:
+        formats.append(MEDIA_MSGPACK)
+    if cbor2 is not None:
+        formats.append(MEDIA_CBOR)
+    return formats
+
+
+def _canonical(media_type: str) -> str:
+    media_type = media_type.strip().lower()
+    return _ALIASES.get(media_type, media_type)
+
+
+def negotiate(accept: Optional[str], fmt: Optional[str] = None) -> str:
+    """Media type for the response: explicit ?format= first, then the Accept header, else JSON."""
+    formats = available_formats()
+    if fmt:
+        media_type = _canonical(fmt)
+        if media_type not in formats:
+            raise UnsupportedFormat(f"Unsupported response format '{fmt}' (available: {', '.join(formats)})")
+        return media_type
+
+    ranked = []
+    for position, item in enumerate((accept or "").split(",")):
+        parts = item.split(";")
+        quality = 1.0
+        for param in parts[1:]:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        ranked.append((-quality, position, _canonical(parts[0])))
+
+    for quality, _, media_type in sorted(ranked):
+        if quality == 0:
+            break
+        if media_type in formats:
+            return media_type
+        if media_type in ("*/*", "application/*"):
+            return MEDIA_JSON
+    return MEDIA_JSON
+
+
+def dumps_json(payload: Any) -> bytes:
+    """Compact JSON bytes — orjson when available, stdlib otherwise."""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def _results(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The prediction dicts inside a /predict (one) or /predict/batch ({"results": [...]}) payload."""
+    return payload["results"] if isinstance(payload.get("results"), list) else [payload]
+
+
+def _without_images(payload: Dict[str, Any], replace) -> Dict[str, Any]:
+    """Copy of payload with every result's raw annotated image passed through replace(bytes_or_None)."""
+    def convert(result: Dict[str, Any]) -> Dict[str, Any]:
+        if not isinstance(result, dict) or IMAGE_KEY not in result:
+            return result
+        result = dict(result)
+        result.update(replace(result.pop(IMAGE_KEY)))
+        return result
+
+    if isinstance(payload.get("results"), list):
+        return {**payload, "results": [convert(r) for r in payload["results"]]}
+    return convert(payload)
+
+
+def _multipart(payload: Dict[str, Any]) -> Tuple[bytes, str]:
+    boundary  = uuid.uuid4().hex
+    batch     = isinstance(payload.get("results"), list)
+    images    = [r.get(IMAGE_KEY) if isinstance(r, dict) else None for r in _results(payload)]
+    body_json = _without_images(payload, lambda jpeg_bytes: {"annotated_image_base64": None})
+
+    parts: List[Tuple[str, bytes]] = []
+    for i, (result, jpeg_bytes) in enumerate(zip(_results(body_json), images)):
+        if jpeg_bytes:
+            name = f"{IMAGE_KEY}_{i}" if batch else IMAGE_KEY
+            result["annotated_image_part"] = name  # tells the client which part holds its image
+            parts.append((name, jpeg_bytes))
+
+    chunks = [
+        f"--{boundary}\r\n"
+        f"Content-Type: {MEDIA_JSON}\r\n"
+        f"Content-Disposition: inline; name=\"result\"\r\n\r\n".encode("ascii"),
+        dumps_json(body_json),
+        b"\r\n",
+    ]
+    for name, jpeg_bytes in parts:
+        chunks += [
+            f"--{boundary}\r\n"
+            f"Content-Type: image/jpeg\r\n"
+            f"Content-Disposition: inline; name=\"{name}\"; filename=\"{name}.jpg\"\r\n"
+            f"Content-Length: {len(jpeg_bytes)}\r\n\r\n".encode("ascii"),
+            jpeg_bytes,
+            b"\r\n",
+        ]
+    chunks.append(f"--{boundary}--\r\n".encode("ascii"))
+    return b"".join(chunks), f"{MEDIA_MULTIPART}; boundary={boundary}"
+
+
+def encode(payload: Dict[str, Any], media_type: str = MEDIA_JSON) -> Tuple[bytes, str]:
+    """Serialize a /predict or /predict/batch payload. Returns (body, Content-Type)."""
+    if media_type == MEDIA_MSGPACK:
+        return msgpack.packb(payload, use_bin_type=True), MEDIA_MSGPACK
+    if media_type == MEDIA_CBOR:
+        return cbor2.dumps(payload), MEDIA_CBOR
+    if media_type == MEDIA_MULTIPART:
+        return _multipart(payload)
+
+    def to_base64(jpeg_bytes):
+        encoded = base64.b64encode(jpeg_bytes).decode("utf-8") if jpeg_bytes else None
+        return {"annotated_image_base64": encoded}
+
+    return dumps_json(_without_images(payload, to_base64)), MEDIA_JSON
@@ -0,0 +1,182 @@
+"""
+review_queue.py — Firestore-backed queue of pending images awaiting community review.
+
+The community review queue used to be derived from a listing of pending_images/
+in GCS, so two reviewers could be handed — and annotate — the same image, and
+the second /community-feedback then came back 404 after the work was done.
+Every pending image now has a queue document, review_queue/{image_id}:
+
+  object            its pending_images/ object name
+  priority          higher is reviewed first: REVIEW_PRIORITY for a new photo,
+                    REVIEW_DUPLICATE_PRIORITY for a near-duplicate of one already
+                    queued (the upload's dHash metadata); every release lowers it
+                    by one, so images reviewers keep skipping sink
+  enqueued_at       epoch seconds — first in, first out within a priority
+  lease_owner       the reviewer holding the image until lease_expires_at (epoch
+                    seconds, 0 = free); an expired lease is simply a free entry,
+                    so images of reviewers who walk away come back by themselves
+  dhash, duplicate_of, created_at
+                    from the upload, for duplicate collapsing and the response
+  expire_at         enqueued + REVIEW_MAX_AGE_DAYS — a Firestore TTL policy on this
+                    field drops entries whose image the bucket lifecycle rule deleted
+
+  enqueue()    called by the upload queue once predict_route's photo is in GCS,
+               so a queued image always exists
+  available()  the indexed query behind GET /pending-images: entries by priority
+               desc, enqueued_at asc, whose lease has expired (lease_expires_at <= now)
+               and that are younger than REVIEW_MAX_AGE_DAYS — both filtered in the
+               query, so leased images never use up its limit
+  claim()      one transaction that leases up to N available images to a reviewer
+               for REVIEW_LEASE_S (images the reviewer already holds are renewed);
+               concurrent claims never get the same image
+  release()    hand leased images back (skip / leaving the review screen)
+  take()       /community-feedback's check: the submitter must hold the lease or
+               the image must be free — it is then leased to the submitter while
+               the image is moved, so nobody else can claim it in between
+  remove()     the image left the queue (moved to training_data/ or deleted)
+  backfill()   queue pending images uploaded before the queue existed
+
+Firestore needs one composite index for the query (range filters on two fields):
+  review_queue: priority DESC, enqueued_at ASC, lease_expires_at ASC
+"""
+
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from storage_backends import DocumentStore, DocumentTransaction, DocumentWrite, ObjectInfo
+from upload_queue import pending_path
+
+REVIEW_QUEUE_COLLECTION   = "review_queue"
+REVIEW_LEASE_S            = float(os.getenv("REVIEW_LEASE_S", "600"))
+REVIEW_PRIORITY           = int(os.getenv("REVIEW_PRIORITY", "100"))
+REVIEW_DUPLICATE_PRIORITY = int(os.getenv("REVIEW_DUPLICATE_PRIORITY", "10"))
+REVIEW_MAX_AGE_DAYS       = float(os.getenv("REVIEW_MAX_AGE_DAYS", "3"))  # keep in line with the bucket lifecycle rule
+REVIEW_CLAIM_SCAN         = 3  # candidates read per image claimed, for claims racing each other
+
+
+def _queue_path(image_id: str) -> str:
+    return f"{REVIEW_QUEUE_COLLECTION}/{image_id}"
+
+
+def _is_free(entry: Dict[str, Any], owner: Optional[str], now: float) -> bool:
+    return entry.get("lease_expires_at", 0) <= now or (owner is not None and entry.get("lease_owner") == owner)
+
+
+def _entry(image_id: str, metadata: Dict[str, str], enqueued_at: float) -> Dict[str, Any]:
+    created_at = datetime.fromtimestamp(enqueued_at, timezone.utc)
+    return {
+        "image_id":         image_id,
+        "object":           pending_path(image_id),
+        "priority":         REVIEW_DUPLICATE_PRIORITY if metadata.get("duplicate_of") else REVIEW_PRIORITY,
+        "enqueued_at":      enqueued_at,
+        "created_at":       created_at.isoformat(),
+        "expire_at":        created_at + timedelta(days=REVIEW_MAX_AGE_DAYS),
+        "lease_owner":      None,
+        "lease_expires_at": 0.0,
+        "claims":           0,
+        "dhash":            metadata.get("dhash"),
+        "duplicate_of":     metadata.get("duplicate_of"),
+    }
+
+
+class ReviewQueue:
+    """Pending images in review order, leased to one reviewer at a time."""
+
+    def __init__(self, docs: DocumentStore, lease_s: float = REVIEW_LEASE_S):
+        self._docs   = docs
+        self.lease_s = lease_s
+
+    def enqueue(self, image_id: str, metadata: Optional[Dict[str, str]] = None) -> None:
+        self._docs.set(_queue_path(image_id), _entry(image_id, metadata or {}, time.time()))
+
+    def available(self, limit: int) -> List[Dict[str, Any]]:
+        """Up to limit queued entries nobody holds a lease on, in review order."""
+        now = time.time()
+        # Leased and expired entries are filtered by the query itself, so however many
+        # images at the top of the order are leased, limit free entries still come back
+        entries = self._docs.query(REVIEW_QUEUE_COLLECTION,
+                                   where=[("lease_expires_at", "<=", now),
+                                          ("enqueued_at", ">=", now - REVIEW_MAX_AGE_DAYS * 86400)],
+                                   order_by=[("priority", "desc"), ("enqueued_at", "asc")], limit=limit)
+        return [data for _, data in entries]
+
+    def claim(self, owner: str, count: int, preferred: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        """
+        Lease up to count available images to owner, the preferred image_ids (e.g.
+        the page the reviewer is already looking at) first, then in review order.
+        """
+        candidates = list(dict.fromkeys(list(preferred)[:count] + [
+            entry["image_id"] for entry in self.available(count * REVIEW_CLAIM_SCAN * 2)
+        ]))[:count * REVIEW_CLAIM_SCAN]
+
+        def claim_in(txn: DocumentTransaction) -> List[Dict[str, Any]]:
+            now = time.time()
+            current = [(image_id, txn.get(_queue_path(image_id))) for image_id in candidates]
+            claimed = []
+            for image_id, entry in current:
+                if len(claimed) >= count:
+                    break
+                if entry is None or not _is_free(entry, owner, now):
+                    continue
+                lease = {"lease_owner": owner, "lease_expires_at": now + self.lease_s,
+                         "claims": entry.get("claims", 0) + 1}
+                txn.update(_queue_path(image_id), lease)
+                claimed.append({**entry, **lease})
+            return claimed
+
+        return self._docs.transaction(claim_in) if candidates else []
+
+    def release(self, owner: str, image_ids: Iterable[str]) -> int:
+        """Give owner's leases on image_ids back (one priority step lower). Returns how many were released."""
+        image_ids = list(dict.fromkeys(image_ids))
+
+        def release_in(txn: DocumentTransaction) -> int:
+            now = time.time()
+            current = [(image_id, txn.get(_queue_path(image_id))) for image_id in image_ids]
+            released = 0
+            for image_id, entry in current:
+                if entry is None or entry.get("lease_owner") != owner or entry.get("lease_expires_at", 0) <= now:
+                    continue
+                txn.update(_queue_path(image_id), {"lease_owner": None, "lease_expires_at": 0.0,
+                                                   "priority": entry.get("priority", REVIEW_PRIORITY) - 1})
+                released += 1
+            return released
+
+        return self._docs.transaction(release_in) if image_ids else 0
+
+    def take(self, owner: str, image_id: str) -> bool:
+        """
+        Lease image_id to owner for a submission. False if another reviewer holds a
+        live lease on it. An image without a queue entry (never backfilled, or already
+        removed) is left to the caller — the move to training_data/ decides.
+        """
+        def take_in(txn: DocumentTransaction) -> bool:
+            now = time.time()
+            entry = txn.get(_queue_path(image_id))
+            if entry is None:
+                return True
+            if not _is_free(entry, owner, now):
+                return False
+            txn.update(_queue_path(image_id), {"lease_owner": owner, "lease_expires_at": now + self.lease_s})
+            return True
+
+        return self._docs.transaction(take_in)
+
+    def remove(self, image_id: str) -> None:
+        self._docs.delete(_queue_path(image_id))
+
+    def backfill(self, objects: List[ObjectInfo]) -> int:
+        """Queue pending_images/ objects that have no queue entry yet. Returns how many were added."""
+        queued = {image_id for image_id, _ in self._docs.stream(REVIEW_QUEUE_COLLECTION)}
+        writes = []
+        for info in objects:
+            image_id = info.name.replace("pending_images/", "").replace(".jpg", "")
+            if not image_id or image_id in queued:
+                continue
+            enqueued_at = info.time_created.timestamp() if info.time_created else time.time()
+            writes.append(DocumentWrite("set", _queue_path(image_id), _entry(image_id, info.metadata, enqueued_at)))
+        for start in range(0, len(writes), 500):  # Firestore's batch limit
+            self._docs.commit(writes[start:start + 500])
+        return len(writes)
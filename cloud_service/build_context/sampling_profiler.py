@@ -0,0 +1,141 @@
+"""
+sampling_profiler.py — On-demand, low-overhead sampling profiler (POST /admin/profile).
+
+Investigating a slow endpoint used to mean redeploying with extra print()s.
+SamplingProfiler instead samples the Python stacks of every thread in this
+process for N seconds:
+
+  - a daemon thread wakes every PROFILE_INTERVAL_MS (default 10 ms ≈ 100 Hz),
+    reads sys._current_frames() and counts each stack — no tracing hooks, so the
+    request threads run at full speed between samples
+  - stacks are written in the collapsed ("folded") format, one
+    "thread;module:function:line;... count" line per distinct stack, which
+    flamegraph.pl, speedscope and inferno read directly
+  - output goes to PROFILE_DIR (default /tmp/profiles); only one profile runs
+    at a time per process
+
+Native code (torch kernels, libjpeg) shows up as the Python frame that called it.
+"""
+
+import os
+import sys
+import math
+import time
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional
+
+PROFILE_DIR         = os.getenv("PROFILE_DIR", "/tmp/profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_SECONDS     = 10.0
+
+
+def parse_profile_seconds(value: Optional[str]) -> float:
+    """?seconds= clamped to 0.1..PROFILE_MAX_SECONDS (ValueError if it isn't a positive number)."""
+    if value in (None, ""):
+        return PROFILE_SECONDS
+    seconds = float(value)
+    if not math.isfinite(seconds) or seconds <= 0:
+        raise ValueError(f"seconds must be a positive number, got {value!r}")
+    return min(max(0.1, seconds), PROFILE_MAX_SECONDS)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+
+def collapse_stack(frame, thread_name: str) -> str:
+    """Root-first "thread;module:function:line;..." string for one thread's stack."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name.replace(";", "_").replace(" ", "_"))
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """Samples all thread stacks for a fixed duration and writes a folded-stacks file."""
+
+    def __init__(self, output_dir: str = PROFILE_DIR, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.output_dir   = output_dir
+        self.interval_s   = max(0.001, interval_ms / 1000.0)
+        self._lock        = threading.Lock()
+        self._done        = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.running      = False
+        self.last_result: Optional[Dict[str, Any]] = None
+        self._done.set()
+
+    def start(self, seconds: float) -> bool:
+        """Start profiling for `seconds` (capped at PROFILE_MAX_SECONDS). False if one is already running."""
+        with self._lock:
+            if self.running:
+                return False
+            self.running = True
+            self._done.clear()
+        seconds = min(max(0.1, seconds), PROFILE_MAX_SECONDS)
+        self._thread = threading.Thread(target=self._run, args=(seconds,), name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Block until the running profile (if any) has been written; returns its result."""
+        self._done.wait(timeout)
+        return self.last_result
+
+    def _run(self, seconds: float) -> None:
+        stacks: Counter = Counter()
+        samples = 0
+        me = threading.get_ident()
+        started = time.time()
+        deadline = time.perf_counter() + seconds
+        try:
+            while time.perf_counter() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident != me:
+                        stacks[collapse_stack(frame, names.get(ident, f"thread-{ident}"))] += 1
+                samples += 1
+                time.sleep(self.interval_s)
+
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, f"profile-{os.getpid()}-{int(started)}.folded")
+            with open(path, "w") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            self.last_result = {
+                "path":        path,
+                "started_at":  started,
+                "seconds":     round(seconds, 3),
+                "interval_ms": round(self.interval_s * 1000, 3),
+                "samples":     samples,
+                "stacks":      len(stacks),
+            }
+            print(f"🔥 Profile written to {path} ({samples} samples, {len(stacks)} distinct stacks)")
+        except Exception as e:
+            print(f"❌ Profiling failed: {e}")
+            self.last_result = {"error": str(e), "started_at": started}
+        finally:
+            with self._lock:
+                self.running = False
+            self._done.set()
+
+    def read_latest(self) -> Optional[str]:
+        """Folded stacks of the last completed profile, or None."""
+        path = (self.last_result or {}).get("path")
+        if not path or not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            return f.read()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running":     self.running,
+            "interval_ms": round(self.interval_s * 1000, 3),
+            "max_seconds": PROFILE_MAX_SECONDS,
+            "last_result": self.last_result,
+        }
@@ -0,0 +1,551 @@
+"""
+service_core.py — Shared state and route logic for the Flask and async APIs.
+
+main.py (Flask, WSGI) and asgi_main.py (Starlette, API_SERVER=asgi) serve the
+same endpoints. Everything that isn't request parsing or response building
+lives here, once, so the two servers can't drift apart:
+
+  - the storage / Firestore backends, the write-behind feedback log and the
+    community review queue (STORE, DOCS, FEEDBACK_LOG, REVIEW_QUEUE)
+  - startup orchestration and the gunicorn worker hooks (start_worker /
+    stop_worker, called from gunicorn.conf.py), the model reloader and profiler
+  - the per-process caches: upload queue, renders, predictions, duplicate index,
+    pending feed and signed URLs
+  - the blocking route logic both APIs call — label lines, points, moving an
+    image to training_data/, batched prediction, review claims. The async API
+    runs these on its I/O or inference executor.
+
+Importing this module starts the service (see the Startup section): the
+backend clients connect and the model loads in the background.
+"""
+
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+from upload_queue import PendingUploadQueue
+from annotated_renderer import RenderCache
+from prediction_cache import PredictionCache, content_hash
+from duplicate_index import DuplicateIndex, dhash, hash_to_hex
+from image_decode import decode_image
+from inference_engines import import_runtime
+from startup import StartupOrchestrator
+from model_reloader import ModelReloader
+from worker_budget import memory_report
+from service_metrics import (INFERENCE_QUEUE_DEPTH, UPLOAD_QUEUE_DEPTH, MODEL_INFO, FEEDBACK_WRITE_QUEUE_DEPTH,
+                             PREDICT_STAGE_SECONDS, track_call)
+from request_tracing import current_trace_id
+from sampling_profiler import SamplingProfiler
+from storage_backends import (SERVER_TIMESTAMP, AlreadyExists, DocumentWrite, Increment, NotFound,
+                              PreconditionFailed, document_store, object_store)
+from io_fanout import FANOUT
+from write_behind import WriteBehindBuffer
+from pending_feed import PENDING_LIST_LIMIT, PENDING_PREFIX, PendingFeed, SignedUrlCache
+from review_queue import ReviewQueue
+from shared_config import CONFIG
+
+try:
+    import prediction_service
+    from prediction_service import get_classification_result, current_model_version
+except ImportError as e:
+    print(f"❌ Error importing prediction_service: {e}")
+    prediction_service = None
+    get_classification_result = None
+    current_model_version = None
+
+# GCS bucket where all training data and model weights are stored.
+# Override via STORAGE_BUCKET env var if needed (e.g. for a staging bucket).
+BUCKET_NAME = os.getenv("STORAGE_BUCKET", "retrain_smart_waste_model")
+
+# Pooled GCS bucket and Firestore client (or the local / in-memory stand-ins
+# selected by STORAGE_BACKEND) — see storage_backends.py
+STORE = object_store(BUCKET_NAME)
+DOCS  = document_store()
+
+# feedback / community_feedback metadata documents, committed in batches off the
+# request path and flushed (or spooled) on shutdown — see write_behind.py
+FEEDBACK_LOG = WriteBehindBuffer(DOCS)
+
+# Community review queue (review_queue/{image_id}): filled once a /predict photo is
+# uploaded, leased to one reviewer at a time — see review_queue.py
+REVIEW_QUEUE = ReviewQueue(DOCS)
+
+
+def _init_backends() -> None:
+    """Firebase credentials and the storage / Firestore clients, before the first request needs them."""
+    STORE.connect()
+    DOCS.connect()
+    FEEDBACK_LOG.start()
+
+
+def stop_worker() -> None:
+    """Flush buffered Firestore writes before the process exits (gunicorn.conf.py's worker_exit)."""
+    FEEDBACK_LOG.close()
+
+
+# ── Startup ───────────────────────────────────────────────────────────────────
+# Credentials, the torch/ultralytics import and the GCS weights check run in
+# parallel on a background thread; the model is loaded and warmed up as soon as
+# its inputs are ready. See startup.py for the phase diagram.
+#
+# Under gunicorn with preload_app (gunicorn.conf.py sets MODEL_PRELOAD=1) the work
+# is split around the fork: the master imports the runtime and loads the weights
+# once (_preload_plan, synchronous, no inference), and every forked worker runs
+# _worker_plan from start_worker() — Firebase clients, thread pools and the first
+# forward pass must all belong to the worker process.
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "0") == "1"
+
+
+def _load_phases(startup: StartupOrchestrator, parallel: dict) -> None:
+    results = startup.run_parallel({
+        **parallel,
+        "runtime":     import_runtime,
+        "weights":     prediction_service.resolve_weights_path,
+    })
+    startup.run("model", prediction_service.load_model,
+                results["weights"] or prediction_service.WeightsSource(
+                    prediction_service.MODEL_WEIGHTS_PATH, None, False))
+
+
+def _report_memory(role: str) -> None:
+    mem = memory_report()
+    if mem:
+        print(f"📊 {role} {mem['pid']} memory: RSS {mem['rss_mb']} MB (shared {mem['shared_mb']} MB, "
+              f"private {mem['private_mb']} MB, PSS {mem['pss_mb']} MB)")
+
+
+def _startup_plan(startup: StartupOrchestrator) -> None:
+    if prediction_service is None:
+        startup.run("credentials", _init_backends)
+        return
+    _load_phases(startup, {"credentials": _init_backends})
+    startup.run("warmup", prediction_service.warmup_model)
+    RELOADER.start_polling()
+    _report_memory("Process")
+
+
+def _preload_plan(startup: StartupOrchestrator) -> None:
+    if prediction_service is not None:
+        _load_phases(startup, {})
+    _report_memory("Master (preloaded)")
+
+
+def _worker_plan(startup: StartupOrchestrator) -> None:
+    startup.run("credentials", _init_backends)
+    if prediction_service is not None:
+        startup.run("warmup", prediction_service.warmup_model)
+        RELOADER.start_polling()
+    _report_memory("Worker")
+
+
+def start_worker() -> None:
+    """Finish startup in a forked gunicorn worker (called from gunicorn.conf.py's post_worker_init)."""
+    if MODEL_PRELOAD:
+        STARTUP.start(_worker_plan)
+
+
+# Picks up new best_latest.pt generations without a redeploy — see model_reloader.py
+RELOADER = ModelReloader(prediction_service.reload_model if prediction_service else None)
+
+# Shared secret for /admin/* endpoints. Unset = admin endpoints disabled.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+STARTUP = StartupOrchestrator()
+if MODEL_PRELOAD:
+    _preload_plan(STARTUP)
+else:
+    STARTUP.start(_startup_plan)
+
+
+# ── Uploads and prediction caches ─────────────────────────────────────────────
+# Perceptual-hash index of recently uploaded pending images — see duplicate_index.py
+DUPLICATES = DuplicateIndex()
+
+
+def _pending_metadata(image_id: str, image_bytes: bytes) -> dict:
+    """
+    GCS metadata for a pending upload: its 64-bit dHash (so any instance can
+    collapse near-duplicates from a bucket listing), the near-duplicate it
+    matched in this instance's index, if any, and the /predict trace_id. The
+    metadata is copied along with the image into training_data/ and the
+    retraining archive. Runs on the upload thread.
+    """
+    value = dhash(decode_image(image_bytes, 64))
+    metadata = {"dhash": hash_to_hex(value)}
+    # Runs in the /predict request's context: ties the photo to that request's trace
+    trace_id = current_trace_id()
+    if trace_id:
+        metadata["trace_id"] = trace_id
+    duplicate_of = DUPLICATES.add(image_id, value)
+    if duplicate_of:
+        metadata["duplicate_of"] = duplicate_of
+    return metadata
+
+
+def _enqueue_for_review(image_id: str, metadata: dict) -> None:
+    """Add an uploaded /predict photo to the community review queue (upload thread)."""
+    track_call("firestore", "set", "/predict", REVIEW_QUEUE.enqueue, image_id, metadata)
+
+
+# Background uploader for /predict photos — see upload_queue.py.
+# Endpoints that read pending_images/ must call UPLOADS.wait_for(image_id) first
+# (which also covers the image's review queue entry).
+UPLOADS = PendingUploadQueue(STORE, metadata_fn=_pending_metadata, on_uploaded=_enqueue_for_review)
+
+# Recent prediction sources + rendered annotated JPEGs for GET /render/<image_id>
+RENDERS = RenderCache()
+
+# SHA-256(image bytes) + model version → cached result and the image_id already
+# uploaded for it. Rescans of the same photo skip inference and the duplicate upload.
+PREDICTIONS = PredictionCache()
+
+
+def cached_result(route: str, cached: dict, digest: str, model_version: str, image_bytes: bytes) -> dict:
+    """
+    The response for a prediction cache hit. Its image_id is handed out again only
+    while the pending image is still there: once /feedback on any instance consumed
+    it (or the lifecycle rule deleted it) the photo is uploaded again under a new
+    image_id and the cache entry is re-pointed at that one.
+    """
+    image_id = cached['image_id']
+    if not UPLOADS.in_flight(image_id) and not track_call("gcs", "exists", route, STORE.exists,
+                                                         f"pending_images/{image_id}.jpg"):
+        previous, image_id = image_id, str(uuid.uuid4())
+        UPLOADS.submit(image_id, image_bytes)
+        RENDERS.remember(image_id, image_bytes, cached['result'].get('detections', []))
+        PREDICTIONS.put(digest, model_version, image_id, cached['result'])
+        print(f"♻️ Pending image {previous} was consumed — re-uploading the cached scan as {image_id}")
+    result = dict(cached['result'])
+    result['image_id'] = image_id
+    return result
+
+
+
+# ── Label helpers ─────────────────────────────────────────────────────────────
+def load_name_to_index() -> dict:
+    """{"glass": 0, ...} from the in-memory class map (shared_config.py). Raises if it never loaded."""
+    name_to_index = CONFIG.current().name_to_index
+    if not name_to_index:
+        raise RuntimeError(CONFIG.last_error or "class_map.json not loaded")
+    return name_to_index
+
+
+def feedback_label_lines(feedback_items: list, name_to_index: dict) -> list:
+    """
+    YOLO label lines ("<class_index> <x_center> <y_center> <width> <height>") for
+    the owner's feedback on their own scan. Ghost boxes are dropped and corrected
+    labels replace the model's label.
+    """
+    label_lines = []
+    for item in feedback_items:
+        # We only want to save "True" detections or "Corrected" ones
+        status = item.get('status')
+        box = item.get('box_2d') # [x, y, w, h]
+
+        final_label = item.get('originalLabel')
+
+        if status == 'ghost':
+            continue # Skip "Bad Box" - don't train on this
+        elif status == 'wrong_label':
+            final_label = item.get('correctedLabel')
+
+        # Normalize label to lowercase for lookup (model returns lowercase, frontend may send uppercase)
+        normalized_label = final_label.lower() if final_label else None
+
+        if box and normalized_label and normalized_label in name_to_index:
+            # Convert label to integer ID (use normalized lowercase)
+            class_id = name_to_index[normalized_label]
+            # Append line: "CLASS_ID x y w h"
+            line = f"{class_id} {box[0]} {box[1]} {box[2]} {box[3]}"
+            label_lines.append(line)
+        else:
+            print(f"⚠️ Label '{final_label}' (normalized: '{normalized_label}') not found in class map or no box provided.")
+    return label_lines
+
+
+def community_label_lines(boxes: list, name_to_index: dict) -> list:
+    """YOLO label lines for community-drawn boxes; unknown labels and malformed boxes are skipped."""
+    label_lines = []
+    for item in boxes:
+        label = (item.get('label') or '').lower()
+        box = item.get('box')  # [x_center, y_center, w, h] normalized 0-1
+        if label not in name_to_index:
+            print(f"⚠️ Skipping unknown label: '{label}'")
+            continue
+        if not box or len(box) != 4:
+            print(f"⚠️ Skipping malformed box: {box}")
+            continue
+        class_id = name_to_index[label]
+        label_lines.append(f"{class_id} {box[0]} {box[1]} {box[2]} {box[3]}")
+    return label_lines
+
+
+def feedback_points(feedback_items: list) -> int:
+    """5 points per valid correction ("correct" / "wrong_label"), minimum 5, capped at 25."""
+    valid_feedback_count = sum(1 for item in feedback_items if item.get('status') in ['correct', 'wrong_label'])
+    return max(5, min(valid_feedback_count * 5, 25))
+
+
+# ── Feedback writes ───────────────────────────────────────────────────────────
+# The training image copy goes first: only once the image is in training_data/
+# are the label, the Firestore record and the points written — independent of each
+# other, so the routes start them together (io_fanout.py / asyncio.gather) and
+# answer once they are done. Deleting the pending copy is cleanup and runs after.
+def _delete_pending(route: str, pending_path: str) -> bool:
+    """Delete a pending image in one round trip (no exists check); False if it was already gone."""
+    try:
+        track_call("gcs", "delete", route, STORE.delete, pending_path)
+        return True
+    except NotFound:
+        return False
+
+
+def remove_pending_image(route: str, image_id: str) -> bool:
+    """DELETE /pending-images/<image_id>: remove the image and forget its cache entries."""
+    # The /predict upload may still be in flight on this instance
+    UPLOADS.wait_for(image_id)
+    deleted = _delete_pending(route, f"pending_images/{image_id}.jpg")
+    PREDICTIONS.discard_image(image_id)
+    DUPLICATES.remove(image_id)
+    _forget_pending(route, image_id)
+    return deleted
+
+
+# /feedback usually arrives seconds after /predict — possibly on another instance or
+# worker, whose background upload (upload_queue.py) this one can't wait for. A missing
+# pending image is looked for again until FEEDBACK_MISSING_WAIT_S has passed.
+FEEDBACK_MISSING_WAIT_S = float(os.getenv("FEEDBACK_MISSING_WAIT_S", "4"))
+
+
+def move_to_training(route: str, image_id: str, missing_wait_s: float = 0.0) -> str:
+    """
+    Server-side copy of pending_images/{id}.jpg to training_data/images/ — one round
+    trip instead of exists + copy + delete. The copy carries if_generation_match=0, so
+    it only succeeds if no training image exists yet: a retried or concurrent
+    submission can't overwrite the one that got there first.
+
+    Returns "moved", "already_moved" (destination existed) or "missing" (no pending
+    image, even after retrying for missing_wait_s). The pending copy is deleted in the
+    background once the training copy exists.
+    """
+    pending_path = f"pending_images/{image_id}.jpg"
+    training_image_path = f"training_data/images/{image_id}.jpg"
+
+    # The /predict upload may still be in flight on this instance
+    UPLOADS.wait_for(image_id)
+    PREDICTIONS.discard_image(image_id)
+    DUPLICATES.remove(image_id)
+    deadline = time.monotonic() + missing_wait_s
+    delay = 0.25
+    while True:
+        try:
+            track_call("gcs", "copy", route, STORE.copy, pending_path, training_image_path, if_generation_match=0)
+            print(f"✅ Moved image from {pending_path} to {training_image_path}")
+            status = "moved"
+        except PreconditionFailed:
+            print(f"ℹ️ {training_image_path} already exists — keeping it")
+            status = "already_moved"
+        except NotFound:
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, 1.0)
+                continue
+            print(f"⚠️ Pending image not found: {pending_path}")
+            status = "missing"
+        break
+    _forget_pending(route, image_id)
+    if status == "missing":
+        return status
+    FANOUT.background(_delete_pending, route, pending_path)
+    return status
+
+
+def award_points(route: str, user_id: str, points_added: int, image_id: str) -> None:
+    """
+    Add points_added to users/{user_id} and append an entry to its points_history
+    ledger in one atomic batched write. The balance uses a server-side Increment
+    instead of get + update, so feedback from two devices can't overwrite each
+    other's award. The ledger entry is keyed by image_id and written with "create",
+    so a retried submission for the same photo is never paid twice.
+    Failures are logged, never raised.
+    """
+    user_path = f"users/{user_id}"
+    try:
+        track_call("firestore", "commit", route, DOCS.commit, [
+            DocumentWrite("update", user_path, {
+                'points': Increment(points_added),
+                'lastUpdated': SERVER_TIMESTAMP
+            }),
+            # Read by the app's PointsHistoryScreen
+            DocumentWrite("create", f"{user_path}/points_history/feedback-{image_id}", {
+                'type': 'EARNED',
+                'source': 'feedback',
+                'points': points_added,
+                'imageId': image_id,
+                'date': datetime.now(timezone.utc).isoformat(),
+                'createdAt': SERVER_TIMESTAMP
+            }),
+        ])
+        print(f"✅ Awarded {points_added} points to user {user_id}")
+    except NotFound:
+        print(f"⚠️ User {user_id} not found in Firestore")
+    except AlreadyExists:
+        print(f"ℹ️ Points for image {image_id} were already awarded to user {user_id}")
+    except Exception as e:
+        print(f"❌ Error updating user points: {e}")
+
+
+# ── Metrics gauges ────────────────────────────────────────────────────────────
+# Sampled at scrape time by GET /metrics.
+def _model_info() -> dict:
+    """{(version, role): 1 if serving else 0} for every resident model version."""
+    registry = prediction_service.REGISTRY
+    info = {}
+    for version in registry.versions():
+        if version == registry.active_version:
+            info[(version, "active")] = 1
+        elif version == registry.candidate_version:
+            info[(version, "candidate")] = 0
+        else:
+            info[(version, "resident")] = 0
+    return info
+
+
+INFERENCE_QUEUE_DEPTH.set_function(lambda: prediction_service.BATCHER.pending() if prediction_service else 0)
+UPLOAD_QUEUE_DEPTH.set_function(UPLOADS.pending_count)
+FEEDBACK_WRITE_QUEUE_DEPTH.set_function(FEEDBACK_LOG.pending_count)
+MODEL_INFO.set_function(lambda: _model_info() if prediction_service else {})
+
+
+# ── Profiler ──────────────────────────────────────────────────────────────────
+# Samples this instance's stacks into a flamegraph file for /admin/profile.
+PROFILER = SamplingProfiler()
+
+
+# ── /predict/batch ────────────────────────────────────────────────────────────
+PREDICT_BATCH_MAX_IMAGES = int(os.getenv("PREDICT_BATCH_MAX_IMAGES", "16"))
+
+
+def predict_many(images: list, annotate: bool, pinned: str = None) -> list:
+    """Cache lookup, background upload and batched inference for /predict/batch."""
+    model_version = current_model_version()
+    results, misses = [None] * len(images), []
+    for i, image_bytes in enumerate(images):
+        digest = content_hash(image_bytes)
+        cached = PREDICTIONS.get(digest, model_version) if not pinned else None
+        if cached is None:
+            misses.append((i, digest))
+            continue
+        result = cached_result("/predict/batch", cached, digest, model_version, image_bytes)
+        if annotate and result.get('detections'):
+            with PREDICT_STAGE_SECONDS.time(stage="render"):
+                result['annotated_image'] = RENDERS.render(result['image_id'],
+                                                           lambda: (image_bytes, result['detections']))
+        results[i] = result
+
+    if misses:
+        image_ids = {}
+        for i, _ in misses:
+            image_ids[i] = str(uuid.uuid4())
+            UPLOADS.submit(image_ids[i], images[i])
+
+        batch_results = prediction_service.get_classification_results(
+            [images[i] for i, _ in misses], annotate=annotate, model_version=pinned)
+        for (i, digest), result in zip(misses, batch_results):
+            if 'error' in result:
+                results[i] = result
+                continue
+            result['image_id'] = image_ids[i]
+            RENDERS.remember(image_ids[i], images[i], result.get('detections', []))
+            if not pinned:
+                PREDICTIONS.put(digest, model_version, image_ids[i], result)
+            results[i] = result
+    return results
+
+
+
+# ── /render/<image_id> ────────────────────────────────────────────────────────
+def load_pending_for_render(image_id: str):
+    """
+    RenderCache fallback when this instance no longer has the prediction source:
+    (image bytes, detections) re-classified from the pending image, or None if it is gone.
+    """
+    UPLOADS.wait_for(image_id)
+    pending_path = f"pending_images/{image_id}.jpg"
+    if not STORE.exists(pending_path):
+        return None
+    image_bytes = STORE.read(pending_path)
+    return image_bytes, get_classification_result(image_bytes).get('detections', [])
+
+
+# ── Community review ──────────────────────────────────────────────────────────
+# PENDING is a cached, cursor-paginated view of the review queue's indexed query
+# (pending_feed.py), with near-duplicates collapsed. Signed URLs are reused until
+# close to expiry.
+PENDING = PendingFeed(lambda: track_call("firestore", "query", "/pending-images",
+                                         REVIEW_QUEUE.available, PENDING_LIST_LIMIT),
+                      DUPLICATES)
+SIGNED_URLS = SignedUrlCache(lambda name, expiration: track_call("gcs", "sign_url", "/pending-images",
+                                                                 STORE.signed_url, name, expiration=expiration))
+
+
+def _forget_pending(route: str, image_id: str) -> None:
+    """image_id left the review queue: drop its queue entry, cached listing entry and signed URL."""
+    PENDING.discard([image_id])
+    SIGNED_URLS.discard(f"{PENDING_PREFIX}{image_id}.jpg")
+    FANOUT.background(track_call, "firestore", "delete", route, REVIEW_QUEUE.remove, image_id)
+
+
+def pending_image_entry(item: dict, url: str) -> dict:
+    entry = {
+        "image_id": item["image_id"],
+        "image_url": url,
+        "created_at": item.get("created_at"),
+        "duplicate_ids": item.get("duplicate_ids", [])
+    }
+    if item.get("lease_owner"):
+        entry["lease_expires_at"] = datetime.fromtimestamp(item["lease_expires_at"], timezone.utc).isoformat()
+    return entry
+
+
+def parse_reviewer_id(value) -> str:
+    """
+    The lease owner for claim / release / community feedback. ValueError if it's
+    missing or the shared "anonymous" placeholder — every reviewer under that one
+    id could submit or take over images another one has claimed.
+    """
+    if not isinstance(value, str) or not value.strip() or value.strip().lower() == "anonymous":
+        raise ValueError("Missing user_id — sign in or send a per-session reviewer id")
+    return value
+
+
+def review_request(data: dict) -> tuple:
+    """(reviewer_id, image_ids) from a claim / release body; ValueError if either is malformed."""
+    reviewer_id = parse_reviewer_id(data.get('user_id'))
+    image_ids = data.get('image_ids') or []
+    if not isinstance(image_ids, list) or not all(isinstance(i, str) for i in image_ids):
+        raise ValueError("image_ids must be a list of strings")
+    return reviewer_id, image_ids
+
+
+def claim_pending(route: str, reviewer_id: str, count: int, preferred: list) -> list:
+    claimed = track_call("firestore", "transaction", route, REVIEW_QUEUE.claim, reviewer_id, count, preferred)
+    # Claimed images can't be handed to anyone else until the lease runs out
+    PENDING.discard([entry["image_id"] for entry in claimed])
+    return claimed
+
+
+def take_for_review(route: str, reviewer_id: str, image_id: str) -> bool:
+    """False if another reviewer holds the lease on image_id (community feedback answers 409)."""
+    return track_call("firestore", "transaction", route, REVIEW_QUEUE.take, reviewer_id, image_id)
+
+
+# One-off after deploying the review queue: queues the pending_images/ objects
+# uploaded before it existed (idempotent — already queued images are skipped).
+def backfill_review_queue(route: str) -> int:
+    objects = track_call("gcs", "list", route, STORE.list, prefix=PENDING_PREFIX)
+    added = REVIEW_QUEUE.backfill([info for info in objects if info.name != PENDING_PREFIX])
+    print(f"📥 Added {added} pending image(s) to the review queue")
+    return added
@@ -0,0 +1,220 @@
+"""
+service_metrics.py — Prometheus metrics for waste-classifier-eu (GET /metrics).
+
+print() output tells us that a request was slow, not where the time went. These
+metrics break every request down so p99 can be attributed and Cloud Run
+concurrency / worker settings can be tuned from data:
+
+  predict_stage_seconds{stage}                    read, decode, inference, render, upload, serialize
+  backend_call_seconds{service,op,route,outcome}  every GCS / Firestore call made by /feedback
+                                                  and /community-feedback
+  http_request_duration_seconds{route,method,status}
+  inference_batch_size                            images per forward pass (micro-batching)
+  http_requests_in_flight, inference_queue_depth, upload_queue_depth,
+  model_info{version,role}                        gauges, sampled when /metrics is scraped
+
+A small dependency-free registry renders the Prometheus text exposition format
+(version 0.0.4). Values are per process: with several gunicorn workers each scrape
+reports the worker that answered it (the "pid" label on process_info tells them apart).
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from request_tracing import record_span
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BATCH_BUCKETS   = (1, 2, 4, 8, 16, 32)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name          = name
+        self.documentation = documentation
+        self.labelnames    = tuple(labelnames)
+        self._lock         = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+
+class Gauge(_Metric):
+    """Set directly, or computed at scrape time by a callback returning a number or {label values: number}."""
+    kind = "gauge"
+
+    def __init__(self, *args, fn: Optional[Callable[[], Any]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._fn = fn
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn: Callable[[], Any]) -> None:
+        self._fn = fn
+
+    def samples(self) -> List[str]:
+        if self._fn is not None:
+            try:
+                value = self._fn()
+            except Exception as e:
+                print(f"⚠️ Metric {self.name} callback failed: {e}")
+                return []
+            items = sorted(value.items()) if isinstance(value, dict) else [((), value)]
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label values → [per-bucket counts..., sum, count]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {_number(cumulative)}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {_number(series[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def _add(self, metric: _Metric) -> Any:
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              fn: Optional[Callable[[], Any]] = None) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames, fn=fn))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets=buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+PREDICT_STAGE_SECONDS = METRICS.histogram(
+    "predict_stage_seconds", "Time spent in each stage of /predict and /predict/batch", ["stage"])
+BACKEND_CALL_SECONDS = METRICS.histogram(
+    "backend_call_seconds", "GCS and Firestore calls made by request handlers",
+    ["service", "op", "route", "outcome"])
+HTTP_REQUEST_SECONDS = METRICS.histogram(
+    "http_request_duration_seconds", "End-to-end request handling time", ["route", "method", "status"])
+INFERENCE_BATCH_SIZE = METRICS.histogram(
+    "inference_batch_size", "Images per forward pass of the micro-batching scheduler", buckets=BATCH_BUCKETS)
+IN_FLIGHT = METRICS.gauge(
+    "http_requests_in_flight", "Requests currently being handled by this process")
+INFERENCE_QUEUE_DEPTH = METRICS.gauge(
+    "inference_queue_depth", "Requests waiting for a forward pass")
+UPLOAD_QUEUE_DEPTH = METRICS.gauge(
+    "upload_queue_depth", "Pending-image uploads queued or running")
+FEEDBACK_WRITE_QUEUE_DEPTH = METRICS.gauge(
+    "feedback_write_queue_depth", "Feedback metadata documents waiting for a batched Firestore commit")
+MODEL_INFO = METRICS.gauge(
+    "model_info", "Resident model versions by role (1 = serving, 0 = shadow candidate or standby)", ["version", "role"])
+PROCESS_INFO = METRICS.gauge(
+    "process_info", "The process that answered this scrape", ["pid"], fn=lambda: {(str(os.getpid()),): 1})
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Record a /predict stage in predict_stage_seconds and as a span on the current trace."""
+    PREDICT_STAGE_SECONDS.observe(seconds, stage=stage)
+    record_span(stage, seconds)
+
+
+def track_call(service: str, op: str, route: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run fn(*args, **kwargs) and record how long it took in backend_call_seconds and as a span."""
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        return fn(*args, **kwargs)
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        BACKEND_CALL_SECONDS.observe(elapsed, service=service, op=op, route=route, outcome=outcome)
+        record_span(f"{service}.{op}", elapsed, outcome=outcome)
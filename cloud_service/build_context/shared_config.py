@@ -0,0 +1,187 @@
+"""
+shared_config.py — One in-memory copy of shared/class_map.json, model_meta.json and tips.json.
+
+/feedback and /community-feedback used to open and json.load class_map.json on
+every request, prediction_service.py parsed it again for itself and kept the
+recycling tips in its own TIPS_MAP. CONFIG now loads the three files once into an
+immutable SharedConfig snapshot with the lookups the hot paths need precomputed:
+
+  index_to_name  {0: "glass", ...}
+  name_to_index  {"glass": 0, ...} — lowercase keys (feedback labels are lowercased)
+  tips           {"GLASS": "Empty, rinse, ...", ...} — uppercase keys
+  model_meta     model_meta.json as a dict (engine, decode_size and inference_policy
+                 are applied at startup; the version is read on every model load)
+
+CONFIG.current() is a lock-free read of the snapshot. At most every
+CONFIG_CHECK_INTERVAL_S it also stats the three files and reloads when one of
+them changed (a bad edit is logged and the previous snapshot stays in service).
+
+Every snapshot is validated: index_to_name and name_to_index must describe the
+same classes, and — once a model is loaded — the model's `names` must match the
+class map, otherwise feedback would be written under the wrong class index for
+the next retraining run. prediction_service.activate_model() calls
+CONFIG.bind_model() on every swap, so a hot-reloaded model with a different head
+is reported at once. Problems show up in the log and under "shared_config" in
+/health.
+
+retraining/retrain_model.py and the Kaggle notebook build dataset.yaml from the
+same class_map.json, so label indices can't drift between serving and training;
+retrain_model.py loads this file for parse_class_map() and model_name_mismatches(),
+so keep it stdlib-only.
+"""
+
+import os
+import json
+import time
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+# shared/ contains class_map.json, model_meta.json and tips.json.
+# In Docker these are copied alongside main.py. Locally they live at the repo root.
+BASE_DIR       = os.path.dirname(os.path.abspath(__file__))
+_shared_docker = os.path.join(BASE_DIR, 'shared')
+_shared_local  = os.path.join(BASE_DIR, '..', '..', 'shared')
+SHARED_DIR     = _shared_docker if os.path.isfile(os.path.join(_shared_docker, 'class_map.json')) else _shared_local
+
+CLASS_MAP_PATH  = os.path.join(SHARED_DIR, 'class_map.json')
+MODEL_META_PATH = os.path.join(SHARED_DIR, 'model_meta.json')
+TIPS_PATH       = os.path.join(SHARED_DIR, 'tips.json')
+
+CONFIG_CHECK_INTERVAL_S = float(os.getenv("CONFIG_CHECK_INTERVAL_S", "10"))
+
+DEFAULT_TIP = "Sorting instructions not found. Check local guidelines."
+
+
+class SharedConfig(NamedTuple):
+    """An immutable snapshot of the shared config files. CONFIG swaps it as a whole."""
+    index_to_name: Dict[int, str]
+    name_to_index: Dict[str, int]
+    model_meta:    Dict[str, Any]
+    tips:          Dict[str, str]
+    loaded_at:     float
+
+    def tip_for(self, label: str) -> str:
+        return self.tips.get((label or "").upper(), DEFAULT_TIP)
+
+
+EMPTY = SharedConfig({}, {}, {}, {}, 0.0)
+
+
+def _read_json(path: str) -> Dict[str, Any]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def parse_class_map(class_data: Dict[str, Any]) -> Tuple[Dict[int, str], Dict[str, int]]:
+    """index_to_name / name_to_index from class_map.json. Raises ValueError if they disagree."""
+    index_to_name = {int(k): str(v).lower() for k, v in class_data.get('index_to_name', {}).items()}
+    name_to_index = {str(k).lower(): int(v) for k, v in class_data.get('name_to_index', {}).items()}
+    if not index_to_name:
+        raise ValueError("class_map.json has no index_to_name entries")
+    if name_to_index != {name: index for index, name in index_to_name.items()}:
+        raise ValueError("class_map.json: index_to_name and name_to_index describe different classes")
+    return index_to_name, name_to_index
+
+
+def model_name_mismatches(index_to_name: Dict[int, str], model_names: Dict[int, str]) -> List[str]:
+    """Differences between the class map and a model's `names` ([] if they agree)."""
+    problems = []
+    for index in sorted(set(index_to_name) | set(model_names)):
+        ours, theirs = index_to_name.get(index), model_names.get(index)
+        theirs = str(theirs).lower() if theirs is not None else None
+        if ours != theirs:
+            problems.append(f"class {index}: class_map={ours!r} model={theirs!r}")
+    return problems
+
+
+class ConfigRegistry:
+    """Loads the shared config files once and reloads them when they change."""
+
+    def __init__(self, class_map_path: str = CLASS_MAP_PATH, model_meta_path: str = MODEL_META_PATH,
+                 tips_path: str = TIPS_PATH, check_interval_s: float = CONFIG_CHECK_INTERVAL_S):
+        self.paths            = (class_map_path, model_meta_path, tips_path)
+        self.check_interval_s = check_interval_s
+        self._lock            = threading.Lock()
+        self._config          = EMPTY
+        self._mtimes: Tuple[Optional[float], ...] = (None, None, None)
+        self._next_check      = 0.0
+        self._model_names: Optional[Dict[int, str]] = None
+        self.loads            = 0
+        self.last_error: Optional[str] = None
+        self.problems: List[str] = []
+
+    def current(self) -> SharedConfig:
+        """The current snapshot; stats the files at most every check_interval_s."""
+        if time.monotonic() >= self._next_check:
+            self.reload_if_changed()
+        return self._config
+
+    def reload_if_changed(self) -> bool:
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval_s
+            mtimes = tuple(_mtime(path) for path in self.paths)
+            if mtimes == self._mtimes:
+                return False
+            self._mtimes = mtimes
+            return self._load()
+
+    def _load(self) -> bool:
+        class_map_path, model_meta_path, tips_path = self.paths
+        try:
+            index_to_name, name_to_index = parse_class_map(_read_json(class_map_path))
+            model_meta = _read_json(model_meta_path) if os.path.exists(model_meta_path) else {}
+            tips = _read_json(tips_path) if os.path.exists(tips_path) else {}
+            tips = {k.upper(): v for k, v in tips.items() if not k.startswith('_')}
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"❌ Could not load shared config from {os.path.dirname(class_map_path)}: {e}")
+            return False
+
+        missing_tips = sorted(name for name in name_to_index if name.upper() not in tips)
+        if missing_tips:
+            print(f"⚠️ tips.json has no tip for: {', '.join(missing_tips)}")
+        self._config    = SharedConfig(index_to_name, name_to_index, model_meta, tips, time.time())
+        self.last_error = None
+        self.loads     += 1
+        self._validate()
+        if self.loads > 1:
+            print(f"🔄 Reloaded shared config ({len(index_to_name)} classes, "
+                  f"model_meta version {model_meta.get('version')})")
+        return True
+
+    def bind_model(self, names: Dict[int, str]) -> List[str]:
+        """Validate the class map against a newly activated model's names."""
+        self.current()
+        with self._lock:
+            self._model_names = {int(k): v for k, v in dict(names).items()}
+            return self._validate()
+
+    def _validate(self) -> List[str]:
+        if self._model_names is None:
+            self.problems = []
+        else:
+            self.problems = model_name_mismatches(self._config.index_to_name, self._model_names)
+        if self.problems:
+            print(f"❌ class_map.json does not match the model's names: {'; '.join(self.problems)}")
+        return self.problems
+
+    def status(self) -> Dict[str, Any]:
+        config = self._config
+        return {
+            "classes":      len(config.index_to_name),
+            "loaded_at":    config.loaded_at or None,
+            "reloads":      max(0, self.loads - 1),
+            "model_names":  "unchecked" if self._model_names is None else ("ok" if not self.problems else "mismatch"),
+            "problems":     list(self.problems),
+            "last_error":   self.last_error,
+        }
+
+
+CONFIG = ConfigRegistry()
@@ -0,0 +1,99 @@
+"""
+startup.py — Cold-start orchestrator for the waste-classifier-eu container.
+
+The container used to start serially at import time: download best_latest.pt,
+import torch/ultralytics, load YOLO, initialize Firebase, and only JIT-warm the
+model on the first real request. StartupOrchestrator runs those phases on a
+background thread instead, with the independent ones in parallel:
+
+    ┌ credentials (Firebase Admin + Firestore client)
+    ├ runtime     (import ultralytics / torch)          ┐
+    └ weights     (GCS generation/md5 check, download)  ┴→ model (load engine) → warmup
+
+Every phase is timed and the breakdown is printed once startup finishes and
+returned by GET /health. /health answers 503 until the warmup has run, so a
+Cloud Run startup/readiness probe pointed at it only routes traffic to a warm
+instance. Requests that do arrive early wait up to STARTUP_WAIT_S for readiness.
+
+A failing phase is recorded (and reported) but does not stop the others — the
+service still comes up, exactly as the old import-time code did.
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+STARTUP_WAIT_S = float(os.getenv("STARTUP_WAIT_S", "60"))
+
+
+class StartupOrchestrator:
+    """Runs a startup plan in the background and tracks per-phase timings and readiness."""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str]    = {}
+        self._ready    = threading.Event()
+        self._lock     = threading.Lock()
+        self._started  = None
+        self._finished = None
+
+    # ── Phases ────────────────────────────────────────────────────────────────
+    def run(self, name: str, fn: Callable[..., Any], *args) -> Optional[Any]:
+        """Run one phase, recording its duration. Returns None if it raised."""
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        except Exception as e:
+            print(f"❌ Startup phase '{name}' failed: {e}")
+            with self._lock:
+                self.errors[name] = str(e)
+            return None
+        finally:
+            with self._lock:
+                self.timings[name] = round(time.perf_counter() - start, 3)
+
+    def run_parallel(self, phases: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+        """Run independent phases concurrently; returns {name: result or None}."""
+        with ThreadPoolExecutor(max_workers=len(phases), thread_name_prefix="startup") as pool:
+            futures = {name: pool.submit(self.run, name, fn) for name, fn in phases.items()}
+            return {name: future.result() for name, future in futures.items()}
+
+    # ── Lifecycle ─────────────────────────────────────────────────────────────
+    def start(self, plan: Callable[["StartupOrchestrator"], None]) -> None:
+        """Run plan(self) on a background thread and mark the service ready when it returns."""
+        self._started = time.perf_counter()
+        threading.Thread(target=self._run_plan, args=(plan,), name="startup", daemon=True).start()
+
+    def _run_plan(self, plan: Callable[["StartupOrchestrator"], None]) -> None:
+        try:
+            plan(self)
+        except Exception as e:
+            print(f"❌ Startup plan failed: {e}")
+            self.errors["plan"] = str(e)
+        finally:
+            self._finished = time.perf_counter()
+            self._ready.set()
+            phases = "  ".join(f"{name}={secs:.2f}s" for name, secs in self.timings.items())
+            print(f"⏱️ Startup complete in {self._finished - self._started:.2f}s — {phases}")
+
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait(self, timeout: float = STARTUP_WAIT_S) -> bool:
+        """Block until startup finishes (or timeout). Returns readiness."""
+        return self._ready.wait(timeout)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            total = None
+            if self._started is not None:
+                end   = self._finished if self._finished is not None else time.perf_counter()
+                total = round(end - self._started, 3)
+            return {
+                "ready":    self._ready.is_set(),
+                "total_s":  total,
+                "phases_s": dict(self.timings),
+                "errors":   dict(self.errors),
+            }
@@ -0,0 +1,888 @@
+"""
+storage_backends.py — Object store and document store behind one small interface.
+
+main.py, asgi_main.py, upload_queue.py and prediction_service.py used to call
+firebase_admin.storage.bucket() / google.cloud.storage.Client() / firestore.client()
+at every call site: a new Bucket object per request, a second client (and HTTP
+session) just for the weights check, and no way to run the service without the
+real bucket. They now go through two interfaces:
+
+  ObjectStore    stat, exists, read, download, write, copy, delete, list, signed_url
+                 (write/copy/delete take if_generation_match, 0 = "must not exist")
+  DocumentStore  add, get, set, update, delete, stream — documents addressed by
+                 "collection/id" paths; SERVER_TIMESTAMP resolves on write,
+                 Increment(n) adds to a number server-side; commit() applies
+                 several create/set/update writes atomically (a Firestore batch);
+                 query() filters / orders / limits a collection (Firestore serves
+                 it from an index); transaction() runs reads + writes atomically
+
+with three implementations, picked by STORAGE_BACKEND:
+
+  gcs     (default) GCS + Firestore. One storage client and one Firestore client
+          per process, created on first use (and again after a fork — gunicorn
+          workers must not share the master's connections), authenticated with
+          the Firebase service account. The storage client's HTTP session keeps
+          up to STORAGE_POOL_SIZE connections alive, enough for the gunicorn
+          threads plus the upload queue to reuse connections instead of
+          opening new TLS sessions.
+  local   Files under STORAGE_LOCAL_DIR/objects/<bucket>/ (metadata in a .meta/
+          sidecar) and JSON documents under STORAGE_LOCAL_DIR/documents/ —
+          survives restarts, easy to inspect.
+  memory  Process-local dicts; STORAGE_MEMORY_LATENCY_MS delays every call so
+          benchmarks still pay for a round trip (cloud_service/benchmark/).
+
+object_store(bucket) and document_store() return one shared instance per process.
+"""
+
+import os
+import json
+import time
+import operator
+import base64
+import shutil
+import hashlib
+import itertools
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+STORAGE_BACKEND           = os.getenv("STORAGE_BACKEND", "gcs").lower()
+STORAGE_LOCAL_DIR         = os.getenv("STORAGE_LOCAL_DIR", "/tmp/waste-classifier-storage")
+STORAGE_MEMORY_LATENCY_MS = float(os.getenv("STORAGE_MEMORY_LATENCY_MS", "0"))
+STORAGE_POOL_SIZE         = int(os.getenv("STORAGE_POOL_SIZE", "32"))
+FIREBASE_CREDENTIALS      = os.getenv("FIREBASE_CREDENTIALS", "serviceAccountKey.json")
+
+# Placeholder for "the server's commit time" in document writes
+SERVER_TIMESTAMP = object()
+
+
+class Increment(NamedTuple):
+    """Field value that adds amount to the stored number atomically (missing field = 0)."""
+    amount: float
+
+
+class DocumentWrite(NamedTuple):
+    """One write of a DocumentStore.commit() batch: op is "create", "set" or "update"."""
+    op:   str
+    path: str
+    data: Dict[str, Any]
+
+
+class DocumentTransaction:
+    """The reads and staged writes of one DocumentStore.transaction() (all reads must come first)."""
+
+    def __init__(self, read: Callable[[str], Optional[Dict[str, Any]]]):
+        self._read = read
+        self.writes: List[DocumentWrite] = []
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        return self._read(path)
+
+    def create(self, path: str, data: Dict[str, Any]) -> None:
+        self.writes.append(DocumentWrite("create", path, data))
+
+    def set(self, path: str, data: Dict[str, Any]) -> None:
+        self.writes.append(DocumentWrite("set", path, data))
+
+    def update(self, path: str, data: Dict[str, Any]) -> None:
+        self.writes.append(DocumentWrite("update", path, data))
+
+
+class NotFound(Exception):
+    """The object or document does not exist."""
+
+
+class PreconditionFailed(Exception):
+    """if_generation_match did not match the object's current generation."""
+
+
+class AlreadyExists(Exception):
+    """A "create" write found the document already there."""
+
+
+class ObjectInfo(NamedTuple):
+    name:         str
+    size:         int
+    generation:   Optional[int]
+    md5_hash:     Optional[str]  # base64, as GCS reports it
+    content_type: Optional[str]
+    metadata:     Dict[str, str]
+    time_created: Optional[datetime]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _md5_base64(data: bytes) -> str:
+    return base64.b64encode(hashlib.md5(data).digest()).decode("ascii")
+
+
+# ── Interfaces ────────────────────────────────────────────────────────────────
+class ObjectStore:
+    """A bucket of named blobs."""
+    bucket_name = ""
+
+    def stat(self, name: str) -> Optional[ObjectInfo]:
+        raise NotImplementedError
+
+    def exists(self, name: str) -> bool:
+        return self.stat(name) is not None
+
+    def read(self, name: str) -> bytes:
+        raise NotImplementedError
+
+    def download(self, name: str, path: str) -> None:
+        data = self.read(name)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def write(self, name: str, data, content_type: Optional[str] = None,
+              metadata: Optional[Dict[str, str]] = None, if_generation_match: Optional[int] = None) -> None:
+        raise NotImplementedError
+
+    def copy(self, source: str, destination: str, if_generation_match: Optional[int] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, name: str, if_generation_match: Optional[int] = None) -> None:
+        raise NotImplementedError
+
+    def list(self, prefix: str = "", max_results: Optional[int] = None) -> List[ObjectInfo]:
+        raise NotImplementedError
+
+    def signed_url(self, name: str, expiration: int = 3600) -> str:
+        raise NotImplementedError
+
+    def connect(self) -> None:
+        """Create the underlying client now rather than on the first call (startup)."""
+
+
+class DocumentStore:
+    """Firestore-style documents addressed by "collection/id[/subcollection/id...]" paths."""
+
+    def add(self, collection: str, data: Dict[str, Any]) -> str:
+        raise NotImplementedError
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def set(self, path: str, data: Dict[str, Any], merge: bool = False) -> None:
+        raise NotImplementedError
+
+    def update(self, path: str, data: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def delete(self, path: str) -> None:
+        raise NotImplementedError
+
+    def stream(self, collection: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        raise NotImplementedError
+
+    def query(self, collection: str, where: List[Tuple[str, str, Any]] = (),
+              order_by: List[Tuple[str, str]] = (), limit: Optional[int] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        (id, data) of the documents in collection matching every (field, op, value)
+        in where (op: ==, <, <=, >, >=, in), sorted by order_by [(field, "asc"|"desc")]
+        then by id. Documents missing a filtered or ordered field are left out, as
+        in Firestore — which needs a composite index for each such query.
+        """
+        raise NotImplementedError
+
+    def commit(self, writes: List[DocumentWrite]) -> None:
+        """
+        Apply all writes in one round trip, atomically: if a "create" target exists
+        (AlreadyExists) or an "update" target doesn't (NotFound), nothing is written.
+        """
+        raise NotImplementedError
+
+    def transaction(self, fn: Callable[[DocumentTransaction], Any]) -> Any:
+        """
+        Run fn(txn) and apply its staged writes atomically with its reads: nothing it
+        read changes before the writes land. Firestore re-runs fn when another
+        transaction got there first, so fn must have no other side effects.
+        """
+        raise NotImplementedError
+
+    def connect(self) -> None:
+        """Create the underlying client now rather than on the first call (startup)."""
+
+
+# ── GCS / Firestore ───────────────────────────────────────────────────────────
+_firebase_lock = threading.Lock()
+
+
+def init_firebase(credentials_path: str = FIREBASE_CREDENTIALS) -> None:
+    """Initialize the default Firebase app once (thread-safe; startup phases run in parallel)."""
+    import firebase_admin
+    from firebase_admin import credentials
+    with _firebase_lock:
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(credentials.Certificate(credentials_path))
+
+
+def _widen_http_pool(client: Any) -> None:
+    """Let the client's requests session keep STORAGE_POOL_SIZE connections per host alive."""
+    try:
+        from requests.adapters import HTTPAdapter
+        client._http.mount("https://", HTTPAdapter(pool_connections=STORAGE_POOL_SIZE,
+                                                   pool_maxsize=STORAGE_POOL_SIZE))
+    except Exception as e:
+        print(f"⚠️ Could not resize the storage connection pool: {e}")
+
+
+class _PerProcess:
+    """A lazily created value that is re-created in a forked child."""
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._lock    = threading.Lock()
+        self._value   = None
+        self._pid     = None
+
+    def get(self) -> Any:
+        if self._value is None or self._pid != os.getpid():
+            with self._lock:
+                if self._value is None or self._pid != os.getpid():
+                    self._value = self._factory()
+                    self._pid   = os.getpid()
+        return self._value
+
+
+class GCSObjectStore(ObjectStore):
+    def __init__(self, bucket_name: str, client_factory: Optional[Callable[[], Any]] = None):
+        self.bucket_name = bucket_name
+        self._client_factory = client_factory or self._firebase_client
+        self._bucket = _PerProcess(self._make_bucket)
+
+    def _firebase_client(self) -> Any:
+        from firebase_admin import storage
+        init_firebase()
+        return storage.bucket(self.bucket_name).client
+
+    def _make_bucket(self) -> Any:
+        client = self._client_factory()
+        _widen_http_pool(client)
+        return client.bucket(self.bucket_name)
+
+    def connect(self) -> None:
+        self._bucket.get()
+
+    @staticmethod
+    def _info(blob: Any) -> ObjectInfo:
+        return ObjectInfo(blob.name, blob.size or 0, blob.generation, blob.md5_hash,
+                          blob.content_type, dict(blob.metadata or {}), blob.time_created)
+
+    @staticmethod
+    def _translate(e: Exception) -> Exception:
+        code = getattr(e, "code", None)
+        if code == 404:
+            return NotFound(str(e))
+        if code == 412:
+            return PreconditionFailed(str(e))
+        return e
+
+    def stat(self, name: str) -> Optional[ObjectInfo]:
+        blob = self._bucket.get().get_blob(name)
+        return self._info(blob) if blob is not None else None
+
+    def exists(self, name: str) -> bool:
+        return self._bucket.get().blob(name).exists()
+
+    def read(self, name: str) -> bytes:
+        try:
+            return self._bucket.get().blob(name).download_as_bytes()
+        except Exception as e:
+            raise self._translate(e)
+
+    def download(self, name: str, path: str) -> None:
+        try:
+            self._bucket.get().blob(name).download_to_filename(path)
+        except Exception as e:
+            raise self._translate(e)
+
+    def write(self, name: str, data, content_type: Optional[str] = None,
+              metadata: Optional[Dict[str, str]] = None, if_generation_match: Optional[int] = None) -> None:
+        blob = self._bucket.get().blob(name)
+        if metadata:
+            blob.metadata = metadata
+        try:
+            blob.upload_from_string(data, content_type=content_type or "application/octet-stream",
+                                    if_generation_match=if_generation_match)
+        except Exception as e:
+            raise self._translate(e)
+
+    def copy(self, source: str, destination: str, if_generation_match: Optional[int] = None) -> None:
+        bucket = self._bucket.get()
+        try:
+            bucket.copy_blob(bucket.blob(source), bucket, destination, if_generation_match=if_generation_match)
+        except Exception as e:
+            raise self._translate(e)
+
+    def delete(self, name: str, if_generation_match: Optional[int] = None) -> None:
+        try:
+            self._bucket.get().blob(name).delete(if_generation_match=if_generation_match)
+        except Exception as e:
+            raise self._translate(e)
+
+    def list(self, prefix: str = "", max_results: Optional[int] = None) -> List[ObjectInfo]:
+        return [self._info(blob) for blob in self._bucket.get().list_blobs(prefix=prefix, max_results=max_results)]
+
+    def signed_url(self, name: str, expiration: int = 3600) -> str:
+        return self._bucket.get().blob(name).generate_signed_url(version="v4", expiration=expiration, method="GET")
+
+
+class FirestoreDocumentStore(DocumentStore):
+    def __init__(self, client_factory: Optional[Callable[[], Any]] = None):
+        self._client = _PerProcess(client_factory or self._firebase_client)
+
+    @staticmethod
+    def _firebase_client() -> Any:
+        from firebase_admin import firestore
+        init_firebase()
+        return firestore.client()
+
+    def connect(self) -> None:
+        self._client.get()
+
+    @staticmethod
+    def _encode(data: Dict[str, Any]) -> Dict[str, Any]:
+        from firebase_admin import firestore
+        encoded = {}
+        for k, v in data.items():
+            if v is SERVER_TIMESTAMP:
+                v = firestore.SERVER_TIMESTAMP
+            elif isinstance(v, Increment):
+                v = firestore.Increment(v.amount)
+            encoded[k] = v
+        return encoded
+
+    @staticmethod
+    def _translate(e: Exception) -> Exception:
+        code, name = getattr(e, "code", None), type(e).__name__
+        if code == 404 or name == "NotFound":
+            return NotFound(str(e))
+        if code == 409 or name in ("AlreadyExists", "Conflict"):
+            return AlreadyExists(str(e))
+        return e
+
+    def add(self, collection: str, data: Dict[str, Any]) -> str:
+        _, ref = self._client.get().collection(collection).add(self._encode(data))
+        return ref.id
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        snapshot = self._client.get().document(path).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def set(self, path: str, data: Dict[str, Any], merge: bool = False) -> None:
+        self._client.get().document(path).set(self._encode(data), merge=merge)
+
+    def update(self, path: str, data: Dict[str, Any]) -> None:
+        try:
+            self._client.get().document(path).update(self._encode(data))
+        except Exception as e:
+            raise self._translate(e)
+
+    def commit(self, writes: List[DocumentWrite]) -> None:
+        client = self._client.get()
+        batch = client.batch()
+        for write in writes:
+            ref = client.document(write.path)
+            if write.op == "create":
+                batch.create(ref, self._encode(write.data))
+            elif write.op == "update":
+                batch.update(ref, self._encode(write.data))
+            else:
+                batch.set(ref, self._encode(write.data))
+        try:
+            batch.commit()
+        except Exception as e:
+            raise self._translate(e)
+
+    def transaction(self, fn: Callable[[DocumentTransaction], Any]) -> Any:
+        from firebase_admin import firestore
+        client = self._client.get()
+
+        @firestore.transactional
+        def run(transaction: Any) -> Any:
+            def read(path: str) -> Optional[Dict[str, Any]]:
+                snapshot = client.document(path).get(transaction=transaction)
+                return snapshot.to_dict() if snapshot.exists else None
+
+            txn = DocumentTransaction(read)
+            result = fn(txn)
+            for write in txn.writes:
+                getattr(transaction, write.op)(client.document(write.path), self._encode(write.data))
+            return result
+
+        try:
+            return run(client.transaction())
+        except Exception as e:
+            raise self._translate(e)
+
+    def delete(self, path: str) -> None:
+        self._client.get().document(path).delete()
+
+    def stream(self, collection: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for snapshot in self._client.get().collection(collection).stream():
+            yield snapshot.id, snapshot.to_dict()
+
+    def query(self, collection: str, where: List[Tuple[str, str, Any]] = (),
+              order_by: List[Tuple[str, str]] = (), limit: Optional[int] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        query = self._client.get().collection(collection)
+        for field, op, value in where:
+            query = query.where(field, op, value)
+        for field, direction in order_by:
+            query = query.order_by(field, direction="DESCENDING" if direction == "desc" else "ASCENDING")
+        if limit:
+            query = query.limit(limit)
+        return [(snapshot.id, snapshot.to_dict()) for snapshot in query.stream()]
+
+
+# ── In-memory ─────────────────────────────────────────────────────────────────
+_generations = itertools.count(1)
+
+
+class _Stored(NamedTuple):
+    data: bytes
+    info: ObjectInfo
+
+
+def _stored(name: str, data: bytes, content_type: Optional[str], metadata: Optional[Dict[str, str]]) -> _Stored:
+    return _Stored(data, ObjectInfo(name, len(data), next(_generations), _md5_base64(data),
+                                    content_type or "application/octet-stream", dict(metadata or {}), _now()))
+
+
+def _check_generation(name: str, current: Optional[ObjectInfo], if_generation_match: Optional[int]) -> None:
+    if if_generation_match is None:
+        return
+    generation = current.generation if current is not None else 0
+    if int(if_generation_match) != generation:
+        raise PreconditionFailed(f"{name}: generation {generation} != {if_generation_match}")
+
+
+def _resolve(data: Dict[str, Any], current: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """data with SERVER_TIMESTAMP and Increment replaced by values (current = the stored document)."""
+    resolved = {}
+    for k, v in data.items():
+        if v is SERVER_TIMESTAMP:
+            v = _now()
+        elif isinstance(v, Increment):
+            v = (current or {}).get(k, 0) + v.amount
+        resolved[k] = v
+    return resolved
+
+
+_QUERY_OPS = {
+    "==": operator.eq, "<": operator.lt, "<=": operator.le,
+    ">": operator.gt, ">=": operator.ge, "in": lambda value, options: value in options,
+}
+
+
+def _run_query(items: List[Tuple[str, Dict[str, Any]]], where: List[Tuple[str, str, Any]],
+               order_by: List[Tuple[str, str]], limit: Optional[int]) -> List[Tuple[str, Dict[str, Any]]]:
+    """DocumentStore.query() over (id, data) pairs sorted by id."""
+    fields = [field for field, _, _ in where] + [field for field, _ in order_by]
+    matched = [(i, data) for i, data in items
+               if all(field in data for field in fields)
+               and all(_QUERY_OPS[op](data[field], value) for field, op, value in where)]
+    for field, direction in reversed(list(order_by)):
+        matched.sort(key=lambda item: item[1][field], reverse=direction == "desc")
+    return matched[:limit] if limit else matched
+
+
+def _apply(write: DocumentWrite, current: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """The document after write, given the stored one (None = missing); raises like Firestore."""
+    if write.op == "create" and current is not None:
+        raise AlreadyExists(write.path)
+    if write.op == "update":
+        if current is None:
+            raise NotFound(write.path)
+        return {**current, **_resolve(write.data, current)}
+    return _resolve(write.data)
+
+
+class InMemoryObjectStore(ObjectStore):
+    def __init__(self, bucket_name: str, latency_ms: float = STORAGE_MEMORY_LATENCY_MS):
+        self.bucket_name = bucket_name
+        self._latency_s  = max(0.0, latency_ms) / 1000.0
+        self._lock       = threading.Lock()
+        self._objects: Dict[str, _Stored] = {}
+
+    def _delay(self) -> None:
+        if self._latency_s:
+            time.sleep(self._latency_s)
+
+    def stat(self, name: str) -> Optional[ObjectInfo]:
+        self._delay()
+        with self._lock:
+            stored = self._objects.get(name)
+        return stored.info if stored is not None else None
+
+    def read(self, name: str) -> bytes:
+        self._delay()
+        with self._lock:
+            stored = self._objects.get(name)
+        if stored is None:
+            raise NotFound(f"{self.bucket_name}/{name}")
+        return stored.data
+
+    def write(self, name: str, data, content_type: Optional[str] = None,
+              metadata: Optional[Dict[str, str]] = None, if_generation_match: Optional[int] = None) -> None:
+        data = data.encode("utf-8") if isinstance(data, str) else bytes(data)
+        self._delay()
+        with self._lock:
+            current = self._objects.get(name)
+            _check_generation(name, current.info if current else None, if_generation_match)
+            self._objects[name] = _stored(name, data, content_type, metadata)
+
+    def copy(self, source: str, destination: str, if_generation_match: Optional[int] = None) -> None:
+        self._delay()
+        with self._lock:
+            stored = self._objects.get(source)
+            if stored is None:
+                raise NotFound(f"{self.bucket_name}/{source}")
+            current = self._objects.get(destination)
+            _check_generation(destination, current.info if current else None, if_generation_match)
+            self._objects[destination] = _stored(destination, stored.data, stored.info.content_type,
+                                                 stored.info.metadata)
+
+    def delete(self, name: str, if_generation_match: Optional[int] = None) -> None:
+        self._delay()
+        with self._lock:
+            current = self._objects.get(name)
+            if current is None:
+                raise NotFound(f"{self.bucket_name}/{name}")
+            _check_generation(name, current.info, if_generation_match)
+            del self._objects[name]
+
+    def list(self, prefix: str = "", max_results: Optional[int] = None) -> List[ObjectInfo]:
+        self._delay()
+        with self._lock:
+            infos = [stored.info for name, stored in sorted(self._objects.items()) if name.startswith(prefix)]
+        return infos[:max_results] if max_results else infos
+
+    def signed_url(self, name: str, expiration: int = 3600) -> str:
+        return f"memory://{self.bucket_name}/{name}?expires_in={expiration}"
+
+
+class InMemoryDocumentStore(DocumentStore):
+    def __init__(self, latency_ms: float = STORAGE_MEMORY_LATENCY_MS):
+        self._latency_s = max(0.0, latency_ms) / 1000.0
+        self._lock      = threading.Lock()
+        self._ids       = itertools.count(1)
+        self._documents: Dict[str, Dict[str, Any]] = {}
+
+    def _delay(self) -> None:
+        if self._latency_s:
+            time.sleep(self._latency_s)
+
+    def add(self, collection: str, data: Dict[str, Any]) -> str:
+        document_id = f"doc{next(self._ids):012d}"
+        self.set(f"{collection}/{document_id}", data)
+        return document_id
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        self._delay()
+        with self._lock:
+            data = self._documents.get(path)
+        return dict(data) if data is not None else None
+
+    def set(self, path: str, data: Dict[str, Any], merge: bool = False) -> None:
+        self._delay()
+        with self._lock:
+            if merge and path in self._documents:
+                self._documents[path].update(_resolve(data, self._documents[path]))
+            else:
+                self._documents[path] = _resolve(data)
+
+    def update(self, path: str, data: Dict[str, Any]) -> None:
+        self._delay()
+        with self._lock:
+            if path not in self._documents:
+                raise NotFound(path)
+            self._documents[path].update(_resolve(data, self._documents[path]))
+
+    def commit(self, writes: List[DocumentWrite]) -> None:
+        self._delay()
+        with self._lock:
+            self._commit(writes)
+
+    def _commit(self, writes: List[DocumentWrite]) -> None:
+        staged: Dict[str, Dict[str, Any]] = {}
+        for write in writes:
+            current = staged[write.path] if write.path in staged else self._documents.get(write.path)
+            staged[write.path] = _apply(write, current)
+        self._documents.update(staged)
+
+    def transaction(self, fn: Callable[[DocumentTransaction], Any]) -> Any:
+        self._delay()
+        with self._lock:
+            txn = DocumentTransaction(lambda path: dict(self._documents[path]) if path in self._documents else None)
+            result = fn(txn)
+            self._commit(txn.writes)
+        return result
+
+    def delete(self, path: str) -> None:
+        self._delay()
+        with self._lock:
+            self._documents.pop(path, None)
+
+    def stream(self, collection: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        self._delay()
+        prefix = collection + "/"
+        with self._lock:
+            items = [(path[len(prefix):], dict(data)) for path, data in sorted(self._documents.items())
+                     if path.startswith(prefix) and "/" not in path[len(prefix):]]
+        return iter(items)
+
+    def query(self, collection: str, where: List[Tuple[str, str, Any]] = (),
+              order_by: List[Tuple[str, str]] = (), limit: Optional[int] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        return _run_query(list(self.stream(collection)), where, order_by, limit)
+
+
+# ── Local filesystem ──────────────────────────────────────────────────────────
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class LocalObjectStore(ObjectStore):
+    """Objects as plain files under root; content type, metadata and generation in root/.meta/<name>.json."""
+
+    def __init__(self, bucket_name: str, root: str):
+        self.bucket_name = bucket_name
+        self.root        = os.path.abspath(root)
+        self._lock       = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, name))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Object name escapes the store: {name}")
+        return path
+
+    def _meta_path(self, name: str) -> str:
+        return os.path.join(self.root, ".meta", name + ".json")
+
+    def _info(self, name: str) -> Optional[ObjectInfo]:
+        path = self._path(name)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(self._meta_path(name), "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+        created = meta.get("time_created")
+        return ObjectInfo(name, os.path.getsize(path), meta.get("generation"), meta.get("md5_hash"),
+                          meta.get("content_type"), meta.get("metadata") or {},
+                          datetime.fromisoformat(created) if created else None)
+
+    def _put(self, name: str, data: bytes, content_type: Optional[str], metadata: Optional[Dict[str, str]]) -> None:
+        path, meta_path = self._path(name), self._meta_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        with open(path + ".part", "wb") as f:
+            f.write(data)
+        os.replace(path + ".part", path)
+        with open(meta_path, "w") as f:
+            json.dump({
+                "generation":   time.time_ns(),
+                "md5_hash":     _md5_base64(data),
+                "content_type": content_type or "application/octet-stream",
+                "metadata":     dict(metadata or {}),
+                "time_created": _now().isoformat(),
+            }, f)
+
+    def stat(self, name: str) -> Optional[ObjectInfo]:
+        with self._lock:
+            return self._info(name)
+
+    def read(self, name: str) -> bytes:
+        try:
+            with open(self._path(name), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise NotFound(f"{self.bucket_name}/{name}")
+
+    def write(self, name: str, data, content_type: Optional[str] = None,
+              metadata: Optional[Dict[str, str]] = None, if_generation_match: Optional[int] = None) -> None:
+        data = data.encode("utf-8") if isinstance(data, str) else bytes(data)
+        with self._lock:
+            _check_generation(name, self._info(name), if_generation_match)
+            self._put(name, data, content_type, metadata)
+
+    def copy(self, source: str, destination: str, if_generation_match: Optional[int] = None) -> None:
+        with self._lock:
+            info = self._info(source)
+            if info is None:
+                raise NotFound(f"{self.bucket_name}/{source}")
+            _check_generation(destination, self._info(destination), if_generation_match)
+            with open(self._path(source), "rb") as f:
+                data = f.read()
+            self._put(destination, data, info.content_type, info.metadata)
+
+    def delete(self, name: str, if_generation_match: Optional[int] = None) -> None:
+        with self._lock:
+            info = self._info(name)
+            if info is None:
+                raise NotFound(f"{self.bucket_name}/{name}")
+            _check_generation(name, info, if_generation_match)
+            os.remove(self._path(name))
+            try:
+                os.remove(self._meta_path(name))
+            except FileNotFoundError:
+                pass
+
+    def list(self, prefix: str = "", max_results: Optional[int] = None) -> List[ObjectInfo]:
+        names = []
+        for directory, subdirs, files in os.walk(self.root):
+            subdirs[:] = [d for d in subdirs if not (directory == self.root and d == ".meta")]
+            for file in files:
+                if file.endswith(".part"):
+                    continue
+                name = os.path.relpath(os.path.join(directory, file), self.root).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    names.append(name)
+        names.sort()
+        if max_results:
+            names = names[:max_results]
+        with self._lock:
+            return [info for info in (self._info(name) for name in names) if info is not None]
+
+    def download(self, name: str, path: str) -> None:
+        try:
+            shutil.copyfile(self._path(name), path)
+        except FileNotFoundError:
+            raise NotFound(f"{self.bucket_name}/{name}")
+
+    def signed_url(self, name: str, expiration: int = 3600) -> str:
+        return "file://" + self._path(name)
+
+
+class LocalDocumentStore(DocumentStore):
+    """One JSON file per document: root/<collection>/<id>.json (datetimes stored as ISO strings)."""
+
+    def __init__(self, root: str):
+        self.root  = os.path.abspath(root)
+        self._lock = threading.Lock()
+
+    def _path(self, path: str) -> str:
+        file = os.path.abspath(os.path.join(self.root, path + ".json"))
+        if not file.startswith(self.root + os.sep):
+            raise ValueError(f"Document path escapes the store: {path}")
+        return file
+
+    def _read(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(path), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write(self, path: str, data: Dict[str, Any]) -> None:
+        file = self._path(path)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        with open(file + ".part", "w") as f:
+            json.dump(data, f, default=_json_default)
+        os.replace(file + ".part", file)
+
+    def add(self, collection: str, data: Dict[str, Any]) -> str:
+        document_id = f"{time.time_ns():x}"
+        self.set(f"{collection}/{document_id}", data)
+        return document_id
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._read(path)
+
+    def set(self, path: str, data: Dict[str, Any], merge: bool = False) -> None:
+        with self._lock:
+            current = self._read(path) if merge else None
+            self._write(path, {**(current or {}), **_resolve(data, current)})
+
+    def update(self, path: str, data: Dict[str, Any]) -> None:
+        with self._lock:
+            current = self._read(path)
+            if current is None:
+                raise NotFound(path)
+            self._write(path, {**current, **_resolve(data, current)})
+
+    def commit(self, writes: List[DocumentWrite]) -> None:
+        with self._lock:
+            self._commit(writes)
+
+    def _commit(self, writes: List[DocumentWrite]) -> None:
+        # Every write is checked before the first file is replaced
+        staged: Dict[str, Dict[str, Any]] = {}
+        for write in writes:
+            current = staged[write.path] if write.path in staged else self._read(write.path)
+            staged[write.path] = _apply(write, current)
+        for path, data in staged.items():
+            self._write(path, data)
+
+    def transaction(self, fn: Callable[[DocumentTransaction], Any]) -> Any:
+        with self._lock:
+            txn = DocumentTransaction(self._read)
+            result = fn(txn)
+            self._commit(txn.writes)
+        return result
+
+    def delete(self, path: str) -> None:
+        with self._lock:
+            try:
+                os.remove(self._path(path))
+            except FileNotFoundError:
+                pass
+
+    def stream(self, collection: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        directory = os.path.join(self.root, collection)
+        if not os.path.isdir(directory):
+            return iter([])
+        ids = sorted(f[:-5] for f in os.listdir(directory) if f.endswith(".json"))
+        with self._lock:
+            items = [(i, self._read(f"{collection}/{i}")) for i in ids]
+        return iter([(i, data) for i, data in items if data is not None])
+
+    def query(self, collection: str, where: List[Tuple[str, str, Any]] = (),
+              order_by: List[Tuple[str, str]] = (), limit: Optional[int] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        return _run_query(list(self.stream(collection)), where, order_by, limit)
+
+
+# ── Shared instances ──────────────────────────────────────────────────────────
+_stores_lock = threading.Lock()
+_object_stores: Dict[str, ObjectStore] = {}
+_document_store: Optional[DocumentStore] = None
+
+
+def object_store(bucket_name: str) -> ObjectStore:
+    """The process-wide ObjectStore for bucket_name on the configured STORAGE_BACKEND."""
+    with _stores_lock:
+        store = _object_stores.get(bucket_name)
+        if store is None:
+            if STORAGE_BACKEND == "memory":
+                store = InMemoryObjectStore(bucket_name)
+            elif STORAGE_BACKEND == "local":
+                store = LocalObjectStore(bucket_name, os.path.join(STORAGE_LOCAL_DIR, "objects", bucket_name))
+            elif STORAGE_BACKEND == "gcs":
+                store = GCSObjectStore(bucket_name)
+            else:
+                raise ValueError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}' (expected gcs, local or memory)")
+            _object_stores[bucket_name] = store
+        return store
+
+
+def document_store() -> DocumentStore:
+    """The process-wide DocumentStore on the configured STORAGE_BACKEND."""
+    global _document_store
+    with _stores_lock:
+        if _document_store is None:
+            if STORAGE_BACKEND == "memory":
+                _document_store = InMemoryDocumentStore()
+            elif STORAGE_BACKEND == "local":
+                _document_store = LocalDocumentStore(os.path.join(STORAGE_LOCAL_DIR, "documents"))
+            elif STORAGE_BACKEND == "gcs":
+                _document_store = FirestoreDocumentStore()
+            else:
+                raise ValueError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}' (expected gcs, local or memory)")
+        return _document_store
@@ -0,0 +1,13 @@
+"""
+Tests for the Cloud Run service modules. They import the modules directly from
+build_context/ (the container's working directory) and run on the in-memory
+storage backend, so no bucket, Firestore or model weights are needed.
+
+    python -m pytest cloud_service/build_context/tests -q
+"""
+
+import os
+import sys
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
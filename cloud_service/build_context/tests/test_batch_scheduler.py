@@ -0,0 +1,127 @@
+from concurrent.futures import Future
+
+import pytest
+from PIL import Image
+
+import prediction_service
+from model_registry import ModelRegistry
+from prediction_service import LoadedModel, _BatchScheduler
+from resolution_policy import ResolutionPolicy
+
+
+class FakeEngine:
+    """Returns one result per image ("<image width>@<imgsz>"), or fails as configured."""
+
+    name = "fake"
+
+    def __init__(self, error=None, short=False, tag="active", calls=None):
+        self.error = error
+        self.short = short
+        self.tag   = tag
+        self.calls = calls if calls is not None else []
+
+    def predict(self, images, imgsz=None, **kwargs):
+        self.calls.append((self.tag, len(images), imgsz))
+        if self.error is not None:
+            raise self.error
+        results = [f"{img.size[0]}@{imgsz}" for img in images]
+        return results[:-1] if self.short else results
+
+
+def _model(engine, version="v1"):
+    return LoadedModel(engine, version, None)
+
+
+def _image(width):
+    return Image.new("RGB", (width, 8))
+
+
+def _unit(images, model=None, imgsz=640, observe=True):
+    return (images, [Future() for _ in images], model, imgsz, observe)
+
+
+@pytest.fixture
+def policy(monkeypatch):
+    policy = ResolutionPolicy([320, 640])
+    monkeypatch.setattr(prediction_service, "POLICY", policy)
+    monkeypatch.setattr(prediction_service, "REGISTRY", ModelRegistry())
+    return policy
+
+
+def test_groups_one_forward_pass_per_model_and_imgsz(policy, monkeypatch):
+    engine = FakeEngine()
+    active = _model(engine)
+    monkeypatch.setattr(prediction_service, "ACTIVE", active)
+    batch = [_unit([_image(10)]), _unit([_image(20)], imgsz=320), _unit([_image(30), _image(40)])]
+
+    _BatchScheduler(8, 0)._run_batch(batch)
+
+    assert sorted(engine.calls) == [("active", 1, 320), ("active", 3, 640)]
+    results = [[f.result(timeout=1) for f in futures] for _, futures, _, _, _ in batch]
+    assert results == [[("10@640", active, 640)], [("20@320", active, 320)],
+                       [("30@640", active, 640), ("40@640", active, 640)]]
+
+
+def test_pinned_model_runs_after_the_active_one(policy, monkeypatch):
+    calls = []
+    monkeypatch.setattr(prediction_service, "ACTIVE", _model(FakeEngine(calls=calls)))
+    pinned = _model(FakeEngine(tag="pinned", calls=calls), "v0")
+
+    _BatchScheduler(8, 0)._run_batch([_unit([_image(10)], model=pinned), _unit([_image(20)])])
+
+    assert [tag for tag, _, _ in calls] == ["active", "pinned"]
+
+
+def test_failed_forward_pass_fails_only_its_group(policy, monkeypatch):
+    monkeypatch.setattr(prediction_service, "ACTIVE", _model(FakeEngine()))
+    broken = _model(FakeEngine(error=ValueError("boom")), "v0")
+    failing, healthy = _unit([_image(10), _image(20)], model=broken), _unit([_image(30)])
+
+    _BatchScheduler(8, 0)._run_batch([failing, healthy])
+
+    for future in failing[1]:
+        with pytest.raises(ValueError, match="boom"):
+            future.result(timeout=1)
+    assert healthy[1][0].result(timeout=1)[0] == "30@640"
+
+
+def test_short_result_list_fails_every_future(policy, monkeypatch):
+    monkeypatch.setattr(prediction_service, "ACTIVE", _model(FakeEngine(short=True)))
+    unit = _unit([_image(10), _image(20)])
+
+    _BatchScheduler(8, 0)._run_batch([unit])
+
+    for future in unit[1]:
+        with pytest.raises(RuntimeError, match="1 results for 2 images"):
+            future.result(timeout=1)
+
+
+def test_no_model_loaded(policy, monkeypatch):
+    monkeypatch.setattr(prediction_service, "ACTIVE", None)
+    unit = _unit([_image(10)])
+
+    _BatchScheduler(8, 0)._run_batch([unit])
+
+    with pytest.raises(RuntimeError, match="not loaded"):
+        unit[1][0].result(timeout=1)
+
+
+def test_scheduler_thread_survives_a_failed_batch(policy, monkeypatch):
+    engine = FakeEngine(error=ValueError("boom"))
+    monkeypatch.setattr(prediction_service, "ACTIVE", _model(engine))
+    scheduler = _BatchScheduler(8, 0)
+
+    with pytest.raises(ValueError):
+        scheduler.submit(_image(10)).result(timeout=5)
+    engine.error = None
+    result, _, imgsz = scheduler.submit(_image(20)).result(timeout=5)
+
+    assert (result, imgsz) == ("20@640", 640)
+
+
+def test_observe_false_keeps_the_pass_out_of_the_policy(policy, monkeypatch):
+    monkeypatch.setattr(prediction_service, "ACTIVE", _model(FakeEngine()))
+
+    _BatchScheduler(8, 0)._run_batch([_unit([_image(10)], observe=False), _unit([_image(20)], imgsz=320)])
+
+    assert list(policy.status()["ms_per_image"]) == ["320"]
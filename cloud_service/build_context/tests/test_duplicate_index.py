@@ -0,0 +1,119 @@
+import random
+
+from PIL import Image, ImageDraw
+
+import duplicate_index
+from duplicate_index import BKTree, DuplicateIndex, dhash, hamming, hash_to_hex, hex_to_hash
+
+
+def _photo(seed, size=(320, 240)):
+    rng = random.Random(seed)
+    img = Image.new('RGB', size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.ellipse((x, y, x + rng.randrange(20, 120), y + rng.randrange(20, 120)),
+                     fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    return img
+
+
+def test_dhash_tolerates_resizing_and_brightness_but_not_other_photos():
+    photo = _photo(1)
+    resized = photo.resize((160, 120))
+    brighter = photo.point(lambda p: min(255, p + 10))
+
+    assert hamming(dhash(photo), dhash(resized)) <= duplicate_index.DUPLICATE_MAX_DISTANCE
+    assert hamming(dhash(photo), dhash(brighter)) <= duplicate_index.DUPLICATE_MAX_DISTANCE
+    assert hamming(dhash(photo), dhash(_photo(2))) > duplicate_index.DUPLICATE_MAX_DISTANCE
+
+
+def test_hex_round_trip():
+    value = dhash(_photo(3))
+    assert hex_to_hash(hash_to_hex(value)) == value
+    assert hex_to_hash(None) is None
+    assert hex_to_hash("not-hex") is None
+
+
+def test_bktree_search_matches_a_linear_scan():
+    rng = random.Random(0)
+    values = [rng.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for i, value in enumerate(values):
+        tree.add(value, f"k{i}")
+    query = values[42] ^ 0b10110  # three bits away from k42
+
+    expected = sorted((hamming(query, v), f"k{i}") for i, v in enumerate(values)
+                      if hamming(query, v) <= 20)
+
+    assert tree.search(query, 20) == expected
+    assert tree.search(query, 3)[0] == (3, "k42")
+    assert BKTree().search(query, 64) == []
+
+
+def test_add_reports_the_earlier_near_duplicate():
+    index = DuplicateIndex(max_distance=4)
+
+    assert index.add("a", 0b0000) is None
+    assert index.add("b", 0b0011) == "a"
+    assert index.add("c", 0xFFFF_0000) is None
+    assert index.add("a", 0b0000) is None  # re-adding is a no-op
+    assert len(index) == 3
+
+
+def test_removed_images_are_no_longer_matched():
+    index = DuplicateIndex(max_distance=4)
+    index.add("a", 0b0000)
+
+    index.remove("a")
+
+    assert index.find(0b0001) is None
+    assert len(index) == 0
+
+
+def test_index_is_bounded_by_count_and_age(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(duplicate_index.time, "monotonic", lambda: now[0])
+    index = DuplicateIndex(max_distance=0, max_entries=2, max_age_s=60)
+
+    index.add("a", 1)
+    index.add("b", 2)
+    index.add("c", 3)
+    assert len(index) == 2
+    assert index.find(1) is None  # the oldest went first
+
+    now[0] += 61
+    assert index.find(2) is None
+    assert len(index) == 0
+
+
+def test_collapse_groups_duplicates_in_listing_order():
+    index = DuplicateIndex(max_distance=2)
+    items = [
+        {"image_id": "a", "dhash": 0b0000},
+        {"image_id": "b", "dhash": 0xFF00},
+        {"image_id": "a2", "dhash": 0b0001},
+        {"image_id": "nohash"},
+        {"image_id": "b2", "dhash": 0xFF01},
+    ]
+
+    kept = index.collapse(items, limit=10)
+
+    assert [item["image_id"] for item in kept] == ["a", "b", "nohash"]
+    assert kept[0]["duplicate_ids"] == ["a2"]
+    assert kept[1]["duplicate_ids"] == ["b2"]
+    assert kept[2]["duplicate_ids"] == []
+    assert len(index) == 0  # collapsing a listing doesn't grow the index
+
+
+def test_collapse_limit_still_folds_later_duplicates_into_kept_groups():
+    index = DuplicateIndex(max_distance=2)
+    items = [
+        {"image_id": "a", "dhash": 0b0000},
+        {"image_id": "b", "dhash": 0xFF00},
+        {"image_id": "a2", "dhash": 0b0001},
+    ]
+
+    kept = index.collapse(items, limit=1)
+
+    assert [item["image_id"] for item in kept] == ["a"]
+    assert kept[0]["duplicate_ids"] == ["a2"]
@@ -0,0 +1,113 @@
+import pytest
+
+import pending_feed
+from duplicate_index import DuplicateIndex, hash_to_hex
+from pending_feed import (InvalidPageToken, PendingFeed, SignedUrlCache, decode_page_token,
+                          encode_page_token, parse_page_size)
+
+
+def _entry(image_id, priority=0, enqueued_at=0.0, dhash=None):
+    return {"image_id": image_id, "priority": priority, "enqueued_at": enqueued_at,
+            "dhash": hash_to_hex(dhash) if dhash is not None else None}
+
+
+def _feed(entries, ttl_s=60):
+    calls = []
+
+    def list_fn():
+        calls.append(1)
+        return list(entries)
+
+    return PendingFeed(list_fn, DuplicateIndex(max_distance=2), ttl_s=ttl_s), calls
+
+
+def _ids(items):
+    return [item["image_id"] for item in items]
+
+
+def test_page_token_round_trip():
+    key = (-2.0, 1714560000.25, "img-7")
+    assert decode_page_token(encode_page_token(key)) == key
+
+
+@pytest.mark.parametrize("token", ["", "!!!", "bm90IGpzb24", encode_page_token(("a", "b", "c"))[:-3] + "x"])
+def test_malformed_page_tokens_are_rejected(token):
+    with pytest.raises(InvalidPageToken):
+        decode_page_token(token)
+
+
+def test_parse_page_size():
+    assert parse_page_size(None) == pending_feed.PENDING_PAGE_SIZE
+    assert parse_page_size("") == pending_feed.PENDING_PAGE_SIZE
+    assert parse_page_size("0") == 1
+    assert parse_page_size("1000") == pending_feed.PENDING_MAX_PAGE_SIZE
+    with pytest.raises(ValueError):
+        parse_page_size("ten")
+
+
+def test_pages_walk_the_queue_in_review_order():
+    feed, _ = _feed([_entry(f"img-{i}", priority=i % 2, enqueued_at=i) for i in range(5)])
+
+    first, token = feed.page(None, 2)
+    second, token = feed.page(token, 2)
+    third, token = feed.page(token, 2)
+
+    assert _ids(first) == ["img-1", "img-3"]  # priority 1 first, oldest first within it
+    assert _ids(second) == ["img-0", "img-2"]
+    assert _ids(third) == ["img-4"]
+    assert token is None
+
+
+def test_cursor_survives_new_entries_ahead_of_it():
+    entries = [_entry(f"img-{i}", enqueued_at=i) for i in range(4)]
+    feed, _ = _feed(entries, ttl_s=0)
+
+    first, token = feed.page(None, 2)
+    entries.insert(0, _entry("urgent", priority=5))
+    second, _ = feed.page(token, 2)
+
+    assert _ids(first) == ["img-0", "img-1"]
+    assert _ids(second) == ["img-2", "img-3"]
+
+
+def test_duplicates_are_collapsed_and_consumed_with_their_group():
+    feed, _ = _feed([
+        _entry("a", enqueued_at=0, dhash=0b0000),
+        _entry("a-again", enqueued_at=1, dhash=0b0001),
+        _entry("b", enqueued_at=2, dhash=0xFF00),
+        _entry("c", enqueued_at=3, dhash=0xF0F0F0),
+    ])
+
+    first, token = feed.page(None, 1)
+    second, token = feed.page(token, 1)
+
+    assert _ids(first) == ["a"]
+    assert first[0]["duplicate_ids"] == ["a-again"]
+    assert _ids(second) == ["b"]
+    assert _ids(feed.page(token, 5)[0]) == ["c"]
+
+
+def test_listing_is_cached_for_the_ttl_and_discard_drops_entries():
+    feed, calls = _feed([_entry("a"), _entry("b", enqueued_at=1)])
+
+    feed.page(None, 10)
+    feed.discard(["a"])
+    kept, _ = feed.page(None, 10)
+
+    assert len(calls) == 1
+    assert _ids(kept) == ["b"]
+    assert feed.stats()["hits"] == 1
+
+
+def test_signed_urls_are_reused_until_close_to_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(pending_feed.time, "time", lambda: now[0])
+    signed = []
+    urls = SignedUrlCache(lambda name, ttl: signed.append(name) or f"https://signed/{name}/{len(signed)}",
+                          ttl_s=3600, min_remaining_s=900)
+
+    assert urls.get("a") == "https://signed/a/1"
+    now[0] += 2600
+    assert urls.get("a") == "https://signed/a/1"
+    now[0] += 200  # less than 900 s left
+    assert urls.get("a") == "https://signed/a/2"
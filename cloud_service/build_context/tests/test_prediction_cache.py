@@ -0,0 +1,90 @@
+import json
+
+from prediction_cache import PredictionCache, content_hash
+
+
+def _result(label="plastic", padding=0):
+    return {"detections": [{"label": label, "confidence": 0.9}], "note": "x" * padding}
+
+
+def _entry_bytes(image_id, result):
+    return len(json.dumps({"image_id": image_id, "result": {**result, "annotated_image": None}},
+                          separators=(',', ':')))
+
+
+def test_hit_returns_image_id_and_result_without_the_annotated_image():
+    cache = PredictionCache(max_mb=1)
+    digest = content_hash(b"photo")
+    cache.put(digest, "v1", "img-1", {**_result(), "annotated_image": b"jpeg"})
+
+    entry = cache.get(digest, "v1")
+
+    assert entry["image_id"] == "img-1"
+    assert entry["result"]["detections"] == _result()["detections"]
+    assert entry["result"]["annotated_image"] is None
+    assert cache.get(content_hash(b"other photo"), "v1") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_least_recently_used_entries_over_the_byte_budget():
+    entry_size = _entry_bytes("img-0", _result(padding=200))
+    cache = PredictionCache(max_mb=2.5 * entry_size / (1024 * 1024))
+    for i in range(2):
+        cache.put(f"d{i}", "v1", f"img-{i}", _result(padding=200))
+    cache.get("d0", "v1")  # d0 is now more recently used than d1
+
+    cache.put("d2", "v1", "img-2", _result(padding=200))
+
+    assert cache.get("d1", "v1") is None
+    assert cache.get("d0", "v1") is not None
+    assert cache.get("d2", "v1") is not None
+    assert cache.evictions == 1
+    assert cache.size <= cache.max_bytes
+
+
+def test_entry_larger_than_the_budget_is_not_cached():
+    cache = PredictionCache(max_mb=100 / (1024 * 1024))
+    cache.put("d", "v1", "img", _result(padding=500))
+
+    assert cache.get("d", "v1") is None
+    assert cache.size == 0
+
+
+def test_new_model_version_invalidates_everything():
+    cache = PredictionCache(max_mb=1)
+    cache.put("d", "v1", "img", _result())
+
+    assert cache.get("d", "v2") is None
+    assert cache.get("d", "v1") is None  # the v1 entries are gone, not just hidden
+    assert cache.stats()["model_version"] == "v1"
+
+
+def test_put_for_a_replaced_version_is_dropped():
+    cache = PredictionCache(max_mb=1)
+    cache.get("x", "v2")  # v2 took over while a v1 request was still running
+
+    cache.put("d", "v1", "img", _result())
+
+    assert cache.get("d", "v2") is None
+
+
+def test_discard_image_forgets_its_entry():
+    cache = PredictionCache(max_mb=1)
+    cache.put("d", "v1", "img", _result())
+
+    cache.discard_image("img")
+    cache.discard_image("unknown")
+
+    assert cache.get("d", "v1") is None
+    assert cache.size == 0
+
+
+def test_disk_tier_survives_a_new_process_and_is_dropped_for_old_versions(tmp_path):
+    PredictionCache(max_mb=1, disk_dir=str(tmp_path)).put("d", "v1", "img", _result())
+
+    restarted = PredictionCache(max_mb=1, disk_dir=str(tmp_path))
+    assert restarted.get("d", "v1")["image_id"] == "img"
+
+    restarted.get("d", "v2")
+    assert not (tmp_path / "v1").exists()
+    assert PredictionCache(max_mb=1, disk_dir=str(tmp_path)).get("d", "v1") is None
@@ -0,0 +1,77 @@
+import pytest
+
+from resolution_policy import ResolutionPolicy
+
+
+def _policy(budget_ms=400, seed=None):
+    return ResolutionPolicy([320, 480, 640], budget_ms,
+                            seed if seed is not None else {320: 45, 480: 95, 640: 170})
+
+
+def test_tiers_are_sorted_stride_multiples():
+    assert ResolutionPolicy([650, 300, 640]).tiers == [288, 640]
+    assert ResolutionPolicy([]).tiers == [640]
+
+
+def test_picks_the_largest_tier_that_fits_the_queue():
+    policy = _policy()
+
+    assert policy.choose(0) == 640   # 170 ms
+    assert policy.choose(2) == 480   # 3 x 95 = 285 ms, 3 x 170 = 510 ms
+    assert policy.choose(5) == 320   # 6 x 45 = 270 ms
+    assert policy.chosen == {320: 1, 480: 1, 640: 1}
+
+
+def test_falls_back_to_the_smallest_tier_when_nothing_fits():
+    assert _policy().choose(100) == 320
+
+
+def test_zero_budget_always_uses_the_largest_tier():
+    assert _policy(budget_ms=0).choose(100) == 640
+
+
+def test_unmeasured_tiers_are_scaled_from_the_nearest_measured_one():
+    policy = _policy(seed={320: 100})
+
+    # 480 ≈ 225 ms and 640 ≈ 400 ms by pixel count
+    assert policy.choose(0) == 640
+    assert policy.choose(1) == 320
+
+
+def test_without_any_measurements_every_tier_fits():
+    assert _policy(seed={}).choose(50) == 640
+
+
+def test_observe_moves_the_estimate_as_an_ewma():
+    policy = _policy()
+
+    policy.observe(640, 0.270)
+
+    assert policy.status()["ms_per_image"]["640"] == pytest.approx(0.8 * 170 + 0.2 * 270)
+
+
+def test_slow_measurements_push_choices_down():
+    policy = _policy()
+    for _ in range(30):
+        policy.observe(640, 0.6)
+
+    assert policy.choose(0) == 480
+
+
+def test_first_observation_of_a_tier_replaces_the_scaled_guess():
+    policy = _policy(seed={})
+
+    policy.observe(480, 0.1)
+
+    assert policy.status()["ms_per_image"] == {"480": 100.0}
+
+
+def test_from_meta_honours_the_env_budget(monkeypatch):
+    meta = {"inference_policy": {"tiers": [320, 640], "latency_budget_ms": 400,
+                                 "tier_latency_ms": {"320": 45, "640": 170}}}
+
+    monkeypatch.setenv("INFERENCE_LATENCY_BUDGET_MS", "100")
+    policy = ResolutionPolicy.from_meta(meta)
+
+    assert policy.budget_ms == 100
+    assert policy.choose(0) == 320
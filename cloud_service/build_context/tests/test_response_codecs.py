@@ -0,0 +1,114 @@
+import base64
+import email
+import json
+
+import pytest
+
+import response_codecs
+from response_codecs import (MEDIA_CBOR, MEDIA_JSON, MEDIA_MSGPACK, MEDIA_MULTIPART,
+                             UnsupportedFormat, encode, negotiate)
+
+JPEG = b"\xff\xd8\xff\xe0fake-jpeg\r\n--not-a-boundary\xff\xd9"
+
+
+def _result(label="plastic", image=JPEG):
+    return {
+        "success": True,
+        "detections": [{"label": label, "confidence": 0.91234567,
+                        "box_2d": [12.345678, 20.5, 300.123456, 240.0]}],
+        "annotated_image": image,
+    }
+
+
+def _parts(body, content_type):
+    message = email.message_from_bytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("ascii") + body)
+    return {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+            for part in message.get_payload()}
+
+
+@pytest.mark.parametrize("accept, fmt, expected", [
+    (None, None, MEDIA_JSON),
+    ("*/*", None, MEDIA_JSON),
+    ("application/msgpack", None, MEDIA_MSGPACK),
+    ("application/x-msgpack", None, MEDIA_MSGPACK),
+    ("application/cbor;q=0.5, application/msgpack;q=0.9", None, MEDIA_MSGPACK),
+    ("application/msgpack;q=0, */*", None, MEDIA_JSON),
+    ("image/webp, text/html", None, MEDIA_JSON),
+    ("multipart/mixed", None, MEDIA_MULTIPART),
+    ("application/msgpack", "cbor", MEDIA_CBOR),  # ?format= wins over Accept
+    (None, "multipart", MEDIA_MULTIPART),
+])
+def test_negotiate(accept, fmt, expected):
+    pytest.importorskip("msgpack")
+    pytest.importorskip("cbor2")
+    assert negotiate(accept, fmt) == expected
+
+
+def test_explicit_unknown_format_is_rejected():
+    with pytest.raises(UnsupportedFormat):
+        negotiate(None, "xml")
+
+
+def test_formats_without_their_library_are_never_negotiated(monkeypatch):
+    monkeypatch.setattr(response_codecs, "msgpack", None)
+
+    assert negotiate("application/msgpack") == MEDIA_JSON
+    with pytest.raises(UnsupportedFormat):
+        negotiate(None, "msgpack")
+
+
+def test_json_carries_the_image_as_base64():
+    body, content_type = encode(_result())
+    decoded = json.loads(body)
+
+    assert content_type == MEDIA_JSON
+    assert "annotated_image" not in decoded
+    assert base64.b64decode(decoded["annotated_image_base64"]) == JPEG
+    assert decoded["detections"] == _result()["detections"]
+
+
+def test_json_without_an_image():
+    decoded = json.loads(encode(_result(image=None))[0])
+    assert decoded["annotated_image_base64"] is None
+
+
+def test_msgpack_round_trip_keeps_raw_bytes_and_full_precision():
+    msgpack = pytest.importorskip("msgpack")
+    body, content_type = encode(_result(), MEDIA_MSGPACK)
+
+    assert content_type == MEDIA_MSGPACK
+    assert msgpack.unpackb(body, raw=False) == _result()
+
+
+def test_cbor_round_trip_keeps_raw_bytes_and_full_precision():
+    cbor2 = pytest.importorskip("cbor2")
+    body, content_type = encode(_result(), MEDIA_CBOR)
+
+    assert content_type == MEDIA_CBOR
+    assert cbor2.loads(body) == _result()
+
+
+def test_multipart_single_result():
+    body, content_type = encode(_result(), MEDIA_MULTIPART)
+    parts = _parts(body, content_type)
+
+    assert content_type.startswith(MEDIA_MULTIPART + "; boundary=")
+    result = json.loads(parts["result"])
+    assert result["annotated_image_part"] == "annotated_image"
+    assert result["annotated_image_base64"] is None
+    assert result["detections"] == _result()["detections"]
+    assert parts["annotated_image"] == JPEG
+
+
+def test_multipart_batch_names_one_part_per_image():
+    payload = {"results": [_result("plastic"), _result("paper", image=None), _result("glass", b"jpeg-2")]}
+    body, content_type = encode(payload, MEDIA_MULTIPART)
+    parts = _parts(body, content_type)
+
+    results = json.loads(parts["result"])["results"]
+    assert [r.get("annotated_image_part") for r in results] == ["annotated_image_0", None, "annotated_image_2"]
+    assert parts["annotated_image_0"] == JPEG
+    assert parts["annotated_image_2"] == b"jpeg-2"
+    assert "annotated_image_1" not in parts
+    assert "annotated_image" in payload["results"][0]  # the caller's payload isn't modified
@@ -0,0 +1,141 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import review_queue
+from review_queue import REVIEW_DUPLICATE_PRIORITY, REVIEW_PRIORITY, ReviewQueue
+from storage_backends import InMemoryDocumentStore, ObjectInfo
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(review_queue.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def queue(clock):
+    queue = ReviewQueue(InMemoryDocumentStore(), lease_s=60)
+    for image_id in ("a", "b", "c"):
+        queue.enqueue(image_id, {"dhash": "00ff"})
+        clock[0] += 1
+    return queue
+
+
+def _ids(entries):
+    return [entry["image_id"] for entry in entries]
+
+
+def test_enqueue_orders_new_photos_before_duplicates(queue):
+    queue.enqueue("dup", {"duplicate_of": "a"})
+
+    entries = queue.available(10)
+
+    assert _ids(entries) == ["a", "b", "c", "dup"]
+    assert entries[0]["priority"] == REVIEW_PRIORITY
+    assert entries[-1]["priority"] == REVIEW_DUPLICATE_PRIORITY
+    assert entries[0]["object"] == "pending_images/a.jpg"
+
+
+def test_claims_never_hand_out_the_same_image_twice(queue):
+    alice = queue.claim("alice", 2)
+    bob = queue.claim("bob", 2)
+
+    assert _ids(alice) == ["a", "b"]
+    assert _ids(bob) == ["c"]
+    assert queue.claim("carol", 2) == []
+    assert queue.available(10) == []
+    assert alice[0]["lease_owner"] == "alice" and alice[0]["claims"] == 1
+
+
+def test_leased_entries_do_not_use_up_the_limit(clock):
+    queue = ReviewQueue(InMemoryDocumentStore(), lease_s=60)
+    for i in range(30):
+        queue.enqueue(f"img-{i:02d}")
+        clock[0] += 1
+
+    assert len(queue.claim("alice", 10)) == 10
+    assert len(queue.claim("bob", 10)) == 10
+
+    assert _ids(queue.available(5)) == [f"img-{i}" for i in range(20, 25)]
+    assert _ids(queue.claim("carol", 3)) == ["img-20", "img-21", "img-22"]
+
+
+def test_entries_past_the_max_age_are_not_available(queue, clock):
+    clock[0] += review_queue.REVIEW_MAX_AGE_DAYS * 86400 - 1.5  # a and b are past it, c isn't
+
+    assert _ids(queue.available(10)) == ["c"]
+
+
+def test_preferred_images_are_claimed_first_and_own_leases_renew(queue, clock):
+    assert _ids(queue.claim("alice", 1, preferred=["c"])) == ["c"]
+
+    clock[0] += 30
+    renewed = queue.claim("alice", 1, preferred=["c"])
+
+    assert _ids(renewed) == ["c"]
+    assert renewed[0]["lease_expires_at"] == clock[0] + 60
+    assert renewed[0]["claims"] == 2
+
+
+def test_expired_leases_come_back(queue, clock):
+    queue.claim("alice", 3)
+
+    clock[0] += 61
+
+    assert _ids(queue.available(10)) == ["a", "b", "c"]
+    assert _ids(queue.claim("bob", 1)) == ["a"]
+
+
+def test_zero_lease_expires_immediately(clock):
+    queue = ReviewQueue(InMemoryDocumentStore(), lease_s=0)
+    queue.enqueue("a")
+
+    queue.claim("alice", 1)
+
+    assert _ids(queue.claim("bob", 1)) == ["a"]
+
+
+def test_release_lowers_priority_and_only_counts_own_live_leases(queue, clock):
+    queue.claim("alice", 1)
+
+    assert queue.release("bob", ["a"]) == 0
+    assert queue.release("alice", ["a", "a", "missing"]) == 1
+    assert queue.release("alice", ["a"]) == 0
+
+    entries = queue.available(10)
+    assert _ids(entries) == ["b", "c", "a"]
+    assert entries[-1]["priority"] == REVIEW_PRIORITY - 1
+
+
+def test_take_respects_other_reviewers_leases(queue, clock):
+    queue.claim("alice", 1)
+
+    assert queue.take("bob", "a") is False
+    assert queue.take("alice", "a") is True
+    assert queue.take("bob", "b") is True           # free images can be taken directly
+    assert queue.take("alice", "b") is False        # ...and are then leased to the taker
+    assert queue.take("bob", "not-queued") is True  # left to the move to training_data/
+
+    clock[0] += 61
+    assert queue.take("carol", "a") is True
+
+
+def test_removed_images_leave_the_queue(queue):
+    queue.remove("b")
+
+    assert _ids(queue.available(10)) == ["a", "c"]
+
+
+def test_backfill_queues_only_unknown_objects(queue):
+    def info(name, metadata=None):
+        return ObjectInfo(name, 3, 1, None, "image/jpeg", metadata or {},
+                          datetime(2023, 11, 14, 22, 0, tzinfo=timezone.utc))
+
+    added = queue.backfill([info("pending_images/a.jpg"), info("pending_images/old.jpg"),
+                            info("pending_images/old-dup.jpg", {"duplicate_of": "old"})])
+
+    assert added == 2
+    assert _ids(queue.available(10)) == ["old", "a", "b", "c", "old-dup"]
+    assert queue.backfill([info("pending_images/old.jpg")]) == 0
@@ -0,0 +1,172 @@
+from datetime import datetime
+
+import pytest
+
+from storage_backends import (SERVER_TIMESTAMP, AlreadyExists, DocumentWrite, Increment,
+                              InMemoryDocumentStore, InMemoryObjectStore, LocalDocumentStore,
+                              LocalObjectStore, NotFound, PreconditionFailed)
+
+
+@pytest.fixture(params=["memory", "local"])
+def objects(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryObjectStore("bucket")
+    return LocalObjectStore("bucket", str(tmp_path / "objects"))
+
+
+@pytest.fixture(params=["memory", "local"])
+def docs(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryDocumentStore()
+    return LocalDocumentStore(str(tmp_path / "docs"))
+
+
+# ── Object stores ─────────────────────────────────────────────────────────────
+def test_write_read_stat(objects):
+    objects.write("pending_images/a.jpg", b"jpeg", content_type="image/jpeg", metadata={"dhash": "ff"})
+
+    info = objects.stat("pending_images/a.jpg")
+    assert objects.read("pending_images/a.jpg") == b"jpeg"
+    assert (info.size, info.content_type, info.metadata) == (4, "image/jpeg", {"dhash": "ff"})
+    assert objects.stat("pending_images/missing.jpg") is None
+    with pytest.raises(NotFound):
+        objects.read("pending_images/missing.jpg")
+
+
+def test_generation_zero_means_must_not_exist(objects):
+    objects.write("a", b"1", if_generation_match=0)
+
+    with pytest.raises(PreconditionFailed):
+        objects.write("a", b"2", if_generation_match=0)
+    assert objects.read("a") == b"1"
+
+
+def test_writes_and_deletes_check_the_current_generation(objects):
+    objects.write("a", b"1")
+    generation = objects.stat("a").generation
+
+    objects.write("a", b"2", if_generation_match=generation)
+    with pytest.raises(PreconditionFailed):
+        objects.write("a", b"3", if_generation_match=generation)  # stale
+    with pytest.raises(PreconditionFailed):
+        objects.delete("a", if_generation_match=generation)
+
+    objects.delete("a", if_generation_match=objects.stat("a").generation)
+    assert not objects.exists("a")
+    with pytest.raises(NotFound):
+        objects.delete("a")
+
+
+def test_copy_keeps_metadata_and_checks_the_destination(objects):
+    objects.write("pending/a", b"x", content_type="image/jpeg", metadata={"k": "v"})
+    objects.write("training/a", b"old")
+
+    with pytest.raises(PreconditionFailed):
+        objects.copy("pending/a", "training/a", if_generation_match=0)
+    with pytest.raises(NotFound):
+        objects.copy("pending/missing", "training/b")
+
+    objects.copy("pending/a", "training/b", if_generation_match=0)
+    info = objects.stat("training/b")
+    assert objects.read("training/b") == b"x"
+    assert (info.content_type, info.metadata) == ("image/jpeg", {"k": "v"})
+
+
+def test_list_by_prefix(objects):
+    for name in ("pending/b", "pending/a", "training/c"):
+        objects.write(name, b"x")
+
+    assert [info.name for info in objects.list("pending/")] == ["pending/a", "pending/b"]
+    assert [info.name for info in objects.list("pending/", max_results=1)] == ["pending/a"]
+
+
+# ── Document stores ───────────────────────────────────────────────────────────
+def test_set_update_and_field_transforms(docs):
+    docs.set("users/u1", {"points": 10, "created": SERVER_TIMESTAMP})
+    docs.update("users/u1", {"points": Increment(5)})
+    docs.set("users/u1", {"name": "Ada"}, merge=True)
+
+    user = docs.get("users/u1")
+    assert user["points"] == 15
+    assert user["name"] == "Ada"
+    assert user["created"] is not SERVER_TIMESTAMP
+    with pytest.raises(NotFound):
+        docs.update("users/missing", {"points": 1})
+
+
+def test_commit_is_all_or_nothing(docs):
+    docs.set("users/u1", {"points": 1})
+
+    with pytest.raises(AlreadyExists):
+        docs.commit([
+            DocumentWrite("update", "users/u1", {"points": Increment(1)}),
+            DocumentWrite("create", "feedback/f1", {"label": "paper"}),
+            DocumentWrite("create", "users/u1", {"points": 0}),
+        ])
+    with pytest.raises(NotFound):
+        docs.commit([
+            DocumentWrite("create", "feedback/f1", {"label": "paper"}),
+            DocumentWrite("update", "users/missing", {"points": 1}),
+        ])
+
+    assert docs.get("users/u1") == {"points": 1}
+    assert docs.get("feedback/f1") is None
+
+
+def test_commit_sees_its_own_earlier_writes(docs):
+    docs.commit([
+        DocumentWrite("create", "users/u1", {"points": 1}),
+        DocumentWrite("update", "users/u1", {"points": Increment(2)}),
+    ])
+
+    assert docs.get("users/u1") == {"points": 3}
+
+
+def test_transaction_commits_staged_writes(docs):
+    docs.set("leases/a", {"owner": None})
+
+    def claim(txn):
+        lease = txn.get("leases/a")
+        if lease["owner"] is not None:
+            return False
+        txn.update("leases/a", {"owner": "alice"})
+        txn.create("leases_log/a", {"owner": "alice"})
+        return True
+
+    assert docs.transaction(claim) is True
+    assert docs.transaction(claim) is False
+    assert docs.get("leases/a") == {"owner": "alice"}
+
+
+def test_failed_transaction_applies_nothing(docs):
+    docs.set("users/u1", {"points": 1})
+
+    def fail(txn):
+        txn.update("users/u1", {"points": Increment(1)})
+        raise RuntimeError("abort")
+
+    with pytest.raises(RuntimeError):
+        docs.transaction(fail)
+    with pytest.raises(AlreadyExists):
+        docs.transaction(lambda txn: [txn.update("users/u1", {"points": 5}),
+                                      txn.create("users/u1", {})])
+    assert docs.get("users/u1") == {"points": 1}
+
+
+def test_query_filters_orders_and_limits(docs):
+    docs.set("queue/a", {"priority": 1, "enqueued_at": 3})
+    docs.set("queue/b", {"priority": 2, "enqueued_at": 2})
+    docs.set("queue/c", {"priority": 2, "enqueued_at": 1})
+    docs.set("queue/d", {"enqueued_at": 0})
+
+    ids = [i for i, _ in docs.query("queue", where=[("priority", ">=", 1)],
+                                    order_by=[("priority", "desc"), ("enqueued_at", "asc")])]
+    assert ids == ["c", "b", "a"]
+    assert [i for i, _ in docs.query("queue", where=[("priority", "==", 2)], limit=1)] == ["b"]
+
+
+def test_local_documents_store_datetimes_as_iso_strings(tmp_path):
+    docs = LocalDocumentStore(str(tmp_path))
+    docs.set("feedback/f1", {"at": datetime(2024, 5, 1, 12, 0)})
+
+    assert docs.get("feedback/f1") == {"at": "2024-05-01T12:00:00"}
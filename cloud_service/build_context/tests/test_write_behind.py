@@ -0,0 +1,117 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from storage_backends import InMemoryDocumentStore
+from write_behind import WriteBehindBuffer
+
+
+class FlakyDocs(InMemoryDocumentStore):
+    """In-memory store whose batched commits fail while `down` is set."""
+
+    def __init__(self):
+        super().__init__()
+        self.down    = False
+        self.commits = 0
+
+    def commit(self, writes):
+        if self.down:
+            raise ConnectionError("firestore unavailable")
+        self.commits += 1
+        super().commit(writes)
+
+
+@pytest.fixture
+def make_buffer(tmp_path):
+    buffers = []
+
+    def make(docs, **kwargs):
+        kwargs.setdefault("flush_interval_s", 3600)  # tests flush explicitly
+        buffer = WriteBehindBuffer(docs, spool_dir=str(tmp_path / "spool"), **kwargs)
+        buffers.append(buffer)
+        return buffer
+
+    yield make
+    for buffer in buffers:
+        buffer.close(timeout=1)
+
+
+def test_add_assigns_the_id_and_flush_commits_in_batches(make_buffer):
+    docs = FlakyDocs()
+    buffer = make_buffer(docs, batch_size=2)
+
+    ids = [buffer.add("feedback", {"n": n}) for n in range(5)]
+    buffer.flush()
+
+    assert [docs.get(f"feedback/{i}") for i in ids] == [{"n": n} for n in range(5)]
+    assert buffer.pending_count() == 0
+    assert buffer.committed == 5
+
+
+def test_failed_flush_keeps_the_batch_buffered(make_buffer):
+    docs = FlakyDocs()
+    buffer = make_buffer(docs)
+    buffer.add("feedback", {"n": 1})
+
+    docs.down = True
+    with pytest.raises(ConnectionError):
+        buffer.flush()
+    assert buffer.pending_count() == 1
+
+    docs.down = False
+    assert buffer.flush() == 1
+
+
+def test_full_buffer_writes_inline(make_buffer):
+    docs = FlakyDocs()
+    buffer = make_buffer(docs, max_pending=1)
+
+    buffer.add("feedback", {"n": 1})
+    inline_id = buffer.add("feedback", {"n": 2})
+
+    assert docs.get(f"feedback/{inline_id}") == {"n": 2}
+    assert buffer.pending_count() == 1
+
+
+def test_close_spools_unwritten_documents_and_start_replays_them(make_buffer, tmp_path):
+    docs = FlakyDocs()
+    docs.down = True
+    at = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    first = make_buffer(docs)
+    doc_id = first.add("community_feedback", {"label": "paper", "timestamp": at, "boxes": [[1.5, 2]]})
+
+    first.close()
+
+    assert first.spooled == 1
+    assert len(list((tmp_path / "spool").glob("*.jsonl"))) == 1
+    assert docs.get(f"community_feedback/{doc_id}") is None
+
+    docs.down = False
+    second = make_buffer(docs)
+    second.start()
+    second.flush()
+
+    assert docs.get(f"community_feedback/{doc_id}") == {"label": "paper", "timestamp": at, "boxes": [[1.5, 2]]}
+    assert list((tmp_path / "spool").iterdir()) == []
+
+
+def test_unreadable_spool_file_is_set_aside(make_buffer, tmp_path):
+    spool = tmp_path / "spool"
+    spool.mkdir()
+    (spool / "broken.jsonl").write_text("{not json\n")
+
+    buffer = make_buffer(FlakyDocs())
+    buffer.start()
+
+    assert buffer.pending_count() == 0
+    assert [p.name for p in spool.iterdir()] == ["broken.jsonl.bad"]
+
+
+def test_closed_buffer_writes_inline(make_buffer):
+    docs = FlakyDocs()
+    buffer = make_buffer(docs)
+    buffer.close()
+
+    doc_id = buffer.add("feedback", {"n": 1})
+
+    assert docs.get(f"feedback/{doc_id}") == {"n": 1}
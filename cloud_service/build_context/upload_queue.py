@@ -0,0 +1,168 @@
+"""
+upload_queue.py — Background upload of /predict photos to GCS pending_images/.
+
+/predict used to block on blob.upload_from_string() before inference even started,
+so every scan paid a full GCS round trip. Now predict_route hands the bytes to this
+queue, runs inference in parallel, and returns the image_id without waiting.
+
+Guarantees:
+  - Bounded: at most UPLOAD_MAX_PENDING uploads are queued or running per process.
+    When the queue is full the upload runs inline on the request thread instead
+    (the old behaviour), so memory can't grow without limit during a spike.
+  - Retried: each upload is attempted up to UPLOAD_MAX_ATTEMPTS times with
+    exponential backoff. Re-uploading the same bytes to the same path is idempotent.
+  - Visible to feedback: /feedback, /community-feedback and DELETE /pending-images
+    call wait_for(image_id) first, which blocks on the in-flight upload (if this
+    instance still has one) so the pending object exists before they touch it.
+  - Annotated: an optional metadata_fn(image_id, image_bytes) runs on the upload
+    thread (off the request path) and its dict is stored as GCS object metadata —
+    service_core.py uses it to attach the perceptual hash used for duplicate detection.
+  - Announced: an optional on_uploaded(image_id, metadata) runs on the upload
+    thread once the object exists — service_core.py adds the image to the community
+    review queue there (review_queue.py), so a queued image is always readable.
+    Its failures are logged and don't fail the upload.
+  - Measured: each successful upload is recorded as the "upload" stage of
+    predict_stage_seconds (see service_metrics.py).
+  - Drained on shutdown: the executor's worker threads are joined at interpreter
+    exit, so a graceful SIGTERM from Cloud Run finishes queued uploads.
+"""
+
+import os
+import time
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from service_metrics import observe_stage
+from storage_backends import ObjectStore
+
+UPLOAD_WORKERS      = int(os.getenv("UPLOAD_WORKERS", "4"))
+UPLOAD_MAX_PENDING  = int(os.getenv("UPLOAD_MAX_PENDING", "64"))
+UPLOAD_MAX_ATTEMPTS = int(os.getenv("UPLOAD_MAX_ATTEMPTS", "3"))
+UPLOAD_WAIT_S       = float(os.getenv("UPLOAD_WAIT_S", "30"))
+
+
+def pending_path(image_id: str) -> str:
+    """GCS object name for an image awaiting feedback."""
+    return f"pending_images/{image_id}.jpg"
+
+
+class PendingUploadQueue:
+    """Bounded thread pool that uploads pending images and tracks in-flight uploads by image_id."""
+
+    def __init__(self, store: ObjectStore,
+                 max_workers: int = UPLOAD_WORKERS,
+                 max_pending: int = UPLOAD_MAX_PENDING,
+                 max_attempts: int = UPLOAD_MAX_ATTEMPTS,
+                 metadata_fn: Optional[Callable[[str, bytes], Optional[Dict[str, str]]]] = None,
+                 on_uploaded: Optional[Callable[[str, Optional[Dict[str, str]]], None]] = None):
+        self._store          = store
+        self._metadata_fn    = metadata_fn
+        self._on_uploaded    = on_uploaded
+        self._max_workers    = max(1, max_workers)
+        self._max_attempts   = max(1, max_attempts)
+        self._slots          = threading.BoundedSemaphore(max(1, max_pending))
+        self._lock           = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid            = None
+
+    def submit(self, image_id: str, image_bytes: bytes, content_type: str = 'image/jpeg') -> Future:
+        """Start uploading image_bytes to pending_images/{image_id}.jpg and return its Future."""
+        if not self._slots.acquire(blocking=False):
+            print(f"⚠️ Upload queue full — uploading {image_id} inline")
+            future = Future()
+            try:
+                future.set_result(self._upload_with_retry(image_id, image_bytes, content_type))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        try:
+            # Run in the request's context so metadata_fn and the upload span see its trace
+            future = self._get_executor().submit(contextvars.copy_context().run, self._upload_with_retry,
+                                                 image_id, image_bytes, content_type)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._inflight[image_id] = future
+        future.add_done_callback(lambda f: self._on_done(image_id, f))
+        return future
+
+    def wait_for(self, image_id: str, timeout: float = UPLOAD_WAIT_S) -> bool:
+        """
+        Block until any in-flight upload for image_id has finished.
+        Returns False only if this instance's upload failed or timed out.
+        Uploads running in other processes or instances aren't visible here — /feedback
+        retries a missing pending image for FEEDBACK_MISSING_WAIT_S instead (service_core.py).
+        """
+        with self._lock:
+            future = self._inflight.get(image_id)
+        if future is None:
+            return True
+        try:
+            future.result(timeout=timeout)
+            return True
+        except Exception as e:
+            print(f"⚠️ Pending upload for {image_id} did not complete: {e}")
+            return False
+
+    def in_flight(self, image_id: str) -> bool:
+        """True while this instance is still uploading image_id."""
+        with self._lock:
+            future = self._inflight.get(image_id)
+        return future is not None and not future.done()
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._inflight)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Created lazily (and re-created after a fork) so worker threads always
+        # belong to the process that is serving requests
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                    thread_name_prefix="pending-upload")
+                self._pid      = os.getpid()
+                self._inflight = {}
+            return self._executor
+
+    def _upload_with_retry(self, image_id: str, image_bytes: bytes, content_type: str) -> str:
+        path = pending_path(image_id)
+        metadata = None
+        if self._metadata_fn is not None:
+            try:
+                metadata = self._metadata_fn(image_id, image_bytes)
+            except Exception as e:
+                print(f"⚠️ Could not compute metadata for {path}: {e}")
+
+        for attempt in range(1, self._max_attempts + 1):
+            try:
+                start = time.perf_counter()
+                self._store.write(path, image_bytes, content_type=content_type, metadata=metadata)
+                observe_stage("upload", time.perf_counter() - start)
+                break
+            except Exception as e:
+                if attempt == self._max_attempts:
+                    raise
+                delay = 0.5 * (2 ** (attempt - 1))
+                print(f"⚠️ Upload of {path} failed (attempt {attempt}/{self._max_attempts}): {e} — retrying in {delay}s")
+                time.sleep(delay)
+
+        if self._on_uploaded is not None:
+            try:
+                self._on_uploaded(image_id, metadata)
+            except Exception as e:
+                print(f"⚠️ Post-upload hook failed for {path}: {e}")
+        return path
+
+    def _on_done(self, image_id: str, future: Future) -> None:
+        self._slots.release()
+        with self._lock:
+            if self._inflight.get(image_id) is future:
+                del self._inflight[image_id]
+        if future.exception() is not None:
+            print(f"❌ Giving up on pending upload {pending_path(image_id)}: {future.exception()}")
@@ -0,0 +1,108 @@
+"""
+worker_budget.py — CPU thread budgeting and memory reporting for gunicorn workers.
+
+Every gunicorn worker runs its own torch intra-op pool, and by default each pool
+sizes itself to *all* cores. With several workers on a Cloud Run instance the
+pools oversubscribe the CPUs and every forward pass slows down. gunicorn.conf.py
+calls apply_thread_budget() in each forked worker so the cores are split instead:
+
+  intra-op threads = max(1, available CPUs // workers)   (TORCH_INTRA_OP_THREADS overrides)
+  inter-op threads = 1                                   (TORCH_INTER_OP_THREADS overrides)
+
+One inter-op thread is enough: inference only ever runs on the single
+micro-batching scheduler thread (see prediction_service.py).
+
+"Available CPUs" honours the cgroup quota (cpu.max) and the affinity mask, which
+is what Cloud Run actually grants — os.cpu_count() reports the host's cores.
+
+memory_report() reads /proc/self/smaps_rollup so each worker can report how much of
+its RSS is shared copy-on-write with the master (the preloaded weights) and how
+much is private to it.
+"""
+
+import os
+from typing import Any, Dict, Optional, Tuple
+
+
+def available_cpus() -> int:
+    """CPUs this process may actually use (cgroup v2/v1 quota, then affinity, then cpu_count)."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpus = os.cpu_count() or 1
+
+    quota = None
+    try:
+        with open('/sys/fs/cgroup/cpu.max', 'r') as f:           # cgroup v2: "<quota> <period>"
+            limit, period = f.read().split()[:2]
+            if limit != 'max':
+                quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us', 'r') as f:    # cgroup v1
+                limit = int(f.read())
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us', 'r') as f:
+                period = int(f.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+
+    if quota is not None:
+        cpus = min(cpus, max(1, int(quota)))
+    return max(1, cpus)
+
+
+def thread_budget(workers: int, cpus: Optional[int] = None) -> Tuple[int, int]:
+    """(intra_op, inter_op) torch threads for one of `workers` workers."""
+    cpus  = cpus or available_cpus()
+    intra = int(os.getenv("TORCH_INTRA_OP_THREADS", "0")) or max(1, cpus // max(1, workers))
+    inter = int(os.getenv("TORCH_INTER_OP_THREADS", "0")) or 1
+    return intra, inter
+
+
+def apply_thread_budget(intra: int, inter: int) -> Dict[str, Any]:
+    """
+    Apply the budget to torch (and, through the env, to OpenMP/MKL users such as
+    ONNX Runtime and OpenVINO that initialize later). Returns what was applied.
+    """
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(intra)
+
+    applied = {"intra_op": intra, "inter_op": inter}
+    try:
+        import torch
+        torch.set_num_threads(intra)
+        try:
+            torch.set_interop_threads(inter)
+        except RuntimeError as e:
+            # Only settable before the first inter-op parallel work in this process
+            applied["inter_op"] = torch.get_num_interop_threads()
+            print(f"⚠️ Could not set torch inter-op threads ({e})")
+    except ImportError:
+        applied["torch"] = "not installed"
+    return applied
+
+
+def memory_report() -> Dict[str, float]:
+    """This process's RSS split into shared (copy-on-write with the master) and private MB."""
+    fields = {}
+    try:
+        with open('/proc/self/smaps_rollup', 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1])
+    except (OSError, ValueError):
+        return {}
+
+    def mb(*keys: str) -> float:
+        return round(sum(fields.get(k, 0) for k in keys) / 1024, 1)
+
+    return {
+        "pid":        os.getpid(),
+        "rss_mb":     mb("Rss"),
+        "pss_mb":     mb("Pss"),
+        "shared_mb":  mb("Shared_Clean", "Shared_Dirty"),
+        "private_mb": mb("Private_Clean", "Private_Dirty"),
+    }
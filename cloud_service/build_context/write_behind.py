@@ -0,0 +1,228 @@
+"""
+write_behind.py — Buffered, batched Firestore writes for feedback metadata.
+
+/feedback and /community-feedback used to wait for a Firestore add() of their
+`feedback` / `community_feedback` record — an analytics document that nothing
+on the request path reads back. Now the routes hand the document to
+FEEDBACK_LOG.add(), which only assigns its id and appends it to a buffer, and a
+background thread commits the buffer as Firestore batched writes:
+
+  - Batched: up to WRITE_BEHIND_BATCH_SIZE documents per commit (500 is
+    Firestore's limit for one batch), flushed every WRITE_BEHIND_FLUSH_S or as
+    soon as a full batch is waiting.
+  - Idempotent: every document gets its id on add() and is written with set(),
+    so a batch that is retried or replayed from the spool overwrites itself
+    instead of creating a second record.
+  - Bounded: at most WRITE_BEHIND_MAX_PENDING documents are buffered per process.
+    When the buffer is full the document is written inline on the request
+    thread instead (the old behaviour).
+  - Retried: a failed commit stays at the head of the buffer and is tried again
+    on the next flush, with exponential backoff up to WRITE_BEHIND_MAX_BACKOFF_S.
+  - Flushed on shutdown: close() flushes what's left and appends anything that
+    still can't be committed to a JSON-lines spool in WRITE_BEHIND_SPOOL_DIR.
+    Cloud Run sends SIGTERM before stopping an instance; gunicorn's worker_exit
+    hook (gunicorn.conf.py) calls close() in each worker, and an atexit handler
+    covers the servers that don't run that hook.
+  - Replayed: start() (called once the Firestore client is connected) moves
+    spool files left by earlier processes back into the buffer. The spool is
+    only as durable as the disk it's on — point WRITE_BEHIND_SPOOL_DIR at a
+    mounted volume to keep it across instances.
+"""
+
+import os
+import glob
+import json
+import time
+import uuid
+import atexit
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from service_metrics import track_call
+from storage_backends import DocumentStore, DocumentWrite
+
+WRITE_BEHIND_BATCH_SIZE    = min(500, int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500")))
+WRITE_BEHIND_FLUSH_S       = float(os.getenv("WRITE_BEHIND_FLUSH_S", "1"))
+WRITE_BEHIND_MAX_PENDING   = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+WRITE_BEHIND_MAX_BACKOFF_S = float(os.getenv("WRITE_BEHIND_MAX_BACKOFF_S", "30"))
+WRITE_BEHIND_CLOSE_S       = float(os.getenv("WRITE_BEHIND_CLOSE_S", "8"))
+WRITE_BEHIND_SPOOL_DIR     = os.getenv("WRITE_BEHIND_SPOOL_DIR", "/tmp/write-behind-spool")
+
+
+def _to_spool(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, dict):
+        return {k: _to_spool(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_spool(v) for v in value]
+    return value
+
+
+def _from_spool(value: Any) -> Any:
+    if isinstance(value, dict):
+        if set(value) == {"$datetime"}:
+            return datetime.fromisoformat(value["$datetime"])
+        return {k: _from_spool(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_from_spool(v) for v in value]
+    return value
+
+
+class WriteBehindBuffer:
+    """Buffers new documents and commits them to the document store in batches on a background thread."""
+
+    def __init__(self, docs: DocumentStore,
+                 batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval_s: float = WRITE_BEHIND_FLUSH_S,
+                 max_pending: int = WRITE_BEHIND_MAX_PENDING,
+                 spool_dir: str = WRITE_BEHIND_SPOOL_DIR):
+        self._docs             = docs
+        self._batch_size       = max(1, batch_size)
+        self._flush_interval_s = flush_interval_s
+        self._max_pending      = max(1, max_pending)
+        self._spool_dir        = spool_dir
+        self._lock             = threading.Lock()
+        self._commit_lock      = threading.Lock()
+        self._wake             = threading.Event()
+        self._buffer: List[DocumentWrite] = []
+        self._thread: Optional[threading.Thread] = None
+        self._pid              = None
+        self._closed           = False
+        self._failures         = 0
+        self.committed         = 0
+        self.spooled           = 0
+        atexit.register(self.close)
+
+    def add(self, collection: str, data: Dict[str, Any], route: str = "write-behind") -> str:
+        """Queue a new document in collection and return its id (the write happens later)."""
+        write = DocumentWrite("set", f"{collection}/{uuid.uuid4().hex}", data)
+        with self._lock:
+            buffered = not self._closed and len(self._buffer) < self._max_pending
+            if buffered:
+                self._buffer.append(write)
+                full_batch = len(self._buffer) >= self._batch_size
+        if not buffered:
+            print(f"⚠️ Write-behind buffer full or closed — writing {write.path} inline")
+            track_call("firestore", "set", route, self._docs.set, write.path, write.data)
+            return write.path.rsplit("/", 1)[1]
+        self._ensure_thread()
+        if full_batch:
+            self._wake.set()
+        return write.path.rsplit("/", 1)[1]
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._buffer)
+
+    def start(self) -> None:
+        """Load documents spooled by earlier processes and start the flush thread."""
+        replayed = 0
+        for path in sorted(glob.glob(os.path.join(self._spool_dir, "*.jsonl"))):
+            claimed = f"{path}.{os.getpid()}.replaying"
+            try:
+                os.rename(path, claimed)  # another worker may be replaying the same file
+            except OSError:
+                continue
+            try:
+                with open(claimed, "r") as f:
+                    writes = [DocumentWrite("set", entry["path"], _from_spool(entry["data"]))
+                              for entry in (json.loads(line) for line in f if line.strip())]
+            except Exception as e:
+                print(f"❌ Could not read write-behind spool {path}: {e}")
+                os.replace(claimed, path + ".bad")
+                continue
+            with self._lock:
+                self._buffer.extend(writes)
+            os.remove(claimed)
+            replayed += len(writes)
+        if replayed:
+            print(f"📥 Replaying {replayed} spooled Firestore write(s)")
+            self._wake.set()
+        self._ensure_thread()
+
+    def flush(self) -> int:
+        """Commit everything buffered now, one batch at a time. Returns the number of documents committed."""
+        committed = 0
+        with self._commit_lock:
+            while True:
+                with self._lock:
+                    batch = self._buffer[:self._batch_size]
+                if not batch:
+                    return committed
+                track_call("firestore", "commit", "write-behind", self._docs.commit, batch)
+                with self._lock:
+                    del self._buffer[:len(batch)]
+                    self.committed += len(batch)
+                committed += len(batch)
+
+    def close(self, timeout: float = WRITE_BEHIND_CLOSE_S) -> None:
+        """Flush on shutdown; whatever can't be committed within timeout goes to the spool."""
+        with self._lock:
+            if self._closed or self._pid not in (None, os.getpid()):
+                return
+            self._closed = True
+        self._wake.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        # A commit still running after timeout is spooled as well (set() makes the replay harmless)
+        if thread is None or not thread.is_alive():
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Final write-behind flush failed: {e}")
+        self._spool()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "pending":   self.pending_count(),
+            "committed": self.committed,
+            "spooled":   self.spooled,
+            "failures":  self._failures,
+        }
+
+    def _ensure_thread(self) -> None:
+        # Started lazily (and again after a fork) so the flush thread belongs to the serving process
+        with self._lock:
+            if self._closed or (self._thread is not None and self._pid == os.getpid()):
+                return
+            self._pid    = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        delay = self._flush_interval_s
+        while not self._closed:
+            self._wake.wait(delay)
+            self._wake.clear()
+            if self._closed:
+                return
+            try:
+                self.flush()
+                self._failures = 0
+                delay = self._flush_interval_s
+            except Exception as e:
+                self._failures += 1
+                delay = min(WRITE_BEHIND_MAX_BACKOFF_S, self._flush_interval_s * (2 ** self._failures))
+                print(f"⚠️ Write-behind commit failed ({self.pending_count()} pending): {e} — retrying in {delay:.1f}s")
+
+    def _spool(self) -> None:
+        with self._lock:
+            writes, self._buffer = self._buffer, []
+        if not writes:
+            return
+        path = os.path.join(self._spool_dir, f"{os.getpid()}-{time.time_ns():x}.jsonl")
+        try:
+            os.makedirs(self._spool_dir, exist_ok=True)
+            with open(path + ".part", "w") as f:
+                for write in writes:
+                    f.write(json.dumps({"path": write.path, "data": _to_spool(write.data)}, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + ".part", path)
+            self.spooled += len(writes)
+            print(f"💾 Spooled {len(writes)} unwritten Firestore document(s) to {path}")
+        except Exception as e:
+            print(f"❌ Could not spool {len(writes)} Firestore document(s): {e}")
@@ -16,11 +16,14 @@ export interface PendingImage {
   image_id: string;
   image_url: string;
   created_at: string | null;
+  duplicate_ids?: string[];
 }
 
 interface PrefetchContextType {
   pendingImages: PendingImage[] | null;
   pendingImagesLoading: boolean;
+  // Cursor for the next page of /pending-images (null when there are no more)
+  pendingImagesNextPageToken: string | null;
   userLocation: Location.LocationObject | null;
   locationLoading: boolean;
   refreshPendingImages: () => Promise<void>;
@@ -29,6 +32,7 @@ interface PrefetchContextType {
 const PrefetchContext = createContext<PrefetchContextType>({
   pendingImages: null,
   pendingImagesLoading: false,
+  pendingImagesNextPageToken: null,
   userLocation: null,
   locationLoading: false,
   refreshPendingImages: async () => {},
@@ -43,6 +47,7 @@ export const PrefetchProvider = ({ children }: { children: React.ReactNode }) =>
 
   const [pendingImages, setPendingImages] = useState<PendingImage[] | null>(null);
   const [pendingImagesLoading, setPendingImagesLoading] = useState(false);
+  const [pendingImagesNextPageToken, setPendingImagesNextPageToken] = useState<string | null>(null);
   const [userLocation, setUserLocation] = useState<Location.LocationObject | null>(null);
   const [locationLoading, setLocationLoading] = useState(false);
 
@@ -56,12 +61,15 @@ export const PrefetchProvider = ({ children }: { children: React.ReactNode }) =>
       const data = await response.json();
       if (data.success && data.pending_images) {
         setPendingImages(data.pending_images);
+        setPendingImagesNextPageToken(data.next_page_token ?? null);
       } else {
         setPendingImages([]);
+        setPendingImagesNextPageToken(null);
       }
     } catch {
       // Swallow — CommunityReviewScreen handles its own error state on fallback
       setPendingImages([]);
+      setPendingImagesNextPageToken(null);
     } finally {
       setPendingImagesLoading(false);
     }
@@ -144,7 +152,14 @@ export const PrefetchProvider = ({ children }: { children: React.ReactNode }) =>
 
   return (
     <PrefetchContext.Provider
-      value={{ pendingImages, pendingImagesLoading, userLocation, locationLoading, refreshPendingImages }}
+      value={{
+        pendingImages,
+        pendingImagesLoading,
+        pendingImagesNextPageToken,
+        userLocation,
+        locationLoading,
+        refreshPendingImages,
+      }}
     >
       {children}
     </PrefetchContext.Provider>
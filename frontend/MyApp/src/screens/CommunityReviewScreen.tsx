@@ -58,6 +58,12 @@ const getCategoryColor = (label: string) =>
 // Key used to store the timestamp of when the user last dismissed the tutorial
 const TUTORIAL_STORAGE_KEY = 'communityReview_tutorialDismissedAt';
 
+// Lease owner for claim / release / submit. Signed-out reviewers get an id of their
+// own for this app session — the API rejects a missing or shared 'anonymous' id,
+// which would let one reviewer submit images another one has claimed.
+const SESSION_REVIEWER_ID = `session-${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+const getReviewerId = () => getAuth().currentUser?.uid || SESSION_REVIEWER_ID;
+
 // ----------------------------------------------------------------------------
 // INTERFACES
 // ----------------------------------------------------------------------------
@@ -93,16 +99,20 @@ export default function CommunityReviewScreen({ navigation }: CommunityReviewPro
   const {
     pendingImages: prefetchedImages,
     pendingImagesLoading: prefetchLoading,
+    pendingImagesNextPageToken: prefetchedNextPageToken,
     refreshPendingImages,
   } = usePrefetch();
   // Prevents double-initialisation if this effect fires more than once
   const initializedRef = useRef(false);
+  // Image IDs leased to this reviewer (POST /pending-images/claim); handed back on skip / leaving the screen
+  const claimedIdsRef = useRef<Set<string>>(new Set());
 
   // --------------------------------------------------------------------------
   // STATE MANAGEMENT
   // --------------------------------------------------------------------------
   const [pendingImages, setPendingImages] = useState<PendingImage[]>([]);
   const [currentIndex, setCurrentIndex] = useState(0); // Tracks which image in the array we are viewing
+  const [nextPageToken, setNextPageToken] = useState<string | null>(null); // Cursor for the next /pending-images page
   const [loading, setLoading] = useState(true);
   const [submitting, setSubmitting] = useState(false);
   const [reviewedCount, setReviewedCount] = useState(0); // Counter for Gamification/Praise
@@ -160,10 +170,13 @@ export default function CommunityReviewScreen({ navigation }: CommunityReviewPro
     if (initializedRef.current) return;
 
     if (prefetchedImages !== null) {
-      // Prefetch completed — use the cached images immediately
+      // Prefetch completed — claim the cached images so no one else reviews them
       initializedRef.current = true;
-      setPendingImages(prefetchedImages);
-      setLoading(false);
+      setNextPageToken(prefetchedNextPageToken);
+      claimImages(prefetchedImages).then(claimed => {
+        setPendingImages(claimed);
+        setLoading(false);
+      });
       // Reset the context cache so the next visit gets fresh images
       refreshPendingImages();
     } else if (!prefetchLoading) {
@@ -174,15 +187,60 @@ export default function CommunityReviewScreen({ navigation }: CommunityReviewPro
     // If prefetchLoading is true, this effect re-runs when the context updates
   }, [prefetchedImages, prefetchLoading]);
 
+  // Hand back whatever is still leased when the reviewer leaves the screen
+  useEffect(() => {
+    return () => releaseImages([...claimedIdsRef.current]);
+  }, []);
+
+  // Leases the shown images to this reviewer. Images someone else claimed first are
+  // replaced by other available ones; on a network error the preview is used as-is.
+  const claimImages = async (images: PendingImage[]): Promise<PendingImage[]> => {
+    if (images.length === 0) return images;
+    try {
+      const response = await fetch(`${API_URL}/pending-images/claim`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          user_id: getReviewerId(),
+          count: images.length,
+          image_ids: images.map(image => image.image_id),
+        }),
+      });
+      const data = await response.json();
+      if (!data.success) return images;
+      data.pending_images.forEach((image: PendingImage) => claimedIdsRef.current.add(image.image_id));
+      return data.pending_images;
+    } catch (error) {
+      console.error("Error claiming pending images:", error);
+      return images;
+    }
+  };
+
+  // Returns leased images to the review queue (fire-and-forget)
+  const releaseImages = (imageIds: string[]) => {
+    imageIds.forEach(id => claimedIdsRef.current.delete(id));
+    if (imageIds.length === 0) return;
+    fetch(`${API_URL}/pending-images/release`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        user_id: getReviewerId(),
+        image_ids: imageIds,
+      }),
+    }).catch(() => {});
+  };
+
   const fetchPendingImages = async () => {
     try {
       setLoading(true);
       const response = await fetch(`${API_URL}/pending-images`);
       const data = await response.json();
       if (data.success && data.pending_images) {
-        setPendingImages(data.pending_images);
+        setPendingImages(await claimImages(data.pending_images));
+        setNextPageToken(data.next_page_token ?? null);
       } else {
         setPendingImages([]);
+        setNextPageToken(null);
       }
     } catch (error) {
       console.error("Error fetching pending images:", error);
@@ -192,6 +250,27 @@ export default function CommunityReviewScreen({ navigation }: CommunityReviewPro
     }
   };
 
+  // Appends the next page of pending images; resolves to false when there is none
+  const loadNextPage = async (): Promise<boolean> => {
+    if (!nextPageToken) return false;
+    try {
+      const response = await fetch(`${API_URL}/pending-images?page_token=${encodeURIComponent(nextPageToken)}`);
+      const data = await response.json();
+      if (!data.success || !data.pending_images?.length) {
+        setNextPageToken(null);
+        return false;
+      }
+      const claimed = await claimImages(data.pending_images);
+      setNextPageToken(data.next_page_token ?? null);
+      if (claimed.length === 0) return false;
+      setPendingImages(prev => [...prev, ...claimed]);
+      return true;
+    } catch (error) {
+      console.error("Error fetching more pending images:", error);
+      return false;
+    }
+  };
+
   // ─── Container layout & image size ───────────────────────────────────────
   
   // Captures the physical size of the View container holding the image
@@ -366,7 +445,7 @@ export default function CommunityReviewScreen({ navigation }: CommunityReviewPro
         body: JSON.stringify({
           image_id: currentImage.image_id,
           boxes,
-          user_id: user?.uid || 'anonymous',
+          user_id: user?.uid || SESSION_REVIEWER_ID,
         }),
       });
 
@@ -379,6 +458,7 @@ export default function CommunityReviewScreen({ navigation }: CommunityReviewPro
           text2: `Saved ${boxes.length} annotation${boxes.length > 1 ? 's' : ''}.`,
         });
         setReviewedCount(prev => prev + 1);
+        claimedIdsRef.current.delete(currentImage.image_id); // left the queue server-side
         moveToNextImage();
       } else {
         throw new Error(data.error || "Failed to submit feedback");
@@ -391,11 +471,11 @@ export default function CommunityReviewScreen({ navigation }: CommunityReviewPro
     }
   };
 
-  // Advances the carousel to the next pending image
-  const moveToNextImage = () => {
+  // Advances the carousel to the next pending image (fetching the next page at the end)
+  const moveToNextImage = async () => {
     setDrawnBoxes([]);
     setImageNaturalSize({ width: 1, height: 1 });
-    if (currentIndex < pendingImages.length - 1) {
+    if (currentIndex < pendingImages.length - 1 || await loadNextPage()) {
       setCurrentIndex(prev => prev + 1);
     } else {
       Alert.alert(
@@ -407,10 +487,12 @@ export default function CommunityReviewScreen({ navigation }: CommunityReviewPro
   };
 
   // Skips the current image without annotating it
-  const handleSkip = () => {
+  const handleSkip = async () => {
+    const skipped = pendingImages[currentIndex];
+    if (skipped) releaseImages([skipped.image_id]);
     setDrawnBoxes([]);
     setImageNaturalSize({ width: 1, height: 1 });
-    if (currentIndex < pendingImages.length - 1) {
+    if (currentIndex < pendingImages.length - 1 || await loadNextPage()) {
       setCurrentIndex(prev => prev + 1);
     } else {
       Alert.alert(
@@ -444,6 +526,7 @@ export default function CommunityReviewScreen({ navigation }: CommunityReviewPro
       });
       const data = await res.json();
       if (data.success) {
+        claimedIdsRef.current.delete(currentImage.image_id);
         Toast.show({
           type: 'info',
           text1: 'Removed',
@@ -529,7 +612,7 @@ export default function CommunityReviewScreen({ navigation }: CommunityReviewPro
         <>
           {/* Progress Indicator */}
           <View style={styles.progressContainer}>
-            <Text style={styles.progressText}>Image {currentIndex + 1} of {pendingImages.length}</Text>
+            <Text style={styles.progressText}>Image {currentIndex + 1} of {pendingImages.length}{nextPageToken ? '+' : ''}</Text>
             <Text style={styles.reviewedText}>Reviewed: {reviewedCount}</Text>
           </View>
 
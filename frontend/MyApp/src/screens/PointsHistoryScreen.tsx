@@ -1,9 +1,11 @@
 // screens/PointsHistoryScreen.tsx
 // ============================================================================
 // COMPONENT PURPOSE:
-// Displays the user's purchase history and lifetime gamification statistics.
-// It shows the total points earned, points redeemed, and a detailed list of
-// all rewards the user has purchased, including their delivery status.
+// Displays the user's points history and lifetime gamification statistics.
+// It shows the total points earned, points redeemed, and one list of every
+// points award (from the users/{uid}/points_history ledger the Cloud Run API
+// appends to when it awards feedback points) and every reward purchased,
+// including its delivery status.
 // ============================================================================
 
 import React, { useState, useCallback } from 'react';
@@ -51,15 +53,21 @@ const COLORS = {
 };
 
 // --- TYPES ---
-// Defines the structure of a purchased reward record fetched from Firestore
-interface PurchaseTransaction {
+// One row of the history list: a points award from the ledger or a purchased reward
+interface PointsTransaction {
     id: string;
-    productName: string; 
-    pointsPaid: number;  
-    purchaseDate: string; 
-    status: string; // E.g., 'PENDING_DELIVERY' or 'DELIVERED'
+    kind: 'EARNED' | 'PURCHASE';
+    description: string;
+    points: number;
+    date: string;    // ISO string, used for sorting and display
+    status?: string; // Purchases only: 'PENDING_DELIVERY' or 'DELIVERED'
 }
 
+// Ledger entries written by the API's /feedback route (source: 'feedback')
+const EARNED_DESCRIPTIONS: Record<string, string> = {
+    feedback: 'Scan feedback',
+};
+
 type PointsHistoryProps = NativeStackScreenProps<RootStackParamList, "PointsHistory">;
 
 export default function PointsHistoryScreen({ navigation }: PointsHistoryProps) {
@@ -67,7 +75,7 @@ export default function PointsHistoryScreen({ navigation }: PointsHistoryProps)
     // STATE & GLOBAL CONTEXT
     // --------------------------------------------------------------------------
     const { user, profile, refreshProfile } = useAuth();
-    const [history, setHistory] = useState<PurchaseTransaction[]>([]);
+    const [history, setHistory] = useState<PointsTransaction[]>([]);
     const [loading, setLoading] = useState(true);
     const [refreshing, setRefreshing] = useState(false);
 
@@ -81,35 +89,50 @@ export default function PointsHistoryScreen({ navigation }: PointsHistoryProps)
     // --------------------------------------------------------------------------
     // DATA FETCHING LOGIC
     // --------------------------------------------------------------------------
-    // Retrieves all purchase records for the current user from the 'purchase_history' collection
+    // Retrieves the user's points ledger (users/{uid}/points_history) and all purchase
+    // records from the 'purchase_history' collection, in parallel
     const fetchHistory = async () => {
         if (!user) return;
         
         try {
-            const q = query(
+            const purchasesQuery = query(
                 collection(db, "purchase_history"),
                 where("userId", "==", user.uid)
             );
 
-            const querySnapshot = await getDocs(q);
-            const fetchedData: PurchaseTransaction[] = [];
+            const [ledgerSnapshot, purchaseSnapshot] = await Promise.all([
+                getDocs(collection(db, "users", user.uid, "points_history")),
+                getDocs(purchasesQuery),
+            ]);
+            const fetchedData: PointsTransaction[] = [];
 
             // Parse raw Firestore documents into our typed array
-            querySnapshot.forEach((doc) => {
+            ledgerSnapshot.forEach((doc) => {
+                const data = doc.data();
+                fetchedData.push({
+                    id: doc.id,
+                    kind: 'EARNED',
+                    description: EARNED_DESCRIPTIONS[data.source] || 'Points earned',
+                    points: data.points,
+                    date: data.date,
+                });
+            });
+            purchaseSnapshot.forEach((doc) => {
                 const data = doc.data();
                 fetchedData.push({
                     id: doc.id,
-                    productName: data.productName,
-                    pointsPaid: data.pointsPaid,
-                    purchaseDate: data.purchaseDate,
+                    kind: 'PURCHASE',
+                    description: data.productName,
+                    points: data.pointsPaid,
+                    date: data.purchaseDate,
                     status: data.status || 'DELIVERED', // Default to DELIVERED if legacy data is missing the field
                 });
             });
 
             // Sort newest transactions first based on the ISO date string
             fetchedData.sort((a, b) => {
-                const dateA = new Date(a.purchaseDate).getTime();
-                const dateB = new Date(b.purchaseDate).getTime();
+                const dateA = new Date(a.date).getTime();
+                const dateB = new Date(b.date).getTime();
                 return dateB - dateA; 
             });
 
@@ -158,7 +181,29 @@ export default function PointsHistoryScreen({ navigation }: PointsHistoryProps)
     // RENDERERS
     // --------------------------------------------------------------------------
     // Sub-component that renders a single item in the FlatList
-    const renderItem = ({ item }: { item: PurchaseTransaction }) => {
+    const renderItem = ({ item }: { item: PointsTransaction }) => {
+        if (item.kind === 'EARNED') {
+            return (
+                <View style={styles.transactionRow}>
+                    {/* Left: Icon Circle */}
+                    <View style={[styles.transactionIconCircle, { backgroundColor: COLORS.lightGreenBackground }]}>
+                        <Coins size={20} color={COLORS.earnedGreen} />
+                    </View>
+
+                    {/* Middle: Details Column (Description, Date) */}
+                    <View style={styles.transactionDetails}>
+                        <Text style={styles.descriptionText}>{item.description}</Text>
+                        <Text style={styles.dateText}>{formatDate(item.date)}</Text>
+                    </View>
+
+                    {/* Right: Points Earned */}
+                    <Text style={[styles.pointsValueText, { color: COLORS.earnedGreen }]}>
+                        +{item.points}
+                    </Text>
+                </View>
+            );
+        }
+
         // Determine Status Style dynamically based on the transaction status
         const isPending = item.status === 'PENDING_DELIVERY';
         const statusLabel = isPending ? 'Pending' : 'Delivered';
@@ -175,10 +220,10 @@ export default function PointsHistoryScreen({ navigation }: PointsHistoryProps)
                 
                 {/* Middle: Details Column (Name, Date, Status) */}
                 <View style={styles.transactionDetails}>
-                    <Text style={styles.descriptionText}>{item.productName}</Text>
+                    <Text style={styles.descriptionText}>{item.description}</Text>
                     
                     <View style={styles.metaRow}>
-                        <Text style={styles.dateText}>{formatDate(item.purchaseDate)}</Text>
+                        <Text style={styles.dateText}>{formatDate(item.date)}</Text>
                         
                         {/* Status Badge */}
                         <View style={[styles.statusBadge, { backgroundColor: statusBg }]}>
@@ -192,7 +237,7 @@ export default function PointsHistoryScreen({ navigation }: PointsHistoryProps)
                 
                 {/* Right: Points Paid (Price) */}
                 <Text style={[styles.pointsValueText, { color: COLORS.redeemedOrange }]}>
-                    -{item.pointsPaid}
+                    -{item.points}
                 </Text>
             </View>
         );
@@ -251,13 +296,13 @@ export default function PointsHistoryScreen({ navigation }: PointsHistoryProps)
 
                 {/* --- 2. Transactions List --- */}
                 <View style={styles.listSection}>
-                    <Text style={styles.listTitle}>Purchase History</Text>
+                    <Text style={styles.listTitle}>Points History</Text>
                     
                     {loading ? (
                         <ActivityIndicator size="large" color={COLORS.primary} style={{ marginTop: 20 }} />
                     ) : history.length === 0 ? (
-                        // Empty state if user hasn't bought anything yet
-                        <Text style={styles.emptyText}>No rewards redeemed yet.</Text>
+                        // Empty state if user hasn't earned or bought anything yet
+                        <Text style={styles.emptyText}>No points activity yet.</Text>
                     ) : (
                         // Render the array of transaction records
                         <FlatList
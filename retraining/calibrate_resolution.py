@@ -0,0 +1,225 @@
+"""
+Calibrate the inference resolution tiers against the trained_data/ archive
+
+The serving container picks the YOLO input size per request from a latency
+budget (cloud_service/build_context/resolution_policy.py). This script measures
+the accuracy-vs-latency curve of a set of weights so the tiers are chosen from
+data instead of guessed:
+
+  - downloads labelled images archived under gs://retrain_smart_waste_model/trained_data/{ts}/
+  - for every candidate imgsz runs YOLO validation (mAP50, mAP50-95) and times
+    single-image CPU prediction (median and p95 milliseconds)
+  - keeps the tiers whose mAP50-95 is within --max-map-drop of the best tier and
+    prints a suggested "inference_policy" block for shared/model_meta.json
+
+Storage structure read:
+    gs://retrain_smart_waste_model/
+    └── trained_data/{timestamp}/images/{uuid}.jpg + labels/{uuid}.txt
+
+Usage:
+    python calibrate_resolution.py --weights ../cloud_service/build_context/weights/best.pt \
+        [--tiers 256,320,416,480,640] [--max-samples 500] [--write-meta]
+"""
+
+import os
+import json
+import time
+import argparse
+import statistics
+from pathlib import Path
+from datetime import datetime
+
+from firebase_admin import storage
+from ultralytics import YOLO
+
+# Sibling scripts: the same Firebase setup and class map parsing as the retraining run
+from download_feedback_data import initialize_firebase
+from retrain_model import load_class_names
+
+SHARED_DIR = Path(__file__).resolve().parent.parent / "shared"
+
+
+def download_archive(bucket_name: str, output_dir: Path, max_samples: int = None) -> int:
+    """
+    Download archived image+label pairs from trained_data/ into output_dir/images|labels/val.
+    Already-downloaded files are reused. Returns the number of pairs available.
+    """
+    bucket = storage.bucket(bucket_name)
+    images_dir = output_dir / "images" / "val"
+    labels_dir = output_dir / "labels" / "val"
+    images_dir.mkdir(parents=True, exist_ok=True)
+    labels_dir.mkdir(parents=True, exist_ok=True)
+
+    print("Listing trained_data/ archive...")
+    blobs = list(bucket.list_blobs(prefix="trained_data/"))
+    images = {Path(b.name).stem: b for b in blobs if "/images/" in b.name and b.name.endswith('.jpg')}
+    labels = [(Path(b.name).stem, b) for b in blobs if "/labels/" in b.name and b.name.endswith('.txt')]
+    print(f"Found {len(images)} images, {len(labels)} labels")
+
+    downloaded = 0
+    for image_id, label_blob in labels:
+        if max_samples and downloaded >= max_samples:
+            break
+        if image_id not in images:
+            continue
+
+        local_image = images_dir / f"{image_id}.jpg"
+        local_label = labels_dir / f"{image_id}.txt"
+        try:
+            if not local_image.exists():
+                images[image_id].download_to_filename(str(local_image))
+            if not local_label.exists():
+                label_blob.download_to_filename(str(local_label))
+            downloaded += 1
+            if downloaded % 100 == 0:
+                print(f"  Downloaded {downloaded} samples...")
+        except Exception as e:
+            print(f"  Error downloading {image_id}: {e}")
+
+    print(f"Archive ready: {downloaded} samples")
+    return downloaded
+
+
+def create_dataset_yaml(dataset_dir: Path, names: dict) -> Path:
+    """Validation-only YOLO dataset config for the downloaded archive."""
+    yaml_path = dataset_dir / "calibration.yaml"
+    lines = [
+        "# Auto-generated by calibrate_resolution.py",
+        f"path: {dataset_dir.absolute()}",
+        "train: images/val",
+        "val: images/val",
+        "",
+        f"nc: {len(names)}",
+        "",
+        "names:",
+    ] + [f"  {i}: {names[i]}" for i in sorted(names)]
+    yaml_path.write_text("\n".join(lines) + "\n")
+    return yaml_path
+
+
+def time_predictions(model, image_paths: list, imgsz: int, runs: int) -> dict:
+    """Median / p95 milliseconds per single-image CPU prediction at imgsz."""
+    # Warm up this input size first (graph and buffer allocation)
+    model.predict(str(image_paths[0]), imgsz=imgsz, device="cpu", verbose=False)
+
+    samples = []
+    for path in image_paths[:runs]:
+        start = time.perf_counter()
+        model.predict(str(path), imgsz=imgsz, device="cpu", verbose=False)
+        samples.append(1000.0 * (time.perf_counter() - start))
+
+    samples.sort()
+    return {
+        "median_ms": round(statistics.median(samples), 2),
+        "p95_ms":    round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 2),
+    }
+
+
+def calibrate(weights: str, dataset_yaml: Path, image_paths: list, tiers: list, timing_runs: int) -> list:
+    """Accuracy and latency of the weights at each tier."""
+    model = YOLO(weights)
+    curve = []
+    for imgsz in tiers:
+        print(f"\nCalibrating imgsz={imgsz}...")
+        metrics = model.val(data=str(dataset_yaml), imgsz=imgsz, device="cpu", plots=False, verbose=False)
+        timing = time_predictions(model, image_paths, imgsz, timing_runs)
+        point = {
+            "imgsz":    imgsz,
+            "map50":    round(float(metrics.box.map50), 4),
+            "map50_95": round(float(metrics.box.map), 4),
+            **timing,
+        }
+        print(f"  mAP50={point['map50']}  mAP50-95={point['map50_95']}  "
+              f"median={point['median_ms']}ms  p95={point['p95_ms']}ms")
+        curve.append(point)
+    return curve
+
+
+def suggest_policy(curve: list, max_map_drop: float, latency_budget_ms: float) -> dict:
+    """Keep the tiers whose mAP50-95 is within max_map_drop of the best one."""
+    best = max(point["map50_95"] for point in curve)
+    kept = [point for point in curve if best - point["map50_95"] <= max_map_drop]
+    return {
+        "tiers":             [point["imgsz"] for point in kept],
+        "latency_budget_ms": latency_budget_ms,
+        "tier_latency_ms":   {str(point["imgsz"]): point["median_ms"] for point in kept},
+    }
+
+
+def write_meta(policy: dict) -> None:
+    """Replace the inference_policy block in shared/model_meta.json."""
+    meta_path = SHARED_DIR / "model_meta.json"
+    with open(meta_path, "r") as f:
+        meta = json.load(f)
+    meta["inference_policy"] = policy
+    with open(meta_path, "w") as f:
+        json.dump(meta, f, indent=2)
+        f.write("\n")
+    print(f"Updated {meta_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure accuracy vs latency per inference resolution")
+    parser.add_argument("--weights", type=str, default="../cloud_service/build_context/weights/best.pt",
+                        help="YOLO weights to calibrate")
+    parser.add_argument("--tiers", type=str, default="256,320,416,480,544,640",
+                        help="Comma-separated candidate input sizes (multiples of 32)")
+    parser.add_argument("--dataset-dir", type=str, default="./calibration_dataset",
+                        help="Where the trained_data/ archive is downloaded")
+    parser.add_argument("--max-samples", type=int, default=500,
+                        help="Maximum archived samples to evaluate on")
+    parser.add_argument("--timing-runs", type=int, default=50,
+                        help="Images timed per tier")
+    parser.add_argument("--max-map-drop", type=float, default=0.02,
+                        help="Largest mAP50-95 loss vs the best tier a suggested tier may have")
+    parser.add_argument("--latency-budget-ms", type=float, default=400,
+                        help="latency_budget_ms written into the suggested policy")
+    parser.add_argument("--credentials", type=str, default="../cloud_service/serviceAccountKey.json",
+                        help="Path to Firebase service account JSON")
+    parser.add_argument("--bucket", type=str, default="retrain_smart_waste_model",
+                        help="Firebase Storage bucket name")
+    parser.add_argument("--skip-download", action="store_true",
+                        help="Use the samples already in --dataset-dir")
+    parser.add_argument("--output", type=str, default="./resolution_calibration.json",
+                        help="Where the curve and the suggested policy are written")
+    parser.add_argument("--write-meta", action="store_true",
+                        help="Write the suggested policy into shared/model_meta.json")
+
+    args = parser.parse_args()
+
+    dataset_dir = Path(args.dataset_dir)
+    if not args.skip_download:
+        print("Initializing Firebase...")
+        initialize_firebase(credentials_path=args.credentials)
+        download_archive(args.bucket, dataset_dir, args.max_samples)
+
+    image_paths = sorted((dataset_dir / "images" / "val").glob("*.jpg"))
+    if not image_paths:
+        print("No archived samples to calibrate on.")
+        return
+
+    tiers = sorted({int(t) for t in args.tiers.split(",") if t.strip()})
+    dataset_yaml = create_dataset_yaml(dataset_dir, load_class_names(str(SHARED_DIR / "class_map.json")))
+    curve = calibrate(args.weights, dataset_yaml, image_paths, tiers, args.timing_runs)
+    policy = suggest_policy(curve, args.max_map_drop, args.latency_budget_ms)
+
+    report = {
+        "calibrated_at": datetime.utcnow().isoformat(),
+        "weights":       os.path.abspath(args.weights),
+        "samples":       len(image_paths),
+        "curve":         curve,
+        "inference_policy": policy,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\nCalibration saved to: {args.output}")
+    print("Suggested model_meta.json block:")
+    print(json.dumps({"inference_policy": policy}, indent=2))
+
+    if args.write_meta:
+        write_meta(policy)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,8 +12,10 @@ Function 1 — retrain_orchestrator
 
 Function 2 — retrain_deployer
   Trigger : models/training_status.json written (Kaggle notebook writes this when training finishes)
-  Action  : read the result → if improved == true, force a new Cloud Run revision of waste-classifier-eu
-            the new revision downloads models/best_latest.pt from GCS at startup (fresh weights)
+  Action  : read the result → if improved == true, tell waste-classifier-eu to hot-reload
+            models/best_latest.pt (POST /admin/reload-model) when MODEL_RELOAD_URL is set;
+            otherwise (or if that call fails) force a new Cloud Run revision, which
+            downloads the fresh weights at startup
   No-op   : if not improved, keeps current production model unchanged
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
@@ -24,8 +26,9 @@ Full pipeline end-to-end:
         → (once >= 1000) pushes kaggle_retrain_notebook.ipynb to Kaggle
           → Kaggle trains on P100 GPU, uploads best_latest.pt, writes training_status.json
             → retrain_deployer fires, reads status
-              → (if improved) updates waste-classifier-eu env var → new revision starts
-                → new container downloads best_latest.pt from GCS → serving updated model
+              → (if improved) asks waste-classifier-eu to hot-reload best_latest.pt
+                → running instances swap to the new weights (others pick it up on their next poll)
+                  fallback: update a waste-classifier-eu env var → new revision downloads the weights
 
 GCS bucket: retrain_smart_waste_model
   training_data/images/   — feedback images
@@ -39,9 +42,12 @@ Environment variables (set via deploy.ps1):
   KAGGLE_USERNAME        Kaggle account username
   KAGGLE_KERNEL_SLUG     Full notebook slug: "omriasidon/retrainning-waste-classification-model"
   GCP_PROJECT            GCP project ID: "smart-waste-sorter"
+  MODEL_RELOAD_URL       Optional: https://<waste-classifier-eu URL>/admin/reload-model
+                         (append ?role=candidate to shadow the new model before promoting it)
 
 Secrets (injected from Secret Manager via deploy.ps1):
   KAGGLE_KEY             Kaggle API key
+  ADMIN_TOKEN            Optional: same value as waste-classifier-eu's ADMIN_TOKEN (needed with MODEL_RELOAD_URL)
 """
 
 import os
@@ -57,6 +63,18 @@ from google.cloud.run_v2 import ServicesClient, UpdateServiceRequest
 BUCKET_NAME = "retrain_smart_waste_model"
 MIN_SAMPLES = 1000  # Minimum valid image+label pairs required before triggering a retrain
 
+# One storage client per function instance, reused across invocations (warm
+# instances keep its HTTP connections open instead of re-authenticating each time)
+_gcs_bucket = None
+
+
+def _bucket():
+    global _gcs_bucket
+    if _gcs_bucket is None:
+        _gcs_bucket = storage.Client().bucket(BUCKET_NAME)
+    return _gcs_bucket
+
+
 # ── Logging helpers ───────────────────────────────────────────────────────────
 # Using print() instead of logging module — Cloud Run captures stdout reliably,
 # while the logging module sometimes fails to surface in Cloud Logging.
@@ -106,6 +124,8 @@ def push_kaggle_notebook(kernel_slug: str, username: str, api_key: str, bucket)
     # Read the notebook stored in GCS — this is the source of truth for the notebook.
     # To update the notebook logic, upload a new version to GCS:
     #   gsutil cp kaggle_retrain_notebook.ipynb gs://retrain_smart_waste_model/notebook/
+    # The notebook reads its class names from shared/class_map.json uploaded next to it:
+    #   gsutil cp ../shared/class_map.json gs://retrain_smart_waste_model/notebook/
     notebook_blob = bucket.blob("notebook/kaggle_retrain_notebook.ipynb")
     if not notebook_blob.exists():
         return False, "Notebook not found in GCS at notebook/kaggle_retrain_notebook.ipynb"
@@ -217,6 +237,30 @@ def redeploy_cloud_run(project: str, region: str = "europe-west1", service: str
         return False
 
 
+# ── Helper: hot-reload the serving model ──────────────────────────────────────
+# Asks the running waste-classifier-eu instance to load best_latest.pt and swap it
+# in without a restart. The instance that receives the call reloads immediately;
+# every other instance notices the new GCS generation on its next poll
+# (MODEL_POLL_INTERVAL_S in model_reloader.py), so no cold starts are needed.
+def hot_reload_cloud_run(reload_url: str, admin_token: str) -> bool:
+    try:
+        import urllib.request
+
+        req = urllib.request.Request(
+            f"{reload_url}{'&' if '?' in reload_url else '?'}wait=1",
+            data=b"",
+            method="POST",
+            headers={'X-Admin-Token': admin_token},
+        )
+        with urllib.request.urlopen(req, timeout=90) as resp:
+            result = json.loads(resp.read().decode('utf-8'))
+        log_info(f"Hot reload response: {result}")
+        return True
+    except Exception as e:
+        log_error(f"Hot reload failed: {e}")
+        return False
+
+
 # ── Function 1: trigger training when new feedback data lands ─────────────────
 @functions_framework.cloud_event
 def retrain_orchestrator(cloud_event):
@@ -248,8 +292,7 @@ def retrain_orchestrator(cloud_event):
         log_error("Missing Kaggle env vars — check deploy.ps1 configuration")
         return
 
-    gcs = storage.Client()
-    bucket = gcs.bucket(BUCKET_NAME)
+    bucket = _bucket()
 
     # Count how many complete image+label pairs exist in the bucket
     valid_pairs = count_valid_training_pairs(bucket)
@@ -300,8 +343,9 @@ def retrain_deployer(cloud_event):
     Fires on every GCS object finalization in the bucket.
     Only proceeds if the file is models/training_status.json — written by the
     Kaggle notebook when training completes (success or failure).
-    If improved == true, forces a new Cloud Run revision of waste-classifier-eu
-    which downloads the fresh weights from GCS on startup.
+    If improved == true, hot-reloads waste-classifier-eu (MODEL_RELOAD_URL) or, if that
+    isn't configured or fails, forces a new Cloud Run revision which downloads the
+    fresh weights from GCS on startup.
     """
     data = cloud_event.data
     object_name = data.get("name", "")
@@ -317,8 +361,7 @@ def retrain_deployer(cloud_event):
         log_error("Missing GCP_PROJECT env var — check deploy.ps1 configuration")
         return
 
-    gcs = storage.Client()
-    bucket = gcs.bucket(BUCKET_NAME)
+    bucket = _bucket()
     blob = bucket.blob("models/training_status.json")
 
     if not blob.exists():
@@ -357,10 +400,15 @@ def retrain_deployer(cloud_event):
         )
         return
 
-    # New model is better — trigger a rolling redeploy of waste-classifier-eu
-    # The new revision will download models/best_latest.pt from GCS at startup
+    # New model is better — hot-reload waste-classifier-eu if configured
     log_info(
         f"Model improved! new_map50={status.get('new_map50', 0):.4f} vs "
-        f"baseline={status.get('baseline_map50', 0):.4f} — triggering Cloud Run redeploy."
+        f"baseline={status.get('baseline_map50', 0):.4f} — rolling out models/best_latest.pt."
     )
+    reload_url = _clean(os.environ.get("MODEL_RELOAD_URL", ""))
+    admin_token = _clean(os.environ.get("ADMIN_TOKEN", ""))
+    if reload_url and admin_token and hot_reload_cloud_run(reload_url, admin_token):
+        return
+
+    # Fallback: rolling redeploy — the new revision downloads best_latest.pt at startup
     redeploy_cloud_run(gcp_project)
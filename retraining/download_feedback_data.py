@@ -15,6 +15,10 @@ Usage:
 For Kaggle:
     Upload your serviceAccountKey.json as a Kaggle secret named 'FIREBASE_CREDENTIALS'
     The Firebase Admin SDK provides access to GCS buckets via the service account.
+
+This script talks to GCS through firebase_admin directly rather than through
+cloud_service/build_context/storage_backends.py: it runs standalone on Kaggle,
+where only retraining/ is available.
 """
 
 import os
@@ -24,7 +28,7 @@ from pathlib import Path
 from datetime import datetime
 
 import firebase_admin
-from firebase_admin import credentials, storage, firestore
+from firebase_admin import credentials, storage
 
 
 def initialize_firebase(credentials_path: str = None, credentials_json: dict = None):
@@ -116,6 +120,9 @@ def download_training_data(
     downloaded = 0
     skipped = 0
     errors = []
+    # image_id → /predict trace_id (kept in the image's GCS metadata), so a trained
+    # sample can be traced back to the request that uploaded it
+    samples = {}
 
     for label_path, label_blob in label_files:
         if max_samples and downloaded >= max_samples:
@@ -139,6 +146,7 @@ def download_training_data(
             local_label_path = labels_dir / f"{image_id}.txt"
             label_blob.download_to_filename(str(local_label_path))
 
+            samples[image_id] = (image_blobs[image_path].metadata or {}).get("trace_id")
             downloaded += 1
             if downloaded % 100 == 0:
                 print(f"  Downloaded {downloaded} samples...")
@@ -157,6 +165,7 @@ def download_training_data(
         "downloaded": downloaded,
         "skipped": skipped,
         "errors": errors,
+        "samples": samples,
         "output_dir": str(output_dir)
     }
 
@@ -255,7 +264,9 @@ def main():
             "downloaded_at": datetime.utcnow().isoformat(),
             "total_samples": result["downloaded"],
             "val_ratio": args.val_ratio,
-            "bucket": args.bucket
+            "bucket": args.bucket,
+            "image_ids": sorted(result["samples"]),
+            "trace_ids": {k: v for k, v in result["samples"].items() if v}
         }
         with open(output_dir / "metadata.json", "w") as f:
             json.dump(metadata, f, indent=2)
@@ -18,11 +18,39 @@ import os
 import json
 import argparse
 import shutil
+import importlib.util
 from pathlib import Path
 from datetime import datetime
 
 from ultralytics import YOLO
 
+# Class names come from shared/class_map.json — the same file the Cloud Run API
+# writes feedback labels with. It is parsed and checked by the API's own parser,
+# build_context/shared_config.py (stdlib only), loaded from its file so the two
+# can't drift and nothing is added to sys.path.
+REPO_DIR           = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_CLASS_MAP  = os.path.join(REPO_DIR, 'shared', 'class_map.json')
+SHARED_CONFIG_PATH = os.path.join(REPO_DIR, 'cloud_service', 'build_context', 'shared_config.py')
+
+
+def _load_shared_config():
+    if not os.path.isfile(SHARED_CONFIG_PATH):
+        raise ImportError(f"shared_config.py not found at {SHARED_CONFIG_PATH} — run from a repo checkout")
+    spec = importlib.util.spec_from_file_location("shared_config", SHARED_CONFIG_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+shared_config = _load_shared_config()
+
+
+def load_class_names(class_map_path: str = DEFAULT_CLASS_MAP) -> dict:
+    """{0: "glass", ...} from class_map.json. Raises ValueError if its two tables disagree."""
+    with open(class_map_path, 'r', encoding='utf-8') as f:
+        index_to_name, _ = shared_config.parse_class_map(json.load(f))
+    return index_to_name
+
 
 def validate_dataset(dataset_path: Path) -> dict:
     """Validate that the dataset structure is correct for YOLO training."""
@@ -56,7 +84,7 @@ def validate_dataset(dataset_path: Path) -> dict:
     }
 
 
-def create_dataset_yaml(dataset_path: Path, output_path: Path = None) -> Path:
+def create_dataset_yaml(dataset_path: Path, class_names: dict, output_path: Path = None) -> Path:
     """Create a YOLO dataset.yaml file for the feedback dataset."""
     if output_path is None:
         output_path = dataset_path / "dataset.yaml"
@@ -65,19 +93,13 @@ def create_dataset_yaml(dataset_path: Path, output_path: Path = None) -> Path:
         "path": str(dataset_path.absolute()),
         "train": "images/train",
         "val": "images/val" if (dataset_path / "images" / "val").exists() else "images/train",
-        "nc": 6,
-        "names": {
-            0: "glass",
-            1: "paper",
-            2: "cardboard",
-            3: "plastic",
-            4: "metal",
-            5: "trash"
-        }
+        "nc": len(class_names),
+        "names": dict(sorted(class_names.items()))
     }
 
     # Write as YAML
-    yaml_content = f"""# Auto-generated dataset config
+    names_yaml = "\n".join(f"  {index}: {name}" for index, name in config['names'].items())
+    yaml_content = f"""# Auto-generated dataset config (names from class_map.json)
 path: {config['path']}
 train: {config['train']}
 val: {config['val']}
@@ -85,12 +107,7 @@ val: {config['val']}
 nc: {config['nc']}
 
 names:
-  0: glass
-  1: paper
-  2: cardboard
-  3: plastic
-  4: metal
-  5: trash
+{names_yaml}
 """
     with open(output_path, 'w') as f:
         f.write(yaml_content)
@@ -108,7 +125,8 @@ def fine_tune_model(
     img_size: int = 640,
     learning_rate: float = 0.001,  # Lower LR for fine-tuning
     freeze_layers: int = 10,  # Freeze early layers to preserve features
-    device: str = "auto"
+    device: str = "auto",
+    class_names: dict = None
 ) -> dict:
     """
     Fine-tune the YOLO model on feedback data.
@@ -123,6 +141,7 @@ def fine_tune_model(
         learning_rate: Initial learning rate (lower for fine-tuning)
         freeze_layers: Number of layers to freeze (preserves learned features)
         device: 'auto', 'cpu', '0' (GPU 0), etc.
+        class_names: class map the labels were written with, checked against the base model
 
     Returns:
         dict with training results and paths to new weights
@@ -141,6 +160,14 @@ def fine_tune_model(
     # Load the pre-trained model
     model = YOLO(str(base_weights))
 
+    # Fine-tuning keeps the base model's head — its classes must be the class map's
+    if class_names:
+        mismatches = shared_config.model_name_mismatches(class_names, model.names)
+        if mismatches:
+            print("Warning: base model names differ from class_map.json:")
+            for mismatch in mismatches:
+                print(f"  - {mismatch}")
+
     # Start fine-tuning
     # Key settings for fine-tuning:
     # - Lower lr0 (initial LR) to avoid destroying learned features
@@ -229,6 +256,8 @@ def main():
                         help="Minimum training samples required (default: 1000)")
     parser.add_argument("--skip-threshold", action="store_true",
                         help="Skip minimum sample count check (for local testing)")
+    parser.add_argument("--class-map", type=str, default=DEFAULT_CLASS_MAP,
+                        help="Path to shared/class_map.json")
 
     args = parser.parse_args()
 
@@ -268,7 +297,8 @@ def main():
         print(f"\nWarning: Only {total_samples} samples (threshold bypassed with --skip-threshold).")
 
     # Create dataset.yaml
-    dataset_yaml = create_dataset_yaml(dataset_path)
+    class_names = load_class_names(args.class_map)
+    dataset_yaml = create_dataset_yaml(dataset_path, class_names)
 
     # Create output directory
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -283,7 +313,8 @@ def main():
         img_size=args.img_size,
         learning_rate=args.lr,
         freeze_layers=args.freeze,
-        device=args.device
+        device=args.device,
+        class_names=class_names
     )
 
     print("Training complete!")